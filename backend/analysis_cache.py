@@ -0,0 +1,97 @@
+"""Cache of document analysis results keyed by document content.
+
+Users often upload the same template (a standard NDA, a lease) many times.
+Results are keyed by the upload's SHA-256, the analyzer version and the
+providers/models that would run the analysis, so an identical file is only
+analyzed once per configuration. Entries are evicted least recently used
+first beyond ``max_entries`` and, with a persistence backend, survive
+restarts.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def make_analysis_key(content_hash: str, analyzer_version: str, providers: Iterable[str]) -> str:
+    """Cache key for ``content_hash`` analyzed by ``analyzer_version`` with ``provider:model``s"""
+    return f"{content_hash}|{analyzer_version}|{','.join(sorted(providers))}"
+
+
+class AnalysisCache:
+    """Bounded LRU map of cache key to analysis result, optionally backed by SQLite"""
+
+    def __init__(self, max_entries: int = 1000, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._loaded = backend is None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.avoided_calls = 0
+        self.avoided_tokens = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for cache_key, result, _ in self.backend.load_analyses(self.max_entries):
+                self._entries[cache_key] = result
+            self.backend.prune_analyses(self.max_entries)
+            self._loaded = True
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            result = self._entries.get(cache_key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            # Each hit saves the provider calls the original analysis made
+            self.avoided_calls += result.get('provider_calls', 0)
+            self.avoided_tokens += result.get('estimated_tokens', 0)
+        if self.backend is not None:
+            self.backend.touch_analysis(cache_key, time.time())
+        return result
+
+    def set(self, cache_key: str, result: Dict[str, Any]):
+        self._ensure_loaded()
+        evicted = []
+        with self._lock:
+            self._entries[cache_key] = result
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += len(evicted)
+        if self.backend is not None:
+            self.backend.save_analysis(cache_key, result, time.time())
+            for old_key in evicted:
+                self.backend.delete_analysis(old_key)
+
+    def record_bypass(self):
+        """Count a lookup skipped because the caller forced a fresh analysis"""
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'avoidedProviderCalls': self.avoided_calls,
+                'avoidedTokens': self.avoided_tokens
+            }
@@ -0,0 +1,104 @@
+"""Benchmark BM25 retrieval over a synthetic corpus of legal-style documents.
+
+Usage:
+    python benchmarks/bench_search_index.py --documents 5000 --queries 500
+
+Reports index build time, approximate postings size and query latency
+percentiles. Retrieval for chat should stay in the low milliseconds.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from search_index import BM25Index  # noqa: E402
+
+# Frequent legal vocabulary plus a long tail of rarer terms, roughly Zipf distributed
+COMMON_WORDS = (
+    "agreement party parties shall term termination notice payment confidential information "
+    "obligation liability indemnify warranty breach clause contract employee employer lease "
+    "tenant landlord property license governing law dispute arbitration damages effective date "
+    "renewal assignment consent"
+).split()
+
+
+def build_vocabulary(size: int, rng: random.Random):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    rare = {''.join(rng.choice(letters) for _ in range(rng.randint(5, 10))) for _ in range(size)}
+    vocabulary = COMMON_WORDS + sorted(rare)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    return vocabulary, weights
+
+
+def make_document(rng: random.Random, vocabulary, weights, clauses: int,
+                  words_per_clause: int) -> str:
+    parts = []
+    for number in range(1, clauses + 1):
+        words = rng.choices(vocabulary, weights, k=words_per_clause)
+        parts.append(f"{number}. {' '.join(words).capitalize()}.")
+    return '\n\n'.join(parts)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark BM25 passage retrieval')
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--clauses', type=int, default=12, help='Clauses per document')
+    parser.add_argument('--words', type=int, default=60, help='Words per clause')
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary, weights = build_vocabulary(args.vocabulary, rng)
+    index = BM25Index()
+
+    documents = [make_document(rng, vocabulary, weights, args.clauses, args.words)
+                 for _ in range(args.documents)]
+    started = time.perf_counter()
+    for number, text in enumerate(documents):
+        index.add_document(f"doc-{number}", f"Document {number}", text)
+    build_seconds = time.perf_counter() - started
+
+    postings_bytes = sum(ids.itemsize * len(ids) + tfs.itemsize * len(tfs)
+                         for ids, tfs in index._postings.values())
+    stats = index.stats()
+    print(f"Indexed {stats['documents']} documents / {stats['passages']} passages / "
+          f"{stats['terms']} terms in {build_seconds:.2f}s; "
+          f"postings {postings_bytes / 1024 / 1024:.1f} MB")
+
+    queries = [
+        ' '.join(rng.choices(COMMON_WORDS, k=2)
+                 + rng.choices(vocabulary, weights, k=rng.randint(1, 4)))
+        for _ in range(args.queries)
+    ]
+    # The first query for a term builds its champion list; warm them so the percentiles
+    # show steady state
+    cold_started = time.perf_counter()
+    for query in queries:
+        index.search(query, args.top_k)
+    cold_seconds = time.perf_counter() - cold_started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, args.top_k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"{len(queries)} queries: p50 {percentile(latencies, 50):.2f} ms, "
+          f"p95 {percentile(latencies, 95):.2f} ms, p99 {percentile(latencies, 99):.2f} ms, "
+          f"max {max(latencies):.2f} ms (first pass incl. champion lists: {cold_seconds:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
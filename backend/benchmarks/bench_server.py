@@ -0,0 +1,420 @@
+"""Load-test the HTTP server against a local mock of the LLM provider APIs.
+
+Usage:
+    python benchmarks/bench_server.py --concurrency 1,8,32 --duration 20 --output results.json
+    python benchmarks/bench_server.py --latency-ms 1500 --error-rate 0.05 --mix chat=1,chat_stream=1
+
+Starts ``benchmarks/mock_llm.py`` in-process and ``fixed_server.py`` as a
+subprocess wired to it (fresh SQLite database and upload directory, response
+cache off unless ``--response-cache``). Then, for each concurrency level,
+it runs that many closed-loop clients over a weighted mix of operations:
+chat, streamed chat, history, document list, upload, analyze and dashboard
+polling. Pass ``--server-url`` to benchmark an already running server instead.
+
+Writes one JSON document with throughput and p50/p95/p99 latency per level
+and per operation (plus time to first byte for streamed chat), together with
+the commit and settings, so runs of different builds can be diffed.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm import add_behaviour_arguments, behaviour_from_args, start_mock_server  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_MIX = 'chat=35,chat_stream=10,history=15,documents=10,upload=5,analyze=5,dashboard=20'
+
+QUESTIONS = (
+    "What notice period applies if my employer terminates my contract?",
+    "Can my landlord keep the deposit for normal wear and tear?",
+    "Is a non-compete clause enforceable after I resign?",
+    "What should a confidentiality agreement with a contractor include?",
+    "How do I dispute a parking fine issued on private land?",
+)
+
+CLAUSES = (
+    "The Tenant shall pay the rent monthly in advance on the first day of each month.",
+    "Either party may terminate this Agreement by giving thirty days written notice.",
+    "The Employee shall not disclose Confidential Information during or after employment.",
+    "This Agreement is governed by the laws of the jurisdiction where the Property is located.",
+    "Any dispute shall first be referred to mediation before arbitration is commenced.",
+)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    return {
+        'p50': round(percentile(latencies, 50), 2),
+        'p95': round(percentile(latencies, 95), 2),
+        'p99': round(percentile(latencies, 99), 2),
+        'max': round(max(latencies), 2),
+        'mean': round(sum(latencies) / len(latencies), 2)
+    }
+
+
+class Client:
+    """One keep-alive connection to the server, reopened whenever the server closes it"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host, self.port, self.timeout = host, port, timeout
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None,
+                on_first_byte: Optional[Callable[[], None]] = None) -> Tuple[int, bytes]:
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(self.host, self.port,
+                                                          timeout=self.timeout)
+        try:
+            self._connection.request(method, path, body=body, headers=headers or {})
+            response = self._connection.getresponse()
+            if on_first_byte is not None:
+                first = response.read(1)
+                on_first_byte()
+                data = first + response.read()
+            else:
+                data = response.read()
+        except Exception:
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response.status, data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class Workload:
+    """The operations of the mix; each returns the HTTP status and, for streams, first-byte time"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.document_ids: List[str] = []
+        self._lock = threading.Lock()
+
+    def _json(self, client: Client, method: str, path: str, body: Optional[Dict[str, Any]] = None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        return client.request(method, path, data, headers)
+
+    def chat(self, client: Client):
+        body = {'content': self.rng.choice(QUESTIONS)}
+        status, _ = self._json(client, 'POST', '/api/chat/send', body)
+        return status, None
+
+    def chat_stream(self, client: Client):
+        started = time.perf_counter()
+        first_byte = []
+        body = json.dumps({'content': self.rng.choice(QUESTIONS)}).encode('utf-8')
+        status, _ = client.request(
+            'POST', '/api/chat/stream', body, {'Content-Type': 'application/json'},
+            on_first_byte=lambda: first_byte.append(time.perf_counter() - started)
+        )
+        return status, first_byte[0] if first_byte else None
+
+    def history(self, client: Client):
+        return client.request('GET', '/api/chat/history?limit=50')[0], None
+
+    def documents(self, client: Client):
+        return client.request('GET', '/api/documents/list?limit=20')[0], None
+
+    def dashboard(self, client: Client):
+        return client.request('GET', '/api/dashboard/stats')[0], None
+
+    def upload(self, client: Client):
+        boundary = uuid.uuid4().hex
+        # A unique line keeps every upload distinct, so analyses are not all answered from the cache
+        text = '\n\n'.join(self.rng.sample(CLAUSES, 3) + [f"Reference {uuid.uuid4().hex}."])
+        body = (
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="title"\r\n\r\nBenchmark agreement\r\n'
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="file"; filename="agreement.txt"\r\n'
+            f'Content-Type: text/plain\r\n\r\n{text}\r\n--{boundary}--\r\n'
+        ).encode('utf-8')
+        status, data = client.request('POST', '/api/documents/upload', body,
+                                      {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        if status == 201:
+            with self._lock:
+                self.document_ids.append(json.loads(data)['id'])
+        return status, None
+
+    def analyze(self, client: Client):
+        with self._lock:
+            document_id = self.rng.choice(self.document_ids) if self.document_ids else None
+        if document_id is None:
+            return self.upload(client)
+        return self._json(client, 'POST', f'/api/documents/{document_id}/analyze', {})[0], None
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Workload, name) or name.startswith('_'):
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def run_level(host: str, port: int, workload: Workload, mix: List[Tuple[str, float]],
+              concurrency: int, duration: float, warmup: float,
+              timeout: float) -> Dict[str, Any]:
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    results: Dict[str, Dict[str, list]] = {
+        name: {'latencies': [], 'ttfb': [], 'statuses': []} for name in names
+    }
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        client = Client(host, port, timeout)
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                break
+            name = rng.choices(names, weights)[0]
+            try:
+                status, first_byte = getattr(workload, name)(client)
+            except Exception as e:
+                status, first_byte = type(e).__name__, None
+            finished = time.perf_counter()
+            if started < measure_from:
+                continue
+            with lock:
+                bucket = results[name]
+                bucket['latencies'].append((finished - started) * 1000)
+                bucket['statuses'].append(status)
+                if first_byte is not None:
+                    bucket['ttfb'].append(first_byte * 1000)
+        client.close()
+
+    threads = [threading.Thread(target=worker, args=(workload.rng.random(),))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    operations = {}
+    all_latencies = []
+    total_errors = 0
+    for name, bucket in results.items():
+        if not bucket['latencies']:
+            continue
+        statuses: Dict[str, int] = {}
+        for status in bucket['statuses']:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items()
+                     if not (status.isdigit() and int(status) < 400))
+        total_errors += errors
+        all_latencies.extend(bucket['latencies'])
+        operations[name] = {
+            'requests': len(bucket['latencies']),
+            'errors': errors,
+            'statuses': statuses,
+            'throughputRps': round(len(bucket['latencies']) / duration, 2),
+            'latencyMs': summarize(bucket['latencies'])
+        }
+        if bucket['ttfb']:
+            operations[name]['timeToFirstByteMs'] = summarize(bucket['ttfb'])
+
+    return {
+        'concurrency': concurrency,
+        'durationSeconds': duration,
+        'requests': len(all_latencies),
+        'errors': total_errors,
+        'errorRate': round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        'throughputRps': round(len(all_latencies) / duration, 2),
+        'latencyMs': summarize(all_latencies),
+        'operations': operations
+    }
+
+
+def wait_until_healthy(host: str, port: int, process: Optional[subprocess.Popen],
+                       timeout: float = 30.0) -> Dict[str, Any]:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode} during startup")
+        try:
+            status, data = Client(host, port, 2.0).request('GET', '/api/health')
+            if status == 200:
+                return json.loads(data)
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server did not become healthy within {timeout:.0f}s")
+
+
+def start_server(args: argparse.Namespace, mock_url: str, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(args.port),
+        'OPENAI_API_KEY': 'mock-key',
+        'GEMINI_API_KEY': 'mock-key',
+        'MISTRAL_API_KEY': 'mock-key',
+        'OPENAI_BASE_URL': f'{mock_url}/v1',
+        'GEMINI_API_ENDPOINT': mock_url,
+        'MISTRAL_ENDPOINT': mock_url,
+        'SQLITE_PATH': os.path.join(workdir, 'bench.db'),
+        'UPLOAD_DIR': os.path.join(workdir, 'uploads'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    if not args.response_cache:
+        env['CACHE_TTL'] = '0'
+    command = [sys.executable, os.path.join(BACKEND_DIR, 'fixed_server.py'),
+               '--port', str(args.port)]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, timeout=5)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the server against a mock LLM provider')
+    parser.add_argument('--concurrency', default='1,8,32',
+                        help='Comma-separated client counts, one run each')
+    parser.add_argument('--duration', type=float, default=20.0,
+                        help='Measured seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=2.0,
+                        help='Unmeasured seconds before each level')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Operation weights, e.g. chat=3,history=1')
+    parser.add_argument('--port', type=int, default=9302, help='Port for the server under test')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Worker threads for the server under test')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for the server under test')
+    parser.add_argument('--server-url', default=None,
+                        help='Benchmark a running server instead of starting one')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='Leave the chat response cache on')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Client timeout per request')
+    parser.add_argument('--output', default=None,
+                        help='Write the JSON report here instead of stdout')
+    parser.add_argument('--keep-workdir', action='store_true',
+                        help='Keep the database, uploads and server log')
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    behaviour = behaviour_from_args(args)
+    mock = start_mock_server(behaviour)
+    mock_url = 'http://%s:%d' % mock.server_address[:2]
+
+    workdir = tempfile.mkdtemp(prefix='bench-server-')
+    process = None
+    if args.server_url:
+        target = urlparse(args.server_url)
+        host, port = target.hostname, target.port or 80
+    else:
+        host, port = '127.0.0.1', args.port
+        process = start_server(args, mock_url, workdir)
+
+    try:
+        health = wait_until_healthy(host, port, process)
+        if not health.get('providers'):
+            print("warning: the server reports no providers (are the SDKs installed?); "
+                  "chat measures the fallback path", file=sys.stderr)
+        workload = Workload(random.Random(args.seed))
+        # Seed a few documents so analyze has something to work on from the start
+        client = Client(host, port, args.timeout)
+        for _ in range(3):
+            workload.upload(client)
+        client.close()
+
+        runs = []
+        for concurrency in levels:
+            result = run_level(host, port, workload, mix, concurrency, args.duration, args.warmup,
+                               args.timeout)
+            runs.append(result)
+            latency = result['latencyMs']
+            print(f"concurrency {concurrency:>4}: {result['throughputRps']:8.1f} req/s, "
+                  f"p50 {latency.get('p50', 0):.1f} ms, p95 {latency.get('p95', 0):.1f} ms, "
+                  f"p99 {latency.get('p99', 0):.1f} ms, "
+                  f"errors {result['errors']}/{result['requests']}",
+                  file=sys.stderr)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        mock.shutdown()
+        if args.keep_workdir:
+            print(f"Work directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'benchmark': 'server_load',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'mix': dict(mix),
+            'durationSeconds': args.duration,
+            'warmupSeconds': args.warmup,
+            'serverThreads': args.threads,
+            'serverWorkers': args.workers,
+            'responseCache': args.response_cache,
+            'externalServer': args.server_url
+        },
+        'serverProviders': health.get('providers', []),
+        'mock': behaviour.stats(),
+        'levels': runs
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
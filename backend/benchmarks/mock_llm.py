@@ -0,0 +1,305 @@
+"""Local stand-in for the OpenAI, Gemini and Mistral chat APIs.
+
+Usage:
+    python benchmarks/mock_llm.py --port 9100 --latency-ms 800 --error-rate 0.02
+
+Then start the server against it:
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1 GEMINI_API_ENDPOINT=http://127.0.0.1:9100 \\
+    MISTRAL_ENDPOINT=http://127.0.0.1:9100 python fixed_server.py
+
+Serves ``POST /v1/chat/completions`` (OpenAI and Mistral, plain or streamed
+as SSE) and ``POST /v1beta/models/<model>:generateContent`` /
+``:streamGenerateContent`` (Gemini REST). Every response waits for a delay
+drawn from the configured distribution, and a share of calls fail with a 500
+or a 429 carrying Retry-After. Streamed replies send the first chunk after the
+delay and the rest ``--token-delay-ms`` apart. No real model is involved.
+"""
+
+import argparse
+import http.server
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, Iterator, Optional
+
+REPLY = (
+    "Under most employment contracts a notice period applies to both parties. "
+    "Check the termination clause for the required length, whether notice must be given "
+    "in writing, and any payment in lieu of notice. This is general information, "
+    "not legal advice."
+)
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+
+class MockBehaviour:
+    """Latency, failure and streaming settings shared by all requests, plus call counters"""
+
+    def __init__(self, latency_ms: float = 500.0, distribution: str = 'lognormal',
+                 jitter: float = 0.5, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, token_delay_ms: float = 20.0, reply: str = REPLY,
+                 seed: Optional[int] = None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        self.latency = latency_ms / 1000.0
+        self.distribution = distribution
+        # Spread of the distribution: +/- share for uniform, sigma for lognormal
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.token_delay = token_delay_ms / 1000.0
+        self.reply = reply
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.streamed = 0
+
+    def delay(self) -> float:
+        with self._lock:
+            if self.distribution == 'fixed':
+                return self.latency
+            if self.distribution == 'uniform':
+                return max(0.0, self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter))
+            if self.distribution == 'exponential':
+                return self._rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            # Lognormal with the configured mean: a long right tail like real completions
+            sigma = self.jitter
+            if self.latency <= 0:
+                return 0.0
+            return self._rng.lognormvariate(math.log(self.latency) - sigma * sigma / 2, sigma)
+
+    def outcome(self, streamed: bool) -> str:
+        """``ok``, ``error`` or ``rate_limited`` for the next call, counting it"""
+        with self._lock:
+            self.calls += 1
+            self.streamed += streamed
+            draw = self._rng.random()
+            if draw < self.rate_limit_rate:
+                self.rate_limited += 1
+                return 'rate_limited'
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return 'error'
+            return 'ok'
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'streamed': self.streamed,
+                'errors': self.errors,
+                'rateLimited': self.rate_limited,
+                'latencyMs': round(self.latency * 1000, 1),
+                'distribution': self.distribution
+            }
+
+
+def _chunks(text: str, words: int = 3) -> Iterator[str]:
+    parts = text.split(' ')
+    for start in range(0, len(parts), words):
+        yield ' '.join(parts[start:start + words]) + (' ' if start + words < len(parts) else '')
+
+
+class MockLLMHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behaviour: MockBehaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any],
+                   headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.behaviour.stats())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        path = self.path.split('?', 1)[0]
+
+        if path.endswith('/chat/completions'):
+            streamed = bool(body.get('stream'))
+            style = 'openai'
+        elif ':generateContent' in path or ':streamGenerateContent' in path:
+            streamed = ':streamGenerateContent' in path
+            style = 'gemini'
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown endpoint {path}'}})
+            return
+
+        behaviour = self.behaviour
+        outcome = behaviour.outcome(streamed)
+        time.sleep(behaviour.delay())
+        if outcome == 'rate_limited':
+            self._send_json(429, {'error': {'message': 'Rate limit reached (mock)', 'code': 429}},
+                            {'Retry-After': f'{behaviour.retry_after:g}'})
+            return
+        if outcome == 'error':
+            self._send_json(500, {'error': {'message': 'Internal error (mock)', 'code': 500}})
+            return
+
+        model = body.get('model') or path.rsplit('/', 1)[-1].split(':', 1)[0]
+        if style == 'openai':
+            self._openai_stream(model) if streamed else self._openai_reply(model)
+        else:
+            if streamed:
+                self._gemini_stream()
+            else:
+                self._send_json(200, self._gemini_payload(behaviour.reply, True))
+
+    def _openai_reply(self, model: str):
+        reply = self.behaviour.reply
+        self._send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': reply},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': 100,
+                'completion_tokens': len(reply) // 4,
+                'total_tokens': 100 + len(reply) // 4
+            }
+        })
+
+    def _openai_stream(self, model: str):
+        self._start_stream('text/event-stream')
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+
+        def event(delta: Dict[str, str], finish: Optional[str]) -> bytes:
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish}]
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode('utf-8')
+
+        self.wfile.write(event({'role': 'assistant', 'content': ''}, None))
+        for number, text in enumerate(_chunks(self.behaviour.reply)):
+            if number:
+                time.sleep(self.behaviour.token_delay)
+            self.wfile.write(event({'content': text}, None))
+            self.wfile.flush()
+        self.wfile.write(event({}, 'stop'))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    @staticmethod
+    def _gemini_payload(text: str, last: bool) -> Dict[str, Any]:
+        candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}
+        if last:
+            candidate['finishReason'] = 'STOP'
+        usage = {'promptTokenCount': 100, 'candidatesTokenCount': len(text) // 4}
+        return {'candidates': [candidate], 'usageMetadata': usage}
+
+    def _gemini_stream(self):
+        # The REST streaming API returns one JSON array whose elements arrive over time
+        self._start_stream('application/json')
+        chunks = list(_chunks(self.behaviour.reply))
+        self.wfile.write(b'[')
+        for number, text in enumerate(chunks):
+            if number:
+                time.sleep(self.behaviour.token_delay)
+                self.wfile.write(b',\n')
+            payload = self._gemini_payload(text, number == len(chunks) - 1)
+            self.wfile.write(json.dumps(payload).encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b']')
+
+
+class MockLLMServer(ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 256
+
+
+def start_mock_server(behaviour: MockBehaviour, host: str = '127.0.0.1',
+                      port: int = 0) -> MockLLMServer:
+    """Serve the mock APIs on a background thread; ``port=0`` picks a free port.
+
+    The bound address is in the returned server's ``server_address``.
+    """
+    handler = type('BoundMockLLMHandler', (MockLLMHandler,), {'behaviour': behaviour})
+    server = MockLLMServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-llm', daemon=True).start()
+    return server
+
+
+def add_behaviour_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency-ms', type=float, default=500.0,
+                        help='Mean delay before a reply starts')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--jitter', type=float, default=0.5,
+                        help='Spread: +/- share for uniform, sigma for lognormal')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of calls answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Share of calls answered with a 429')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='Retry-After seconds sent with a 429')
+    parser.add_argument('--token-delay-ms', type=float, default=20.0,
+                        help='Delay between streamed chunks')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def behaviour_from_args(args: argparse.Namespace) -> MockBehaviour:
+    return MockBehaviour(
+        latency_ms=args.latency_ms, distribution=args.distribution, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, token_delay_ms=args.token_delay_ms, seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mock OpenAI/Gemini/Mistral API server for benchmarks'
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(behaviour_from_args(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Mock LLM APIs on http://{host}:{port} "
+          f"(OpenAI base URL http://{host}:{port}/v1); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Small thread-safe caching primitives shared by the backend services."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache whose entries also expire after a period of inactivity.
+
+    Each access refreshes an entry's position and expiry, so ``ttl`` acts as an
+    idle timeout. ``on_evict`` is called with ``(key, value)`` outside the lock
+    whenever an entry is dropped for capacity or expiry.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expiry(self, now: float) -> float:
+        return now + self.ttl if self.ttl else float('inf')
+
+    def _purge_expired(self, now: float) -> list:
+        """Drop expired entries from the LRU end; caller holds the lock"""
+        dropped = []
+        while self._data:
+            key, (value, expires_at) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+            self.expirations += 1
+            dropped.append((key, value))
+        return dropped
+
+    def _evict_overflow(self, dropped: list):
+        """Drop least recently used entries beyond capacity; caller holds the lock"""
+        while len(self._data) > self.max_entries:
+            key, (value, _) = self._data.popitem(last=False)
+            self.evictions += 1
+            dropped.append((key, value))
+
+    def _notify(self, dropped: list):
+        if self.on_evict:
+            for key, value in dropped:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            dropped = self._purge_expired(now)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                value = default
+            else:
+                self.hits += 1
+                value = entry[0]
+                self._data[key] = (value, self._expiry(now))
+                self._data.move_to_end(key)
+        self._notify(dropped)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        with self._lock:
+            dropped = self._purge_expired(now)
+            self._data[key] = (value, self._expiry(now))
+            self._data.move_to_end(key)
+            self._evict_overflow(dropped)
+        self._notify(dropped)
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, building it with ``factory`` on a miss.
+
+        The factory runs outside the lock; if two threads race on the same key the
+        first value stored wins and is returned to both.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        created = factory()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+                return entry[0]
+            self._data[key] = (created, self._expiry(now))
+            dropped = []
+            self._evict_overflow(dropped)
+        self._notify(dropped)
+        return created
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per in-flight ``key``; returns ``(result, shared)``"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
@@ -0,0 +1,196 @@
+"""Token-budgeted conversation context for provider calls.
+
+Instead of sending a fixed number of recent messages, the newest turns are
+packed into each provider's token budget, newest first. Turns that no longer
+fit are represented by a rolling summary of the conversation. The summary is
+regenerated in the background, and only once enough unsummarized turns have
+piled up, so the request path never waits for it. Prompt size, and with it
+provider latency, stays roughly flat however long a conversation grows.
+
+Token counts are estimates (about four characters per token). They are
+computed once per message, when it enters the conversation store, and never
+recounted while building context.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger('multi_llm_server')
+
+# Per-message framing the providers add around role and content
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of ``text`` for budgeting purposes"""
+    return (len(text) + 3) // 4 + _MESSAGE_OVERHEAD_TOKENS
+
+
+def message_tokens(message: Any) -> int:
+    """Cached token count of a stored message, or a fresh estimate for a plain dict"""
+    tokens = getattr(message, 'tokens', None)
+    return tokens if tokens is not None else estimate_tokens(message['content'])
+
+
+def extractive_summary(previous: str, messages: Sequence[Any], max_tokens: int) -> str:
+    """Summary built without a provider: each turn's first sentence, newest kept when over budget"""
+    lines = [previous] if previous else []
+    for message in messages:
+        content = ' '.join(message['content'].split())
+        first = _SENTENCE_END.split(content, 1)[0][:240]
+        lines.append(f"{message['role']}: {first}")
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return '\n'.join(lines)[:max_tokens * 4]
+
+
+class _Summary:
+    __slots__ = ('text', 'tokens', 'covered_through')
+
+    def __init__(self, text: str, covered_through: str):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        # ID of the newest message folded into the summary
+        self.covered_through = covered_through
+
+
+class ContextWindow:
+    """Selects the history sent to each provider and keeps per-user rolling summaries"""
+
+    def __init__(self, budgets: Dict[str, int], default_budget: int = 3000,
+                 summarize: Optional[Callable[[str, List[Any], Dict[str, str]], str]] = None,
+                 executor: Optional[Executor] = None, reserve_tokens: int = 600,
+                 summary_tokens: int = 300, refresh_after: int = 6, max_users: int = 10000):
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.summarize = summarize
+        self.executor = executor
+        # Room kept free for the system prompt and the reply
+        self.reserve_tokens = reserve_tokens
+        self.summary_tokens = summary_tokens
+        # Unsummarized older turns tolerated before the summary counts as stale
+        self.refresh_after = refresh_after
+        self.max_users = max_users
+        self._summaries: 'OrderedDict[str, _Summary]' = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.trimmed_turns = 0
+        self.summary_refreshes = 0
+        self.summary_failures = 0
+        self.context_tokens = 0
+
+    def budget(self, provider: str) -> int:
+        return self.budgets.get(provider, self.default_budget)
+
+    def build(self, user_id: str, provider: str, history: Sequence[Any],
+              api_keys: Optional[Dict[str, str]] = None) -> List[Any]:
+        """History for ``provider``: newest turns that fit its budget, after a summary of the rest.
+
+        The last entry (the current user message) is always included. A summary
+        is returned as a leading ``system`` message.
+        """
+        if not history:
+            return []
+        with self._lock:
+            summary = self._summaries.get(user_id)
+            if summary is not None:
+                self._summaries.move_to_end(user_id)
+
+        available = self.budget(provider) - self.reserve_tokens - (summary.tokens if summary else 0)
+        start = len(history) - 1
+        used = message_tokens(history[start])
+        while start > 0:
+            tokens = message_tokens(history[start - 1])
+            if used + tokens > available:
+                break
+            start -= 1
+            used += tokens
+        older = history[:start]
+        selected = list(history[start:])
+
+        if older:
+            self._maybe_refresh(user_id, summary, history, start, api_keys or {})
+            if summary is not None:
+                content = f"Summary of the earlier conversation:\n{summary.text}"
+                selected.insert(0, {'role': 'system', 'content': content})
+                used += summary.tokens
+
+        with self._lock:
+            self.builds += 1
+            self.trimmed_turns += len(older)
+            self.context_tokens += used
+        return selected
+
+    def _maybe_refresh(self, user_id: str, summary: Optional[_Summary], history: Sequence[Any],
+                       start: int, api_keys: Dict[str, str]):
+        """Queue a background refresh once enough turns before ``start`` are not yet summarized"""
+        first = 0
+        if summary is not None:
+            for index in range(len(history) - 2, -1, -1):
+                if history[index].get('id') == summary.covered_through:
+                    first = index + 1
+                    break
+        pending = list(history[first:start])
+        if not pending or (summary is not None and len(pending) < self.refresh_after):
+            return
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+        previous = summary.text if summary is not None else ''
+        if self.executor is None:
+            self._refresh(user_id, previous, pending, api_keys)
+        else:
+            self.executor.submit(self._refresh, user_id, previous, pending, api_keys)
+
+    def _refresh(self, user_id: str, previous: str, pending: List[Any], api_keys: Dict[str, str]):
+        try:
+            text = None
+            if self.summarize is not None:
+                try:
+                    text = self.summarize(previous, pending, api_keys)
+                except Exception as e:
+                    logger.warning(
+                        f"Summarizing conversation for {user_id} failed, using extract: {str(e)}"
+                    )
+                    with self._lock:
+                        self.summary_failures += 1
+            if not text:
+                text = extractive_summary(previous, pending, self.summary_tokens)
+            summary = _Summary(text.strip()[:self.summary_tokens * 4], pending[-1].get('id'))
+            with self._lock:
+                self._summaries[user_id] = summary
+                self._summaries.move_to_end(user_id)
+                while len(self._summaries) > self.max_users:
+                    self._summaries.popitem(last=False)
+                self.summary_refreshes += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+    def summary(self, user_id: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(user_id)
+            return summary.text if summary is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'budgets': dict(self.budgets),
+                'defaultBudget': self.default_budget,
+                'summaries': len(self._summaries),
+                'builds': self.builds,
+                'trimmedTurns': self.trimmed_turns,
+                'summaryRefreshes': self.summary_refreshes,
+                'summaryFailures': self.summary_failures,
+                'averageContextTokens': (
+                    round(self.context_tokens / self.builds) if self.builds else 0
+                )
+            }
@@ -0,0 +1,330 @@
+"""Bounded in-memory conversation store.
+
+Replaces the unbounded ``chat_history`` dict of lists of dicts. Messages are
+kept as compact ``__slots__`` records, each user keeps at most
+``max_messages_per_user`` of them, and when the store exceeds its memory
+budget (or a user has been idle longer than ``idle_ttl``) whole conversations
+are evicted, least recently active first.
+
+The read API mirrors what the handlers did with the old dict:
+``user_id in store``, ``store[user_id]``, ``store.get(user_id, [])`` and
+``len(store)``. Records support ``msg['role']`` style access.
+
+With a persistence ``backend`` every appended message is also queued for
+durable storage, and a conversation that is not in memory (after a restart
+or an eviction) is warm-loaded from the backend the first time it is used.
+
+With ``shared=True`` several processes write to the same backend. Each cached
+conversation remembers the backend revision it was loaded at (the sequence
+number of its newest message); every access compares that with the backend
+and reloads the conversation if another process appended to or cleared it.
+Versions are then the backend revision, so they agree across processes.
+"""
+
+import itertools
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from context_window import estimate_tokens
+
+# Approximate cost of a record and its slots beyond the content string
+_RECORD_OVERHEAD_BYTES = 120
+
+# Process-wide version counter; every change to a conversation takes a fresh value
+_versions = itertools.count(1)
+
+
+class MessageRecord:
+    """A single chat message with a stable ID, its insertion time and its token count"""
+
+    __slots__ = ('id', 'role', 'content', 'provider', 'timestamp', 'meta', 'size', 'tokens')
+
+    def __init__(self, role: str, content: str, provider: Optional[str] = None,
+                 meta: Optional[Dict[str, Any]] = None, timestamp: Optional[float] = None,
+                 message_id: Optional[str] = None):
+        self.id = message_id or str(uuid.uuid4())
+        self.role = sys.intern(role)
+        self.content = content
+        self.provider = sys.intern(provider) if provider else None
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.meta = meta
+        meta_size = sys.getsizeof(meta) if meta else 0
+        self.size = sys.getsizeof(content) + _RECORD_OVERHEAD_BYTES + meta_size
+        # Counted once here so building provider context never re-tokenizes the conversation
+        self.tokens = estimate_tokens(content)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in ('id', 'role', 'content', 'provider', 'timestamp'):
+            value = getattr(self, key)
+        elif self.meta:
+            value = self.meta.get(key)
+        else:
+            value = None
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'role': self.role, 'content': self.content}
+        if self.provider:
+            data['provider'] = self.provider
+        if self.meta:
+            data.update(self.meta)
+        return data
+
+
+class _Conversation:
+    __slots__ = ('messages', 'size', 'last_active', 'version', 'revision')
+
+    def __init__(self):
+        self.messages: deque = deque()
+        self.size = 0
+        self.last_active = time.monotonic()
+        self.version = next(_versions)
+        # Backend revision this copy reflects (shared mode); -1 forces a reload
+        self.revision = 0
+
+
+class ConversationStore:
+    """Thread-safe, memory-bounded map of user ID to conversation"""
+
+    def __init__(self, max_messages_per_user: int = 200, max_bytes: int = 64 * 1024 * 1024,
+                 idle_ttl: Optional[float] = None, backend=None, shared: bool = False):
+        self.max_messages_per_user = max_messages_per_user
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.shared = shared and backend is not None
+
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._bytes = 0
+        self._messages = 0
+        self._lock = threading.RLock()
+        self.evicted_users = 0
+        self.trimmed_messages = 0
+        self.warm_loads = 0
+        self.reloads = 0
+
+    def _ensure_loaded(self, user_id: str):
+        """Warm-load a conversation from the backend if it is not in memory.
+
+        The database read happens outside the lock; if another thread loaded or
+        created the conversation in the meantime, its copy wins.
+        """
+        if self.backend is None:
+            return
+        revision = 0
+        if self.shared:
+            revision = self.backend.message_revision(user_id)
+            with self._lock:
+                conversation = self._conversations.get(user_id)
+                if conversation is not None:
+                    if conversation.revision == revision:
+                        return
+                    # Another process appended to or cleared this conversation
+                    self._drop(user_id)
+                    self.reloads += 1
+            if not revision:
+                return
+        else:
+            with self._lock:
+                if user_id in self._conversations:
+                    return
+        rows = self.backend.load_messages(user_id, self.max_messages_per_user)
+        if not rows:
+            return
+        with self._lock:
+            current = self._conversations.get(user_id)
+            if current is not None and (not self.shared or current.revision >= revision):
+                return
+            if current is not None:
+                self._drop(user_id)
+            conversation = _Conversation()
+            # Rows may include writes newer than ``revision``; that only costs another reload
+            conversation.revision = revision
+            for message_id, role, content, provider, meta, timestamp in rows:
+                record = MessageRecord(role, content, provider, meta, timestamp, message_id)
+                conversation.messages.append(record)
+                conversation.size += record.size
+            self._conversations[user_id] = conversation
+            self._bytes += conversation.size
+            self._messages += len(conversation.messages)
+            self.warm_loads += 1
+            self._enforce_limits(keep=user_id)
+
+    def append(self, user_id: str, role: str, content: str, provider: Optional[str] = None,
+               meta: Optional[Dict[str, Any]] = None) -> MessageRecord:
+        """Record a message for ``user_id`` and enforce the retention limits"""
+        self._ensure_loaded(user_id)
+        record = MessageRecord(role, content, provider, meta)
+        seq = None
+        if self.backend is not None:
+            seq = self.backend.save_message(user_id, record.id, record.role, content,
+                                            record.provider, meta, record.timestamp)
+        # In shared mode, stay in sync only if no other process wrote since our last load
+        previous = None
+        if self.shared and seq:
+            previous = self.backend.message_revision(user_id, before=seq)
+        with self._lock:
+            conversation = self._touch(user_id, create=True)
+            conversation.messages.append(record)
+            conversation.size += record.size
+            conversation.version = next(_versions)
+            if self.shared:
+                conversation.revision = seq if seq and conversation.revision == previous else -1
+            self._bytes += record.size
+            self._messages += 1
+
+            while len(conversation.messages) > self.max_messages_per_user:
+                dropped = conversation.messages.popleft()
+                conversation.size -= dropped.size
+                self._bytes -= dropped.size
+                self._messages -= 1
+                self.trimmed_messages += 1
+
+            self._enforce_limits(keep=user_id)
+        return record
+
+    def _touch(self, user_id: str, create: bool = False) -> Optional[_Conversation]:
+        """Return a user's conversation, marking it most recently active; caller holds the lock"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            if not create:
+                return None
+            conversation = _Conversation()
+            self._conversations[user_id] = conversation
+        conversation.last_active = time.monotonic()
+        self._conversations.move_to_end(user_id)
+        return conversation
+
+    def _drop(self, user_id: str):
+        conversation = self._conversations.pop(user_id)
+        self._bytes -= conversation.size
+        self._messages -= len(conversation.messages)
+
+    def _evict(self, user_id: str):
+        self._drop(user_id)
+        self.evicted_users += 1
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        """Evict idle users, then least recently active ones until under budget; caller locks"""
+        if self.idle_ttl:
+            cutoff = time.monotonic() - self.idle_ttl
+            while self._conversations:
+                user_id, conversation = next(iter(self._conversations.items()))
+                if conversation.last_active > cutoff or user_id == keep:
+                    break
+                self._evict(user_id)
+
+        while self._bytes > self.max_bytes and len(self._conversations) > 1:
+            user_id = next(iter(self._conversations))
+            if user_id == keep:
+                break
+            self._evict(user_id)
+
+    def __contains__(self, user_id: str) -> bool:
+        self._ensure_loaded(user_id)
+        with self._lock:
+            return user_id in self._conversations
+
+    def __getitem__(self, user_id: str) -> List[MessageRecord]:
+        self._ensure_loaded(user_id)
+        with self._lock:
+            conversation = self._touch(user_id)
+            if conversation is None:
+                raise KeyError(user_id)
+            return list(conversation.messages)
+
+    def get(self, user_id: str, default: Any = None) -> Any:
+        try:
+            return self[user_id]
+        except KeyError:
+            return default
+
+    def recent(self, user_id: str, count: int) -> List[MessageRecord]:
+        """Return the last ``count`` messages without copying the whole conversation"""
+        self._ensure_loaded(user_id)
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return []
+            messages = conversation.messages
+            start = max(0, len(messages) - count)
+            return [messages[i] for i in range(start, len(messages))]
+
+    def version(self, user_id: str) -> int:
+        """Opaque value that changes whenever the user's conversation changes (0 if empty)"""
+        self._ensure_loaded(user_id)
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                return 0
+            if self.shared and conversation.revision > 0:
+                return conversation.revision
+            return conversation.version
+
+    def page(self, user_id: str, after: Optional[str] = None,
+             limit: Optional[int] = None) -> Tuple[List[MessageRecord], bool]:
+        """Return messages oldest first, starting after the message with ID ``after``.
+
+        Returns ``(messages, has_more)``. Raises ValueError if ``after`` is not a
+        message still held, e.g. one trimmed from the conversation or cleared.
+        """
+        self._ensure_loaded(user_id)
+        with self._lock:
+            conversation = self._touch(user_id)
+            messages = conversation.messages if conversation is not None else ()
+            start = 0
+            if after:
+                for index in range(len(messages) - 1, -1, -1):
+                    if messages[index].id == after:
+                        start = index + 1
+                        break
+                else:
+                    raise ValueError("unknown or expired cursor")
+            if conversation is None:
+                return [], False
+            end = len(messages) if limit is None else min(len(messages), start + limit)
+            return [messages[i] for i in range(start, end)], end < len(messages)
+
+    def __len__(self) -> int:
+        """Number of conversations currently held in memory"""
+        with self._lock:
+            return len(self._conversations)
+
+    def clear(self, user_id: Optional[str] = None):
+        with self._lock:
+            if user_id is None:
+                self._conversations.clear()
+                self._bytes = 0
+                self._messages = 0
+            elif user_id in self._conversations:
+                self._drop(user_id)
+            if user_id is not None and self.backend is not None:
+                self.backend.delete_messages(user_id)
+
+    def memory_usage(self) -> Dict[str, Any]:
+        with self._lock:
+            self._enforce_limits()
+            return {
+                'users': len(self._conversations),
+                'messages': self._messages,
+                'approx_bytes': self._bytes,
+                'budget_bytes': self.max_bytes,
+                'max_messages_per_user': self.max_messages_per_user,
+                'evicted_users': self.evicted_users,
+                'warm_loads': self.warm_loads,
+                'reloads': self.reloads,
+                'trimmed_messages': self.trimmed_messages
+            }
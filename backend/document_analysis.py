@@ -0,0 +1,328 @@
+"""Map-reduce analysis of long legal documents.
+
+A whole contract rarely fits in one prompt. The pipeline extracts the text,
+splits it into overlapping chunks along clause boundaries, and analyzes the
+chunks concurrently on a worker pool. Each provider has its own concurrency
+cap. The partial results are then reduced into a single
+``summary``/``key_points``/``risk_assessment``/``recommendations`` result.
+"""
+
+import json
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import Executor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from provider_limits import ProviderConcurrencyLimiter
+
+# PDF extraction is optional; plain text and DOCX work with the standard library
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger('multi_llm_server')
+
+RISK_LEVELS = ['Low', 'Medium', 'High']
+
+# Bump when prompts or the reduce step change, so cached analyses are not reused
+ANALYZER_VERSION = '1'
+
+# Rough characters per token, used to estimate provider spend
+_CHARS_PER_TOKEN = 4
+
+# Lines that open a new clause: "1.", "2.3", "(a)", "Section 4", "ARTICLE V", all-caps headings
+_CLAUSE_HEADING = re.compile(
+    r'^\s*(?:\d+(?:\.\d+)*[.)]?\s|\([a-zA-Z0-9]{1,4}\)\s'
+    r'|(?i:section|article|clause|schedule|exhibit)\s+[\dIVXLCivxlc]+\b'
+    r'|[A-Z][A-Z0-9 ,;&\-]{3,}$)'
+)
+_SENTENCE_END = re.compile(r'(?<=[.;:!?])\s+')
+_WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class DocumentTextError(Exception):
+    """The document's text could not be extracted"""
+
+
+class AnalysisError(Exception):
+    """No chunk of the document could be analyzed"""
+
+
+def extract_text(path: str) -> str:
+    """Return the plain text of a stored upload, chosen by file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.txt', '.md'):
+        with open(path, 'r', encoding='utf-8', errors='replace') as handle:
+            return handle.read()
+    if extension == '.docx':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                root = ElementTree.fromstring(archive.read('word/document.xml'))
+        except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+            raise DocumentTextError(f"Could not read DOCX file: {str(e)}")
+        paragraphs = [
+            ''.join(node.text or '' for node in paragraph.iter(f'{_WORD_NAMESPACE}t'))
+            for paragraph in root.iter(f'{_WORD_NAMESPACE}p')
+        ]
+        return '\n\n'.join(p for p in paragraphs if p.strip())
+    if extension == '.pdf':
+        if PdfReader is None:
+            raise DocumentTextError(
+                "PDF text extraction requires the pypdf package (pip install pypdf)"
+            )
+        try:
+            reader = PdfReader(path)
+            return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+        except Exception as e:
+            raise DocumentTextError(f"Could not read PDF file: {str(e)}")
+    raise DocumentTextError(
+        f"Text extraction is not supported for '{extension or 'unknown'}' files"
+    )
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Split an oversized clause at sentence ends, hard-wrapping sentences still too long"""
+    pieces, current = [], ''
+    for sentence in _SENTENCE_END.split(text):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text: str, max_chars: int = 6000, overlap_chars: int = 600) -> List[str]:
+    """Split text into chunks of at most ``max_chars`` plus overlap, keeping clauses together.
+
+    Paragraphs are grouped into clauses at heading lines, and whole clauses
+    are packed into each chunk. Each chunk after the first starts with the
+    last ``overlap_chars`` of the previous one, so a clause that spans a
+    chunk boundary is still seen in context.
+    """
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    clauses: List[str] = []
+    for paragraph in paragraphs:
+        if clauses and not _CLAUSE_HEADING.match(paragraph.split('\n', 1)[0]):
+            clauses[-1] += '\n\n' + paragraph
+        else:
+            clauses.append(paragraph)
+
+    units: List[str] = []
+    for clause in clauses:
+        units.extend(_split_long(clause, max_chars) if len(clause) > max_chars else [clause])
+
+    chunks: List[str] = []
+    current = ''
+    for unit in units:
+        if current and len(current) + 2 + len(unit) > max_chars:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n\n{unit}" if current else unit
+    if current:
+        chunks.append(current)
+
+    if overlap_chars <= 0 or len(chunks) < 2:
+        return chunks
+    overlapped = [chunks[0]]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        tail = previous[-overlap_chars:]
+        # Start the overlap at a word boundary
+        space = tail.find(' ')
+        if 0 <= space < len(tail) - 1 and len(previous) > overlap_chars:
+            tail = tail[space + 1:]
+        overlapped.append(f"{tail}\n\n{chunk}")
+    return overlapped
+
+
+def _chunk_prompt(chunk: str, index: int, total: int, title: str) -> str:
+    return (
+        f'You are reviewing part {index + 1} of {total} of a legal document titled "{title}". '
+        "Analyze only this part. Respond with a JSON object and nothing else, using the keys "
+        '"summary" (2-3 sentences), "key_points" (list of short strings), '
+        '"risk_level" ("Low", "Medium" or "High") and '
+        '"recommendations" (list of short strings).\n\n'
+        f"---\n{chunk}\n---"
+    )
+
+
+def _reduce_prompt(summaries: List[str], title: str) -> str:
+    sections = '\n\n'.join(f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries))
+    return (
+        f'The following are summaries of consecutive parts of the legal document "{title}". '
+        "Combine them into one concise summary of the whole document (at most 200 words). "
+        "Respond with the summary text only.\n\n" + sections
+    )
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def parse_partial(raw: str) -> Dict[str, Any]:
+    """Read a chunk result, tolerating prose or code fences around the JSON"""
+    start, end = raw.find('{'), raw.rfind('}')
+    data: Dict[str, Any] = {}
+    if 0 <= start < end:
+        try:
+            data = json.loads(raw[start:end + 1])
+        except ValueError:
+            data = {}
+    if not isinstance(data, dict) or not data:
+        return {'summary': raw.strip()[:2000], 'key_points': [], 'risk_level': None,
+                'recommendations': []}
+
+    risk = str(data.get('risk_level') or data.get('risk_assessment') or '').strip().capitalize()
+    return {
+        'summary': str(data.get('summary', '')).strip(),
+        'key_points': _as_list(data.get('key_points')),
+        'risk_level': risk if risk in RISK_LEVELS else None,
+        'recommendations': _as_list(data.get('recommendations'))
+    }
+
+
+def _merge_unique(lists: List[List[str]], limit: int) -> List[str]:
+    seen, merged = set(), []
+    for items in lists:
+        for item in items:
+            key = re.sub(r'\W+', ' ', item.lower()).strip()
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(item)
+                if len(merged) >= limit:
+                    return merged
+    return merged
+
+
+class AnalysisPipeline:
+    """Chunk, analyze concurrently and reduce.
+
+    ``complete(provider, prompt, api_key)`` performs one provider call. Chunk
+    calls run on ``executor``; the calling thread only schedules them and
+    reports progress.
+    """
+
+    def __init__(self, complete: Callable[[str, str, Optional[str]], str], executor: Executor,
+                 limiter: ProviderConcurrencyLimiter, chunk_chars: int = 6000,
+                 overlap_chars: int = 600, max_list_items: int = 10):
+        self.complete = complete
+        self.executor = executor
+        self.limiter = limiter
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = overlap_chars
+        self.max_list_items = max_list_items
+
+    @property
+    def version(self) -> str:
+        """Identifies the analyzer and the chunking settings that shape its output"""
+        return f"{ANALYZER_VERSION}:{self.chunk_chars}:{self.overlap_chars}"
+
+    def _call(self, providers: List[str], prompt: str, api_keys: Dict[str, str]) -> Tuple[str, str]:
+        """Try providers in order, each under its concurrency cap; return ``(provider, reply)``"""
+        errors = []
+        for provider in providers:
+            try:
+                with self.limiter.slot(provider):
+                    return provider, self.complete(provider, prompt, api_keys.get(provider))
+            except Exception as e:
+                errors.append(f"{provider}: {str(e)}")
+        raise AnalysisError("; ".join(errors) or "No providers available")
+
+    def _analyze_chunk(self, index: int, chunk: str, total: int, title: str, providers: List[str],
+                       api_keys: Dict[str, str]) -> Tuple[str, Dict[str, Any], int]:
+        # Rotate the starting provider so chunks spread across every configured provider
+        offset = index % len(providers)
+        order = providers[offset:] + providers[:offset]
+        prompt = _chunk_prompt(chunk, index, total, title)
+        provider, raw = self._call(order, prompt, api_keys)
+        return provider, parse_partial(raw), len(prompt) + len(raw)
+
+    def analyze(self, text: str, providers: List[str], title: str = 'Untitled',
+                api_keys: Optional[Dict[str, str]] = None,
+                progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Analyze ``text`` with ``providers``, best first, calling ``progress(done, total)``"""
+        if not providers:
+            raise AnalysisError("No providers available")
+        api_keys = api_keys or {}
+        chunks = split_into_chunks(text, self.chunk_chars, self.overlap_chars)
+        if not chunks:
+            raise AnalysisError("Document contains no text to analyze")
+        total = len(chunks)
+        if progress:
+            progress(0, total)
+
+        futures = {
+            self.executor.submit(
+                self._analyze_chunk, index, chunk, total, title, providers, api_keys
+            ): index
+            for index, chunk in enumerate(chunks)
+        }
+        partials: List[Optional[Dict[str, Any]]] = [None] * total
+        provider_usage: Dict[str, int] = {}
+        errors: List[str] = []
+        characters = 0
+        done = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                provider, partials[index], chunk_characters = future.result()
+                provider_usage[provider] = provider_usage.get(provider, 0) + 1
+                characters += chunk_characters
+            except Exception as e:
+                errors.append(f"chunk {index + 1}: {str(e)}")
+                logger.warning(f"Analysis of chunk {index + 1}/{total} failed: {str(e)}")
+            done += 1
+            if progress:
+                progress(done, total)
+
+        completed = [p for p in partials if p is not None]
+        if not completed:
+            raise AnalysisError(errors[0] if errors else "Analysis failed")
+
+        summaries = [p['summary'] for p in completed if p['summary']]
+        summary = summaries[0] if len(summaries) == 1 else ''
+        provider_calls = len(completed)
+        if len(summaries) > 1:
+            try:
+                prompt = _reduce_prompt(summaries, title)
+                _, summary = self._call(providers, prompt, api_keys)
+                provider_calls += 1
+                characters += len(prompt) + len(summary)
+                summary = summary.strip()
+            except AnalysisError as e:
+                logger.warning(f"Summary reduction failed, joining section summaries: {str(e)}")
+                summary = ' '.join(summaries)
+
+        risks = [p['risk_level'] for p in completed if p['risk_level']]
+        return {
+            'summary': summary,
+            'key_points': _merge_unique(
+                [p['key_points'] for p in completed], self.max_list_items
+            ),
+            # The document is as risky as its riskiest part
+            'risk_assessment': max(risks, key=RISK_LEVELS.index) if risks else 'Unknown',
+            'recommendations': _merge_unique(
+                [p['recommendations'] for p in completed], self.max_list_items
+            ),
+            'chunks': total,
+            'failed_chunks': len(errors),
+            'provider_usage': provider_usage,
+            'provider_calls': provider_calls,
+            'estimated_tokens': characters // _CHARS_PER_TOKEN
+        }
@@ -0,0 +1,184 @@
+"""Document metadata store with optional durable persistence.
+
+Behaves like the ``documents_store`` dict it replaces. With a persistence
+backend, the documents are loaded from disk on first access, and every
+insert, update or delete is queued for write-behind storage. A document
+dict that is modified in place must be passed to ``save()`` to be persisted.
+
+With ``shared=True`` other processes write to the same backend. Every access
+compares the backend's document revision with the one this copy was loaded
+at and, when they differ, reloads the documents. Dicts that are still present
+are updated in place, so references held by callers stay valid, and
+``on_reload(added, removed)`` is told which documents appeared or went away.
+``version`` is then the backend revision, so it agrees across processes.
+"""
+
+import itertools
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class DocumentStore:
+    """Thread-safe map of document ID to document metadata"""
+
+    def __init__(self, backend=None, shared: bool = False,
+                 on_reload: Optional[
+                     Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]
+                 ] = None):
+        self.backend = backend
+        self.shared = shared and backend is not None
+        self.on_reload = on_reload
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._loaded = backend is None
+        self._lock = threading.RLock()
+        self._versions = itertools.count(1)
+        self._version = 0
+        self._revision = 0
+        self.reloads = 0
+
+    @property
+    def version(self) -> int:
+        """Opaque value that changes whenever any document changes"""
+        self._ensure_loaded()
+        return self._revision if self.shared else self._version
+
+    def _ensure_loaded(self):
+        if self.shared:
+            self._sync()
+            return
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for document in self.backend.load_documents():
+                self._documents[document['id']] = document
+            self._loaded = True
+
+    def refresh(self):
+        """Pick up documents other processes changed; a no-op unless the store is shared"""
+        if self.shared:
+            self._sync()
+
+    def _sync(self):
+        """Reload from the backend if another process changed a document since our last look"""
+        revision = self.backend.documents_revision()
+        if self._loaded and revision == self._revision:
+            return
+        added, removed = [], []
+        with self._lock:
+            if self._loaded and revision == self._revision:
+                return
+            reloading = self._loaded
+            loaded = {document['id']: document for document in self.backend.load_documents()}
+            for document_id in [i for i in self._documents if i not in loaded]:
+                removed.append(self._documents.pop(document_id))
+            for document_id, document in loaded.items():
+                current = self._documents.get(document_id)
+                if current is None:
+                    self._documents[document_id] = document
+                    added.append(document)
+                else:
+                    for key in current.keys() - document.keys():
+                        del current[key]
+                    current.update(document)
+            if reloading:
+                self.reloads += 1
+            self._loaded = True
+            self._revision = revision
+        # The first load is indexed by the owner at startup; only later changes are reported
+        if reloading and self.on_reload is not None and (added or removed):
+            self.on_reload(added, removed)
+
+    def _persisted(self, write: Callable[[], Any]):
+        """Run a backend write; in shared mode, stay in sync if it was the only change since load"""
+        if self.backend is None:
+            return
+        before = self._revision
+        write()
+        if self.shared:
+            revision = self.backend.documents_revision()
+            with self._lock:
+                if self._revision == before and revision == before + 1:
+                    self._revision = revision
+
+    def __setitem__(self, document_id: str, document: Dict[str, Any]):
+        self._ensure_loaded()
+        with self._lock:
+            self._documents[document_id] = document
+            self._version = next(self._versions)
+        self._persisted(lambda: self.backend.save_document(document))
+
+    def save(self, document_id: str):
+        """Persist a document that was modified in place"""
+        self._ensure_loaded()
+        with self._lock:
+            document = self._documents.get(document_id)
+            self._version = next(self._versions)
+        if document is not None:
+            self._persisted(lambda: self.backend.save_document(document))
+
+    def __getitem__(self, document_id: str) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            return self._documents[document_id]
+
+    def get(self, document_id: str, default: Any = None) -> Any:
+        self._ensure_loaded()
+        with self._lock:
+            return self._documents.get(document_id, default)
+
+    def __contains__(self, document_id: str) -> bool:
+        self._ensure_loaded()
+        with self._lock:
+            return document_id in self._documents
+
+    def __delitem__(self, document_id: str):
+        self._ensure_loaded()
+        with self._lock:
+            del self._documents[document_id]
+            self._version = next(self._versions)
+        self._persisted(lambda: self.backend.delete_document(document_id))
+
+    def pop(self, document_id: str, default: Any = None) -> Any:
+        self._ensure_loaded()
+        with self._lock:
+            document = self._documents.pop(document_id, None)
+            if document is not None:
+                self._version = next(self._versions)
+        if document is None:
+            return default
+        self._persisted(lambda: self.backend.delete_document(document_id))
+        return document
+
+    def page(self, after: Optional[str] = None,
+             limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return documents in upload order, starting after the document with ID ``after``.
+
+        Returns ``(documents, has_more)``. Raises ValueError if ``after`` is not a stored document.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            ids = list(self._documents)
+            start = 0
+            if after is not None:
+                if after not in self._documents:
+                    raise ValueError("unknown or expired cursor")
+                start = ids.index(after) + 1
+            end = len(ids) if limit is None else min(len(ids), start + limit)
+            return [self._documents[i] for i in ids[start:end]], end < len(ids)
+
+    def values(self) -> List[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._documents.values())
+
+    def __iter__(self) -> Iterator[str]:
+        self._ensure_loaded()
+        with self._lock:
+            return iter(list(self._documents))
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        with self._lock:
+            return len(self._documents)
@@ -1,21 +1,22 @@
 import http.server
-import socketserver
-import json
+import io
 import os
 import sys
 import time
+import argparse
+import atexit
+import functools
+import hmac
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from http import HTTPStatus
 from urllib.parse import parse_qs, urlparse
 import logging
-from typing import Dict, Any, List, Optional, Union
+import math
+from typing import Callable, Dict, Any, Iterator, List, Optional, Union
 import uuid
-
-# Try to import requests, but don't fail if it's not available
-try:
-    import requests
-except ImportError:
-    print("Warning: requests module not available. Some features may be limited.")
-    requests = None
+import zlib
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -24,10 +25,56 @@ logger = logging.getLogger('multi_llm_server')
 # Add the current directory to the path so we can import app modules
 sys.path.insert(0, os.path.dirname(__file__))
 
+# Load environment variables from .env file if it exists; before any setting is read,
+# including WORKERS below
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+    logger.info("Loaded environment variables from .env file")
+except ImportError:
+    logger.warning("python-dotenv not installed, skipping .env loading")
+
+# With --workers N (env: WORKERS) this process only supervises N server processes
+# that share the port; it starts them before loading anything else
+if __name__ == '__main__' and 'SERVER_WORKER_ID' not in os.environ:
+    from prefork import requested_workers, run_supervisor
+    if requested_workers(sys.argv[1:]) > 1:
+        sys.exit(run_supervisor(os.path.abspath(__file__), sys.argv[1:]))
+
+from prefork import EXIT_CONFIG, watch_supervisor
+from startup_timing import StartupProfiler
+
+# Times startup phases, and every module imported until warm-up ends, for /api/health
+startup_profiler = StartupProfiler()
+if os.getenv('STARTUP_PROFILE_IMPORTS', 'true').lower() in ('1', 'true', 'yes'):
+    startup_profiler.install()
+
 PORT = int(os.getenv('PORT', 9002))
 
-# In-memory store for chat history
-chat_history = {}
+# Set by the pre-fork supervisor in each worker process; None when serving as a single process
+WORKER_ID = int(os.environ['SERVER_WORKER_ID']) if 'SERVER_WORKER_ID' in os.environ else None
+WORKER_COUNT = int(os.getenv('SERVER_WORKERS', 1)) if WORKER_ID is not None else 1
+# Workers keep chat history, documents and analysis state in SQLite rather than process memory
+SHARED_STATE = WORKER_ID is not None
+
+# Concurrency settings for the threaded server
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', 32))
+ACCEPT_QUEUE_SIZE = int(os.getenv('ACCEPT_QUEUE_SIZE', 64))
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', 30))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 30))
+
+# HTTP/1.1 persistent connections: idle seconds before a kept-alive connection is closed
+# (0 disables keep-alive) and requests served per connection
+KEEPALIVE_TIMEOUT = float(os.getenv('KEEPALIVE_TIMEOUT', 5))
+KEEPALIVE_MAX_REQUESTS = int(os.getenv('KEEPALIVE_MAX_REQUESTS', 100))
+
+# Responses at least this large are gzip/brotli compressed when the client accepts it
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 5))
+
+# Seconds browsers may cache a CORS preflight response
+CORS_MAX_AGE = int(os.getenv('CORS_MAX_AGE', 86400))
+
 mock_users = {
     "user123": {
         "id": "user123",
@@ -36,67 +83,291 @@ mock_users = {
     }
 }
 
-# In-memory store for documents
-documents_store = {}
 document_counter = 0
 
-# Load environment variables from .env file if it exists
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-    logger.info("Loaded environment variables from .env file")
-except ImportError:
-    logger.warning("python-dotenv not installed, skipping .env loading")
+# Guards shared counters now that requests are handled on worker threads
+state_lock = threading.Lock()
+
+# Set once the server is running so /api/health can report pool utilisation
+http_server = None
+
+from provider_clients import client_registry, sdk_installed, GEMINI_MODEL_NAME
+from response_cache import ResponseCache, make_cache_key
+from provider_health import (
+    ProviderConfigurationError, ProviderHealthTracker, ProviderUnavailableError,
+    is_rate_limit_error, retry_after_seconds
+)
+from hedging import HedgeStats, HedgedCallError, hedged_call
+from stats import StatsAggregator, format_duration
+from conversation_store import ConversationStore
+from document_store import DocumentStore
+from persistence import SQLitePersistence
+from uploads import (
+    MultipartUploadParser, StoredFile, UploadError, UploadLock, UploadTooLargeError,
+    multipart_boundary
+)
+from provider_limits import ProviderConcurrencyLimiter
+from document_analysis import AnalysisPipeline, DocumentTextError, extract_text
+from jobs import Job, JobQueue, JobQueueFullError
+from analysis_cache import AnalysisCache, make_analysis_key
+from search_index import BM25Index
+from near_duplicates import LSHIndex, MinHasher, clause_diff
+from context_window import ContextWindow, estimate_tokens, message_tokens
+from rate_limits import ProviderRateLimiter, RateLimitExceededError
+from metrics import SIZE_BUCKETS, CountingWriter, MetricsRegistry
+from profiling import RequestProfiler
+from http_encoding import (
+    JSON_BACKEND, SUPPORTED_ENCODINGS, compress, decode_json, encode_json, is_compressible,
+    negotiate_encoding
+)
+
+# Dashboard counters, updated as messages and documents are recorded
+stats_aggregator = StatsAggregator()
+
+# Prometheus metrics for HTTP routes and upstream provider calls, served on /api/metrics
+METRICS_ENABLED = os.getenv('ENABLE_METRICS', 'true').lower() in ('1', 'true', 'yes')
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', 'HTTP requests handled', ('method', 'route', 'status'))
+metrics.histogram('http_request_duration_seconds', 'Time spent handling an HTTP request',
+                  ('method', 'route', 'status'))
+metrics.gauge('http_requests_in_flight', 'HTTP requests currently being handled', ('route',))
+metrics.histogram('http_request_size_bytes', 'HTTP request body size', ('route',), SIZE_BUCKETS)
+metrics.histogram('http_response_size_bytes', 'HTTP response size including headers', ('route',),
+                  SIZE_BUCKETS)
+metrics.counter('provider_requests_total', 'Upstream LLM calls by outcome',
+                ('provider', 'model', 'outcome'))
+metrics.histogram('provider_request_duration_seconds', 'Upstream LLM call latency',
+                  ('provider', 'model', 'outcome'))
+
+# Token for the /api/admin endpoints and per-request profiling; admin access is off when unset
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Slow-request profiler: every request with PROFILE_REQUESTS, or one sent with an X-Profile header
+request_profiler = RequestProfiler(
+    enabled=os.getenv('PROFILE_REQUESTS', 'false').lower() in ('1', 'true', 'yes'),
+    threshold_ms=float(os.getenv('PROFILE_THRESHOLD_MS', '1000')),
+    capacity=int(os.getenv('PROFILE_BUFFER_SIZE', '20'))
+)
+
+# Durable SQLite storage behind chat history and documents (set SQLITE_PATH= to disable)
+SQLITE_PATH = os.getenv(
+    'SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'lawyer_bot.db')
+)
+persistence = None
+if SHARED_STATE and not SQLITE_PATH:
+    logger.error(
+        "--workers needs SQLITE_PATH: worker processes share chat history and documents through it"
+    )
+    sys.exit(EXIT_CONFIG)
+if SQLITE_PATH:
+    persistence = SQLitePersistence(
+        SQLITE_PATH,
+        batch_size=int(os.getenv('PERSISTENCE_BATCH_SIZE', 256)),
+        batch_interval=float(os.getenv('PERSISTENCE_BATCH_INTERVAL_MS', 50)) / 1000.0,
+        # Other workers read the database directly, so writes cannot wait in this process
+        write_behind=not SHARED_STATE
+    )
+    # Flush acknowledged writes even if the process exits without run_server's cleanup
+    atexit.register(persistence.close)
+    if SHARED_STATE:
+        # Each worker only sees its own requests; dashboard totals come from the database
+        stats_aggregator.use_shared_source(
+            persistence.activity, ttl=float(os.getenv('DASHBOARD_CACHE_SECONDS', 2))
+        )
+    else:
+        stats_aggregator.seed(persistence.summary())
+
+# Bounded in-memory store for chat history, warm-loaded from SQLite per user
+chat_history = ConversationStore(
+    max_messages_per_user=int(os.getenv('CHAT_HISTORY_MAX_MESSAGES', 200)),
+    max_bytes=int(os.getenv('CHAT_HISTORY_MAX_BYTES', 64 * 1024 * 1024)),
+    idle_ttl=float(os.getenv('CHAT_HISTORY_IDLE_TTL', 86400)) or None,
+    backend=persistence,
+    shared=SHARED_STATE
+)
+
+# Store for documents, loaded from SQLite on first access (reloaded when another worker changes one)
+documents_store = DocumentStore(
+    backend=persistence,
+    shared=SHARED_STATE,
+    on_reload=lambda added, removed: _on_documents_reloaded(added, removed)
+)
+
+# Uploaded files are streamed to a content-addressed directory instead of memory
+UPLOAD_DIR = os.getenv(
+    'UPLOAD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'uploads')
+)
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 50 * 1024 * 1024))
+# Allowance for form fields and multipart framing on top of the file itself
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+upload_parser = MultipartUploadParser(
+    UPLOAD_DIR,
+    max_file_size=UPLOAD_MAX_SIZE,
+    chunk_size=int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024)),
+    allowed_extensions=[
+        ext for ext in os.getenv('ALLOWED_FILE_TYPES', 'pdf,docx,doc,txt,md').split(',')
+        if ext.strip()
+    ]
+)
+# Identical uploads share a file; storing one and deleting an unreferenced one take turns,
+# across workers too
+upload_lock = UploadLock(os.path.join(UPLOAD_DIR, '.lock') if SHARED_STATE else None)
+
+# Provider context is packed into a per-provider token budget; older turns are
+# folded into a rolling summary that is refreshed in the background
+CONTEXT_MAX_MESSAGES = int(os.getenv('CONTEXT_MAX_MESSAGES', 100))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000))
+context_window = ContextWindow(
+    budgets={
+        name: int(os.getenv(f'{name.upper()}_CONTEXT_TOKENS'))
+        for name in ('openai', 'gemini', 'mistral') if os.getenv(f'{name.upper()}_CONTEXT_TOKENS')
+    },
+    default_budget=CONTEXT_TOKEN_BUDGET,
+    summarize=lambda previous, turns, api_keys: _summarize_turns(previous, turns, api_keys),
+    executor=ThreadPoolExecutor(max_workers=2, thread_name_prefix='summarizer'),
+    summary_tokens=int(os.getenv('CONTEXT_SUMMARY_TOKENS', 300)),
+    refresh_after=int(os.getenv('CONTEXT_SUMMARY_REFRESH_TURNS', 6))
+)
+
+# Pagination limits for history and document listings
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+
+# Distinguishes ETags minted by this run from those of earlier runs; the supervisor hands
+# every worker the same epoch so an ETag validates on whichever worker gets the request
+ETAG_EPOCH = os.getenv('ETAG_EPOCH') or uuid.uuid4().hex[:8]
+
+def _page_tag(cursor: Optional[str], limit: Optional[int]) -> str:
+    """Compact, header-safe token identifying a page request within an ETag"""
+    return format(zlib.crc32(f"{cursor or ''}|{limit or ''}".encode('utf-8')), '08x')
+
+# Shared cache of provider completions for repeated questions
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('MAX_CACHE_SIZE', 1000)),
+    ttl=float(os.getenv('CACHE_TTL', 300)),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+)
+
+# Rolling latency/error statistics and circuit breakers used for routing
+provider_health = ProviderHealthTracker(
+    alpha=float(os.getenv('PROVIDER_EWMA_ALPHA', 0.2)),
+    failure_threshold=int(os.getenv('PROVIDER_FAILURE_THRESHOLD', 3)),
+    cooldown=float(os.getenv('PROVIDER_COOLDOWN_SECONDS', 30)),
+    penalty_half_life=float(os.getenv('PROVIDER_PENALTY_HALF_LIFE_SECONDS', 60))
+)
+
+def _worker_share(limit: int) -> int:
+    """A process-wide limit split across the worker processes (0 stays unlimited)"""
+    return math.ceil(limit / WORKER_COUNT) if limit > 0 else limit
+
+# Client-side request and token budgets per provider (0 = unlimited). Calls over budget wait
+# in a bounded queue instead of going upstream; provider 429s pause and slow the budget.
+# Budgets are account-wide, so with --workers each worker gets an equal share
+rate_limiter = ProviderRateLimiter(
+    limits={
+        name: (_worker_share(int(os.getenv(f'{name.upper()}_RPM', os.getenv('PROVIDER_RPM', 0)))),
+               _worker_share(int(os.getenv(f'{name.upper()}_TPM', os.getenv('PROVIDER_TPM', 0)))))
+        for name in ('openai', 'gemini', 'mistral')
+    },
+    default_rpm=_worker_share(int(os.getenv('PROVIDER_RPM', 0))),
+    default_tpm=_worker_share(int(os.getenv('PROVIDER_TPM', 0))),
+    max_queue=int(os.getenv('RATE_LIMIT_QUEUE_SIZE', 64)),
+    max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', 10))
+)
+# Output tokens reserved per call; matches the max_tokens sent to providers
+COMPLETION_TOKEN_ALLOWANCE = 500
+
+# Hedged requests: race the second-ranked provider against a slow primary
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY_MS', 3000)) / 1000.0
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY_MS', 250)) / 1000.0
+hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('HEDGE_MAX_WORKERS', 16)), thread_name_prefix='hedge'
+)
+hedge_stats = HedgeStats()
+
+# Caps concurrent calls per provider for fan-out work such as document analysis and chat batches
+# (shared out across worker processes like the rate budgets)
+provider_limiter = ProviderConcurrencyLimiter(
+    default_limit=_worker_share(int(os.getenv('PROVIDER_MAX_CONCURRENCY', 4))),
+    limits={
+        name: _worker_share(int(os.getenv(f'{name.upper()}_MAX_CONCURRENCY')))
+        for name in ('openai', 'gemini', 'mistral') if os.getenv(f'{name.upper()}_MAX_CONCURRENCY')
+    }
+)
+
+# Batch chat items run on this pool, shared by all batches
+BATCH_MAX_MESSAGES = int(os.getenv('BATCH_MAX_MESSAGES', 500))
+batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BATCH_MAX_WORKERS', 16)), thread_name_prefix='batch'
+)
+
+# Document analysis splits the text into chunks and analyzes them on this pool
+analysis_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ANALYSIS_MAX_WORKERS', 8)), thread_name_prefix='analysis'
+)
+analysis_pipeline = AnalysisPipeline(
+    complete=lambda provider, prompt, api_key: _call_provider(
+        provider, prompt, [{"role": "user", "content": prompt}], api_key
+    ),
+    executor=analysis_executor,
+    limiter=provider_limiter,
+    chunk_chars=int(os.getenv('ANALYSIS_CHUNK_CHARS', 6000)),
+    overlap_chars=int(os.getenv('ANALYSIS_CHUNK_OVERLAP', 600))
+)
+
+# Results keyed by upload content hash, so re-uploaded templates are analyzed once
+analysis_cache = AnalysisCache(
+    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 1000)), backend=persistence
+)
+
+# Passages from uploaded documents retrieved to ground chat answers
+search_index = BM25Index(passage_chars=int(os.getenv('RETRIEVAL_PASSAGE_CHARS', 800)))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 3))
+# Passages must score at least this much and share this many distinct terms with the question
+RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', 1.0))
+RETRIEVAL_MIN_TERMS = int(os.getenv('RETRIEVAL_MIN_TERMS', 2))
+# A single thread applies index updates in order, off the request threads
+indexing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='indexer')
+
+# MinHash signatures of uploads, banded into an LSH index to find edited versions of a document
+min_hasher = MinHasher(
+    num_perm=128, max_shingles=int(os.getenv('NEAR_DUPLICATE_MAX_SHINGLES', 8192))
+)
+near_duplicate_index = LSHIndex(num_perm=128, bands=16)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))
+
+# Analyses run as background jobs so /analyze can answer 202 immediately
+analysis_jobs = JobQueue(
+    max_workers=int(os.getenv('ANALYSIS_JOB_WORKERS', 2)),
+    max_pending=int(os.getenv('ANALYSIS_JOB_QUEUE_SIZE', 32))
+)
+
+# Document status shown in listings for each analysis job state
+DOCUMENT_STATUS_FOR_JOB = {
+    'queued': 'queued',
+    'running': 'processing',
+    'done': 'analyzed',
+    'failed': 'failed'
+}
 
 # Check if any LLM API keys are configured
 openai_key = os.getenv("OPENAI_API_KEY", "")
 gemini_key = os.getenv("GEMINI_API_KEY", "")
 mistral_key = os.getenv("MISTRAL_API_KEY", "")
 
-# Initialize available providers list
+# Providers with a key and an installed SDK. The SDKs themselves are imported
+# when their first client is built (or by the warm-up after the server starts)
 available_providers = []
-if openai_key:
-    available_providers.append("openai")
-if gemini_key:
-    available_providers.append("gemini")
-if mistral_key:
-    available_providers.append("mistral")
-
-# Initialize API clients
-openai_client = None
-gemini_model = None
-mistral_client = None
-
-# Try to initialize OpenAI client
-if openai_key:
-    try:
-        import openai
-        openai_client = openai.OpenAI(api_key=openai_key)
-        logger.info("OpenAI client initialized successfully")
-    except ImportError:
-        logger.warning("OpenAI library not installed. Install with: pip install openai")
-        available_providers.remove("openai")
-
-# Try to initialize Gemini client
-if gemini_key:
-    try:
-        import google.generativeai as genai
-        genai.configure(api_key=gemini_key)
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash')
-        logger.info("Gemini client initialized successfully")
-    except ImportError:
-        logger.warning("Google Generative AI library not installed. Install with: pip install google-generativeai")
-        available_providers.remove("gemini")
-
-# Try to initialize Mistral client
-if mistral_key:
-    try:
-        from mistralai.client import MistralClient
-        mistral_client = MistralClient(api_key=mistral_key)
-        logger.info("Mistral client initialized successfully")
-    except ImportError:
-        logger.warning("Mistral AI library not installed. Install with: pip install mistralai")
-        available_providers.remove("mistral")
+for _name, _key, _package in (("openai", openai_key, "openai"),
+                              ("gemini", gemini_key, "google-generativeai"),
+                              ("mistral", mistral_key, "mistralai")):
+    if not _key:
+        continue
+    if sdk_installed(_name):
+        available_providers.append(_name)
+    else:
+        logger.warning(f"{_package} library not installed. Install with: pip install {_package}")
 
 # Log available providers
 if available_providers:
@@ -113,25 +384,85 @@ if available_providers:
 else:
     logger.info("No LLM providers available. Will use rule-based fallback.")
 
-def call_openai_api(message: str, conversation_history: List[Dict], api_key: str = None) -> str:
-    """Call OpenAI API with conversation history"""
-    # Use provided API key or fall back to environment/global client
-    if api_key:
-        import openai
-        client = openai.OpenAI(api_key=api_key)
-    elif openai_client:
-        client = openai_client
-    else:
-        raise Exception("OpenAI API key not provided and no default client available")
+PROVIDER_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "gemini": GEMINI_MODEL_NAME,
+    "mistral": "mistral-tiny"
+}
+
+def _get_openai_client(api_key: str = None):
+    """Use provided API key or fall back to the environment key; the SDK loads on first use"""
+    if api_key or openai_key:
+        return client_registry.get("openai", api_key or openai_key)
+    raise ProviderConfigurationError("OpenAI API key not provided and no default client available")
+
+def _get_gemini_model(api_key: str = None):
+    """Use provided API key or fall back to the environment key; the SDK loads on first use"""
+    if api_key or gemini_key:
+        return client_registry.get("gemini", api_key or gemini_key)
+    raise ProviderConfigurationError("Gemini API key not provided and no default model available")
+
+def _get_mistral_client(api_key: str = None):
+    """Use provided API key or fall back to the environment key; the SDK loads on first use"""
+    if api_key or mistral_key:
+        return client_registry.get("mistral", api_key or mistral_key)
+    raise ProviderConfigurationError("Mistral API key not provided and no default client available")
+
+def _split_summary(conversation_history: List[Dict]):
+    """Separate the context window's rolling summary, a leading system entry, from the turns"""
+    if conversation_history and conversation_history[0]["role"] == "system":
+        return "\n\n" + conversation_history[0]["content"], conversation_history[1:]
+    return "", conversation_history
+
+def _build_openai_messages(conversation_history: List[Dict]) -> List[Dict]:
+    summary, turns = _split_summary(conversation_history)
+    messages = [
+        {"role": "system", "content": (
+            "You are a legal assistant bot that provides information about legal matters. "
+            "Focus on providing accurate, helpful legal information while making it clear you are "
+            "not providing legal advice. Include relevant legal concepts, principles, and "
+            "considerations in your responses. Be informative but cautious." + summary
+        )}
+    ]
+    # Context already fitted to the token budget, without bookkeeping fields such as provider
+    messages.extend({"role": msg["role"], "content": msg["content"]} for msg in turns)
+    return messages
+
+def _build_gemini_prompt(conversation_history: List[Dict]) -> str:
+    # Format conversation for Gemini
+    summary, turns = _split_summary(conversation_history)
+    context = (
+        "You are a legal assistant bot that provides information about legal matters. "
+        "Focus on providing accurate, helpful legal information while making it clear you are "
+        "not providing legal advice." + summary + "\n\n"
+    )
+    for msg in turns:
+        context += f"{msg['role']}: {msg['content']}\n"
+    return context
+
+def _build_mistral_messages(conversation_history: List[Dict]) -> List[Any]:
+    from mistralai.models.chat_completion import ChatMessage
     
+    summary, turns = _split_summary(conversation_history)
     messages = [
-        {"role": "system", "content": "You are a legal assistant bot that provides information about legal matters. Focus on providing accurate, helpful legal information while making it clear you are not providing legal advice. Include relevant legal concepts, principles, and considerations in your responses. Be informative but cautious."}
+        ChatMessage(role="system", content=(
+            "You are a legal assistant bot that provides information about legal matters. "
+            "Focus on providing accurate, helpful legal information while making it clear you are "
+            "not providing legal advice. Include relevant legal concepts, principles, and "
+            "considerations in your responses. Be informative but cautious." + summary
+        ))
     ]
-    messages.extend(conversation_history[-10:])  # Last 10 messages for context
     
+    for msg in turns:
+        messages.append(ChatMessage(role=msg['role'], content=msg['content']))
+    return messages
+
+def call_openai_api(message: str, conversation_history: List[Dict], api_key: str = None) -> str:
+    """Call OpenAI API with conversation history"""
+    client = _get_openai_client(api_key)
     response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages,
+        model=PROVIDER_MODELS["openai"],
+        messages=_build_openai_messages(conversation_history),
         max_tokens=500,
         temperature=0.7
     )
@@ -139,54 +470,89 @@ def call_openai_api(message: str, conversation_history: List[Dict], api_key: str
 
 def call_gemini_api(message: str, conversation_history: List[Dict], api_key: str = None) -> str:
     """Call Gemini API with conversation history"""
-    # Use provided API key or fall back to environment/global model
-    if api_key:
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-    elif gemini_model:
-        model = gemini_model
-    else:
-        raise Exception("Gemini API key not provided and no default model available")
-    
-    # Format conversation for Gemini
-    context = "You are a legal assistant bot that provides information about legal matters. Focus on providing accurate, helpful legal information while making it clear you are not providing legal advice.\n\n"
-    for msg in conversation_history[-10:]:
-        context += f"{msg['role']}: {msg['content']}\n"
-    
-    response = model.generate_content(context)
+    model = _get_gemini_model(api_key)
+    response = model.generate_content(_build_gemini_prompt(conversation_history))
     return response.text
 
 def call_mistral_api(message: str, conversation_history: List[Dict], api_key: str = None) -> str:
     """Call Mistral API with conversation history"""
-    # Use provided API key or fall back to environment/global client
-    if api_key:
-        from mistralai.client import MistralClient
-        client = MistralClient(api_key=api_key)
-    elif mistral_client:
-        client = mistral_client
-    else:
-        raise Exception("Mistral API key not provided and no default client available")
-    
-    from mistralai.models.chat_completion import ChatMessage
-    
-    messages = [
-        ChatMessage(role="system", content="You are a legal assistant bot that provides information about legal matters. Focus on providing accurate, helpful legal information while making it clear you are not providing legal advice. Include relevant legal concepts, principles, and considerations in your responses. Be informative but cautious.")
-    ]
-    
-    for msg in conversation_history[-10:]:
-        messages.append(ChatMessage(role=msg['role'], content=msg['content']))
-    
+    client = _get_mistral_client(api_key)
     response = client.chat(
-        model="mistral-tiny",
-        messages=messages,
+        model=PROVIDER_MODELS["mistral"],
+        messages=_build_mistral_messages(conversation_history),
         max_tokens=500,
         temperature=0.7
     )
     return response.choices[0].message.content
 
-def select_best_provider(message: str, api_keys: Dict[str, str] = None, user_history: List[Dict] = None) -> str:
-    """Automatically select the best provider based on message content and context"""
+def stream_openai_api(message: str, conversation_history: List[Dict],
+                      api_key: str = None) -> Iterator[str]:
+    """Stream an OpenAI completion, yielding text deltas as they arrive"""
+    client = _get_openai_client(api_key)
+    stream = client.chat.completions.create(
+        model=PROVIDER_MODELS["openai"],
+        messages=_build_openai_messages(conversation_history),
+        max_tokens=500,
+        temperature=0.7,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def stream_gemini_api(message: str, conversation_history: List[Dict],
+                      api_key: str = None) -> Iterator[str]:
+    """Stream a Gemini completion, yielding text deltas as they arrive"""
+    model = _get_gemini_model(api_key)
+    for chunk in model.generate_content(_build_gemini_prompt(conversation_history), stream=True):
+        if chunk.text:
+            yield chunk.text
+
+def stream_mistral_api(message: str, conversation_history: List[Dict],
+                       api_key: str = None) -> Iterator[str]:
+    """Stream a Mistral completion, yielding text deltas as they arrive"""
+    client = _get_mistral_client(api_key)
+    stream = client.chat_stream(
+        model=PROVIDER_MODELS["mistral"],
+        messages=_build_mistral_messages(conversation_history),
+        max_tokens=500,
+        temperature=0.7
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+PROVIDER_CALLS = {
+    "openai": call_openai_api,
+    "gemini": call_gemini_api,
+    "mistral": call_mistral_api
+}
+
+PROVIDER_STREAMS = {
+    "openai": stream_openai_api,
+    "gemini": stream_gemini_api,
+    "mistral": stream_mistral_api
+}
+
+PROVIDER_CONFIDENCE = {
+    "openai": 0.95,
+    "gemini": 0.9,
+    "mistral": 0.85
+}
+
+DISCLAIMER = (
+    "\n\nDisclaimer: This information is for general guidance only and does not constitute "
+    "legal advice."
+)
+
+def rank_providers(message: str, api_keys: Dict[str, str] = None,
+                   user_history: List[Dict] = None) -> List[str]:
+    """Rank available providers from best to worst for this message.
+
+    Content heuristics give each provider a base score, which is then reduced
+    by its live latency and error rate. Providers whose circuit breaker is open
+    are ranked last.
+    """
     if api_keys is None:
         api_keys = {}
     
@@ -202,12 +568,9 @@ def select_best_provider(message: str, api_keys: Dict[str, str] = None, user_his
         if has_key:
             available.append(provider)
     
-    if not available:
-        return None
-    
-    # If only one provider available, use it
-    if len(available) == 1:
-        return available[0]
+    # If zero or one provider available, there is nothing to rank
+    if len(available) <= 1:
+        return available
     
     # Score providers based on message characteristics
     scores = {}
@@ -227,28 +590,32 @@ def select_best_provider(message: str, api_keys: Dict[str, str] = None, user_his
         # Adjust scores based on message content
         
         # Legal document analysis - OpenAI tends to be more thorough
-        if any(term in message_lower for term in ['contract', 'legal', 'document', 'analyze', 'review', 'clause']):
+        legal_terms = ['contract', 'legal', 'document', 'analyze', 'review', 'clause']
+        if any(term in message_lower for term in legal_terms):
             if provider == "openai":
                 score += 15
             elif provider == "gemini":
                 score += 10
         
         # Complex reasoning tasks - Gemini excels here
-        if any(term in message_lower for term in ['explain', 'compare', 'analyze', 'reasoning', 'logic', 'complex']):
+        reasoning_terms = ['explain', 'compare', 'analyze', 'reasoning', 'logic', 'complex']
+        if any(term in message_lower for term in reasoning_terms):
             if provider == "gemini":
                 score += 15
             elif provider == "openai":
                 score += 10
         
         # Quick questions - Mistral is faster
-        if len(message.split()) < 10 and any(term in message_lower for term in ['what', 'how', 'when', 'where', 'who']):
+        question_terms = ['what', 'how', 'when', 'where', 'who']
+        if len(message.split()) < 10 and any(term in message_lower for term in question_terms):
             if provider == "mistral":
                 score += 15
             elif provider == "openai":
                 score += 5
         
         # Code-related queries - Gemini handles code well
-        if any(term in message_lower for term in ['code', 'programming', 'function', 'algorithm', 'debug']):
+        code_terms = ['code', 'programming', 'function', 'algorithm', 'debug']
+        if any(term in message_lower for term in code_terms):
             if provider == "gemini":
                 score += 12
             elif provider == "openai":
@@ -268,115 +635,945 @@ def select_best_provider(message: str, api_keys: Dict[str, str] = None, user_his
             elif provider == "gemini":
                 score += 8
         
-        scores[provider] = score
-    
-    # Return the provider with the highest score
-    best_provider = max(scores.items(), key=lambda x: x[1])[0]
-    logger.info(f"Auto-selected provider: {best_provider} (scores: {scores})")
-    return best_provider
-
-def process_message(message: str, user_id: str = "user123", provider: Optional[str] = None, api_keys: Dict[str, str] = None) -> Dict[str, Any]:
-    """Process a message using the specified LLM provider"""
-    # Initialize conversation history for this user if it doesn't exist
-    if user_id not in chat_history:
-        chat_history[user_id] = []
-
-    # Add the message to the conversation history
-    chat_history[user_id].append({
-        "role": "user",
-        "content": message
-    })
-    
-    # Initialize api_keys if not provided
-    if api_keys is None:
-        api_keys = {}
+        # Live health: slow or failing providers lose points, open circuits go last
+        score -= provider_health.score_penalty(provider)
+        if not provider_health.is_available(provider):
+            score -= 1000
+
+        scores[provider] = round(score, 1)
     
-    # Determine which provider to use
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    logger.info(f"Ranked providers: {ranked} (scores: {scores})")
+    return ranked
+
+def select_best_provider(message: str, api_keys: Dict[str, str] = None,
+                         user_history: List[Dict] = None) -> Optional[str]:
+    """Automatically select the best provider based on message content, context and live health"""
+    ranked = rank_providers(message, api_keys, user_history)
+    return ranked[0] if ranked else None
+
+def _record_user_message(message: str, user_id: str, store: bool = True):
+    # Add the message to the conversation history (created on first use). Dashboard totals
+    # count stored messages only, which is all the shared-database dashboard can see
+    if store:
+        chat_history.append(user_id, "user", message)
+        stats_aggregator.record_user_message(user_id)
+
+def _candidate_providers(message: str, user_id: str, provider: Optional[str],
+                         api_keys: Dict[str, str]) -> List[str]:
+    """Return providers to try in order: the requested one if it has a key, then the ranked rest"""
+    ranked = rank_providers(message, api_keys, chat_history.get(user_id, []))
     if provider and provider != "auto":
         # Check if we have API key for requested provider (either from request or environment)
         has_api_key = (
-            (api_keys.get(provider) and api_keys.get(provider).strip()) or 
+            (api_keys.get(provider) and api_keys.get(provider).strip()) or
             (provider == "openai" and openai_key) or
             (provider == "gemini" and gemini_key) or
             (provider == "mistral" and mistral_key)
         )
         if has_api_key:
-            provider_used = provider
-        else:
-            # Requested provider not available, auto-select best available
-            provider_used = select_best_provider(message, api_keys, chat_history.get(user_id, []))
+            return [provider] + [p for p in ranked if p != provider]
+        # Requested provider not available, auto-select best available
+    return ranked
+
+def _admit(provider_used: str, history: List[Dict]) -> int:
+    """Wait for the provider's rate budget and check its circuit breaker.
+
+    Returns the completion tokens reserved, which is less than COMPLETION_TOKEN_ALLOWANCE
+    when the provider's tokens per minute capped the reservation.
+    Raises RateLimitExceededError or ProviderUnavailableError without contacting the provider.
+    """
+    if not provider_health.is_available(provider_used):
+        raise ProviderUnavailableError(
+            f"{provider_used} is temporarily unavailable after repeated failures"
+        )
+    prompt_tokens = sum(message_tokens(msg) for msg in history)
+    reserved = rate_limiter.acquire(provider_used, prompt_tokens + COMPLETION_TOKEN_ALLOWANCE)
+    if not provider_health.acquire(provider_used):
+        # Another request holds the half-open probe; nothing is sent, so give the budget back
+        rate_limiter.refund(provider_used, reserved, requests=1)
+        raise ProviderUnavailableError(
+            f"{provider_used} is temporarily unavailable after repeated failures"
+        )
+    return max(reserved - prompt_tokens, 0)
+
+def _refund_completion(provider_used: str, allowance: int, completion: str,
+                       error: Optional[Exception] = None):
+    """Return the part of the reserved completion ``allowance`` the call did not use"""
+    if error is not None and is_rate_limit_error(error):
+        # throttle() has just drained the budget on purpose
+        return
+    rate_limiter.refund(provider_used, allowance - estimate_tokens(completion))
+
+def _observe_provider_call(provider_used: str, started: float, outcome: str):
+    labels = (provider_used, PROVIDER_MODELS.get(provider_used, ''), outcome)
+    metrics.inc('provider_requests_total', labels)
+    metrics.observe('provider_request_duration_seconds', labels, time.monotonic() - started)
+
+def _record_provider_failure(provider_used: str, started: float, error: Exception):
+    provider_health.record_failure(provider_used, time.monotonic() - started, error)
+    if is_rate_limit_error(error):
+        rate_limiter.throttle(provider_used, retry_after_seconds(error))
+        _observe_provider_call(provider_used, started, 'rate_limited')
     else:
-        # Auto-select the best provider based on message content and context
-        provider_used = select_best_provider(message, api_keys, chat_history.get(user_id, []))
-    
-    if not provider_used:
-        # No API available - return error message asking user to configure API keys
-        error_response = {
-            "message": "No API keys are configured. Please configure your API keys in the Settings page or in the .env file:\n\n" +
-                      "Available providers: OpenAI, Gemini, Mistral\n\n" +
-                      "Go to Settings → API Key Settings to configure your keys.",
-            "provider": "none",
+        _observe_provider_call(provider_used, started, 'error')
+
+def _call_provider(provider_used: str, message: str, history: List[Dict],
+                   api_key: Optional[str]) -> str:
+    """Call a provider through its rate limiter and circuit breaker, recording latency, outcome"""
+    if provider_used not in PROVIDER_CALLS:
+        raise Exception(f"Unknown provider: {provider_used}")
+    allowance = _admit(provider_used, history)
+
+    started = time.monotonic()
+    try:
+        response = PROVIDER_CALLS[provider_used](message, history, api_key)
+    except Exception as e:
+        _record_provider_failure(provider_used, started, e)
+        _refund_completion(provider_used, allowance, '', e)
+        raise
+    provider_health.record_success(provider_used, time.monotonic() - started)
+    _observe_provider_call(provider_used, started, 'success')
+    _refund_completion(provider_used, allowance, response)
+    return response
+
+def _stream_provider(provider_used: str, message: str, history: List[Dict],
+                     api_key: Optional[str]) -> Iterator[str]:
+    """Streaming counterpart of _call_provider; the outcome is recorded when the stream ends"""
+    if provider_used not in PROVIDER_STREAMS:
+        raise Exception(f"Unknown provider: {provider_used}")
+    allowance = _admit(provider_used, history)
+
+    started = time.monotonic()
+    recorded = False
+    streamed = []
+    try:
+        for token in PROVIDER_STREAMS[provider_used](message, history, api_key):
+            streamed.append(token)
+            yield token
+    except Exception as e:
+        recorded = True
+        _record_provider_failure(provider_used, started, e)
+        _refund_completion(provider_used, allowance, ''.join(streamed), e)
+        raise
+    else:
+        recorded = True
+        provider_health.record_success(provider_used, time.monotonic() - started)
+        _observe_provider_call(provider_used, started, 'success')
+        _refund_completion(provider_used, allowance, ''.join(streamed))
+    finally:
+        if not recorded:
+            # The client went away mid-stream; free the probe slot without judging the provider
+            provider_health.release(provider_used)
+            _refund_completion(provider_used, allowance, ''.join(streamed))
+
+def _combined_error(errors: List[tuple]) -> Exception:
+    if len(errors) == 1:
+        return errors[0][1]
+    return Exception("; ".join(f"{p}: {e}" for p, e in errors))
+
+def _failure_response(errors: List[tuple]) -> Dict[str, Any]:
+    """Error payload once every candidate provider has failed"""
+    if all(isinstance(e, RateLimitExceededError) or is_rate_limit_error(e) for _, e in errors):
+        retry_after = min(
+            getattr(e, 'retry_after', None) or retry_after_seconds(e)
+            or rate_limiter.default_retry_after
+            for _, e in errors
+        )
+        logger.warning(f"All providers over their rate limits: {_combined_error(errors)}")
+        return {
+            "message": "All available AI providers are at their rate limits. "
+                       "Please try again in a few seconds.",
+            "provider": errors[0][0],
             "confidence": 0.0,
             "sources": [],
-            "error": "no_api_keys"
+            "error": "rate_limited",
+            "retry_after": max(1, math.ceil(retry_after))
         }
-        return error_response
+    return _api_error_response(errors[0][0], _combined_error(errors))
 
-    try:
-        # Get the API key for the selected provider
-        selected_api_key = api_keys.get(provider_used)
-        
-        # Call the appropriate API
-        if provider_used == "openai":
-            response = call_openai_api(message, chat_history[user_id], selected_api_key)
-            confidence = 0.95
-        elif provider_used == "gemini":
-            response = call_gemini_api(message, chat_history[user_id], selected_api_key)
-            confidence = 0.9
-        elif provider_used == "mistral":
-            response = call_mistral_api(message, chat_history[user_id], selected_api_key)
-            confidence = 0.85
+def _no_api_keys_response() -> Dict[str, Any]:
+    # No API available - return error message asking user to configure API keys
+    return {
+        "message": "No API keys are configured. "
+                   "Please configure your API keys in the Settings page or in the .env file:\n\n" +
+                  "Available providers: OpenAI, Gemini, Mistral\n\n" +
+                  "Go to Settings → API Key Settings to configure your keys.",
+        "provider": "none",
+        "confidence": 0.0,
+        "sources": [],
+        "error": "no_api_keys"
+    }
+
+def _api_error_response(provider_used: str, error: Exception) -> Dict[str, Any]:
+    logger.error(f"Error calling {provider_used} API: {str(error)}")
+
+    # Return specific error message asking user to check API configuration
+    error_message = f"Failed to get response from {provider_used} API. Please check:\n\n" +\
+                   f"1. Your {provider_used} API key is correctly configured in Settings\n" +\
+                   f"2. The API key is valid and has sufficient credits\n" +\
+                   f"3. Required libraries are installed\n\n" +\
+                   f"Error details: {str(error)}"
+
+    return {
+        "message": error_message,
+        "provider": provider_used,
+        "confidence": 0.0,
+        "sources": [],
+        "error": "api_call_failed"
+    }
+
+def _record_assistant_message(user_id: str, response: str, provider_used: str,
+                              hedge: Optional[Dict[str, Any]] = None, store: bool = True) -> str:
+    """Append the disclaimer if missing, store the reply and return its final text"""
+    if "disclaimer" not in response.lower():
+        response += DISCLAIMER
+
+    if store:
+        chat_history.append(
+            user_id, "assistant", response, provider_used, {"hedge": hedge} if hedge else None
+        )
+        stats_aggregator.record_assistant_message(user_id, provider_used)
+    return response
+
+def _hedge_delay(provider_used: str) -> float:
+    """Wait this long for the primary before firing the backup request"""
+    delay = provider_health.latency_percentile(provider_used, HEDGE_PERCENTILE)
+    if delay is None:
+        delay = HEDGE_DEFAULT_DELAY
+    return max(delay, HEDGE_MIN_DELAY)
+
+def _hedged_completion(primary: str, backup: str, message: str,
+                       context: Callable[[str], List[Dict]], api_keys: Dict[str, str],
+                       call: Callable[..., str] = _call_provider):
+    """Answer from the cache or from whichever of primary/backup responds first.
+
+    ``context(provider)`` returns the history fitted to that provider's budget.
+    Returns ``(response, provider_used, cache_status, hedge_info)``.
+    """
+    histories = {primary: context(primary), backup: context(backup)}
+    cache_key = make_cache_key(
+        primary, PROVIDER_MODELS.get(primary, ""), message, histories[primary][:-1]
+    )
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached, primary, "hit", None
+
+    delay = _hedge_delay(primary)
+    role, winner, response, backup_fired = hedged_call(
+        hedge_executor,
+        (primary, lambda: call(primary, message, histories[primary], api_keys.get(primary))),
+        (backup, lambda: call(backup, message, histories[backup], api_keys.get(backup))),
+        delay,
+        hedge_stats
+    )
+    response_cache.set(
+        make_cache_key(winner, PROVIDER_MODELS.get(winner, ""), message, histories[winner][:-1]),
+        response
+    )
+    if backup_fired:
+        logger.info(
+            f"Hedged request won by {role} provider {winner} "
+            f"(primary {primary}, delay {delay:.2f}s)"
+        )
+
+    hedge_info = {
+        "primary": primary,
+        "backup": backup,
+        "winner": winner,
+        "backup_fired": backup_fired,
+        "delay_ms": round(delay * 1000)
+    }
+    return response, winner, "miss", hedge_info
+
+def _grounded_prompt(message: str, history: List[Dict]):
+    """Prepend the best-matching passages from uploaded documents to the user's latest message.
+
+    Returns ``(prompt, history, sources)``; the provider sees the prompt in
+    place of the last history entry, while the stored conversation keeps the
+    original message.
+    """
+    if RETRIEVAL_TOP_K > 0:
+        # Index uploads other workers made since this one last looked
+        documents_store.refresh()
+    passages = []
+    if RETRIEVAL_TOP_K > 0:
+        passages = search_index.search(
+            message, RETRIEVAL_TOP_K, RETRIEVAL_MIN_SCORE, RETRIEVAL_MIN_TERMS
+        )
+    if not passages or not history or history[-1]["role"] != "user":
+        return message, history, []
+
+    excerpts = "\n\n".join(
+        f"[{i + 1}] {p['title']}:\n{p['passage']}" for i, p in enumerate(passages)
+    )
+    prompt = (
+        "Relevant excerpts from the user's uploaded documents:\n\n"
+        f"{excerpts}\n\n"
+        "Use these excerpts where they are relevant and cite them as [1], [2], etc.\n\n"
+        f"Question: {message}"
+    )
+    sources = [
+        {
+            "document_id": p["document_id"],
+            "title": p["title"],
+            "excerpt": p["passage"][:300],
+            "score": p["score"]
+        }
+        for p in passages
+    ]
+    return prompt, list(history[:-1]) + [{"role": "user", "content": prompt}], sources
+
+def _summarize_turns(previous: str, turns: List[Dict], api_keys: Dict[str, str]) -> Optional[str]:
+    """Fold older turns into a conversation's rolling summary with the best available provider.
+
+    Runs on the context window's background pool. Returns None when no
+    provider answers, in which case an extractive summary is used instead.
+    """
+    transcript = "\n".join(f"{msg['role']}: {msg['content'][:1000]}" for msg in turns)
+    prompt = (
+        "Update the summary of this legal assistance conversation with the new turns below. "
+        "Keep the parties, facts, dates, amounts and questions the user raised, "
+        "and the key points of the answers. "
+        f"Reply with the summary only, in at most {context_window.summary_tokens * 3 // 4} words."
+        "\n\n"
+        f"Current summary:\n{previous or '(none)'}\n\n"
+        f"New turns:\n{transcript}"
+    )
+    for provider_name in rank_providers(transcript[:2000], api_keys):
+        try:
+            return _call_provider(
+                provider_name, prompt, [{"role": "user", "content": prompt}],
+                api_keys.get(provider_name)
+            )
+        except Exception as e:
+            logger.warning(f"Summarizing with {provider_name} failed: {str(e)}")
+    return None
+
+def process_message(message: str, user_id: str = "user123", provider: Optional[str] = None,
+                    api_keys: Dict[str, str] = None, hedge: Optional[bool] = None,
+                    limiter: Optional[ProviderConcurrencyLimiter] = None,
+                    store: bool = True) -> Dict[str, Any]:
+    """Process a message using the specified LLM provider, failing over to the next-best one.
+
+    With hedging enabled (``hedge=True`` or HEDGE_REQUESTS), the first attempt
+    races the top two providers instead of calling only the best one. Provider
+    calls wait for a slot of ``limiter`` when one is given. With ``store=False``
+    the exchange is answered without conversation context and is not added to
+    the user's history.
+    """
+    _record_user_message(message, user_id, store)
+
+    # Initialize api_keys if not provided
+    if api_keys is None:
+        api_keys = {}
+
+    # Determine which providers to try, best first
+    with request_profiler.phase('route'):
+        candidates = _candidate_providers(message, user_id, provider, api_keys)
+    if not candidates:
+        return _no_api_keys_response()
+
+    hedge_enabled = (HEDGE_REQUESTS if hedge is None else bool(hedge)) and len(candidates) > 1
+    with request_profiler.phase('history'):
+        if store:
+            history = chat_history.recent(user_id, CONTEXT_MAX_MESSAGES)
         else:
-            raise Exception(f"Unknown provider: {provider_used}")
+            history = [{"role": "user", "content": message}]
+        prompt, history, sources = _grounded_prompt(message, history)
 
-        # Add disclaimer if not present
-        if "disclaimer" not in response.lower():
-            response += "\n\nDisclaimer: This information is for general guidance only and does not constitute legal advice."
+    def context(provider_name: str) -> List[Dict]:
+        with request_profiler.phase('history'):
+            return context_window.build(user_id, provider_name, history, api_keys)
 
-        # Add the response to conversation history
-        chat_history[user_id].append({
-            "role": "assistant",
-            "content": response,
-            "provider": provider_used
-        })
+    def call(provider_name: str, prompt_text: str, provider_history: List[Dict],
+             api_key: Optional[str]) -> str:
+        if limiter is None:
+            return _call_provider(provider_name, prompt_text, provider_history, api_key)
+        with limiter.slot(provider_name):
+            return _call_provider(provider_name, prompt_text, provider_history, api_key)
 
-        return {
+    errors = []
+    remaining = list(candidates)
+    while remaining:
+        provider_used = remaining.pop(0)
+        hedge_info = None
+        try:
+            with request_profiler.phase('provider'):
+                if hedge_enabled and not errors:
+                    backup = remaining.pop(0)
+                    response, provider_used, cache_status, hedge_info = _hedged_completion(
+                        provider_used, backup, prompt, context, api_keys, call
+                    )
+                else:
+                    # Call the appropriate API with the key for the selected provider, reusing a
+                    # cached or in-flight answer to the same prompt where possible
+                    provider_history = context(provider_used)
+                    cache_key = make_cache_key(
+                        provider_used, PROVIDER_MODELS.get(provider_used, ""), prompt,
+                        provider_history[:-1]
+                    )
+                    response, cache_status = response_cache.get_or_compute(
+                        cache_key,
+                        lambda: call(
+                            provider_used, prompt, provider_history, api_keys.get(provider_used)
+                        )
+                    )
+        except HedgedCallError as e:
+            logger.warning(
+                f"Hedged request failed on both providers, trying next provider: {str(e)}"
+            )
+            errors.extend(e.errors)
+            continue
+        except Exception as e:
+            logger.warning(f"{provider_used} failed, trying next provider: {str(e)}")
+            errors.append((provider_used, e))
+            continue
+
+        response = _record_assistant_message(user_id, response, provider_used, hedge_info, store)
+        result = {
             "message": response,
             "provider": provider_used,
-            "confidence": confidence,
-            "sources": []
+            "confidence": PROVIDER_CONFIDENCE[provider_used],
+            "sources": sources,
+            "cached": cache_status != "miss"
         }
+        if hedge_info:
+            result["hedge"] = hedge_info
+        if errors:
+            result["failed_over_from"] = [p for p, _ in errors]
+        return result
 
-    except Exception as e:
-        logger.error(f"Error calling {provider_used} API: {str(e)}")
-        
-        # Return specific error message asking user to check API configuration
-        error_message = f"Failed to get response from {provider_used} API. Please check:\n\n" +\
-                       f"1. Your {provider_used} API key is correctly configured in Settings\n" +\
-                       f"2. The API key is valid and has sufficient credits\n" +\
-                       f"3. Required libraries are installed\n\n" +\
-                       f"Error details: {str(e)}"
-        
-        return {
-            "message": error_message,
+    return _failure_response(errors)
+
+def stream_message(message: str, user_id: str = "user123", provider: Optional[str] = None,
+                   api_keys: Dict[str, str] = None) -> Iterator[Dict[str, Any]]:
+    """Process a message like process_message, yielding events as tokens arrive.
+
+    Yields a ``start`` event naming the provider, one ``token`` event per text
+    delta and a final ``done`` event carrying the same payload process_message
+    returns. A provider that fails before its first token is failed over like
+    in process_message; other failures end the stream with an ``error`` event.
+    """
+    _record_user_message(message, user_id)
+
+    if api_keys is None:
+        api_keys = {}
+
+    with request_profiler.phase('route'):
+        candidates = _candidate_providers(message, user_id, provider, api_keys)
+    if not candidates:
+        yield {"event": "error", "data": _no_api_keys_response()}
+        return
+
+    with request_profiler.phase('history'):
+        history = chat_history.recent(user_id, CONTEXT_MAX_MESSAGES)
+        prompt, history, sources = _grounded_prompt(message, history)
+    errors = []
+    for provider_used in candidates:
+        with request_profiler.phase('history'):
+            provider_history = context_window.build(user_id, provider_used, history, api_keys)
+        cache_key = make_cache_key(
+            provider_used, PROVIDER_MODELS.get(provider_used, ""), prompt, provider_history[:-1]
+        )
+        cached = response_cache.get(cache_key)
+
+        chunks = []
+        try:
+            if cached is not None:
+                yield {"event": "start", "data": {"provider": provider_used}}
+                chunks.append(cached)
+                yield {"event": "token", "data": {"content": cached}}
+            else:
+                tokens = _stream_provider(
+                    provider_used, prompt, provider_history, api_keys.get(provider_used)
+                )
+                for token in tokens:
+                    if not chunks:
+                        yield {"event": "start", "data": {"provider": provider_used}}
+                    chunks.append(token)
+                    yield {"event": "token", "data": {"content": token}}
+        except Exception as e:
+            if chunks:
+                # Tokens already reached the client, so the reply cannot be switched
+                yield {"event": "error", "data": _api_error_response(provider_used, e)}
+                return
+            logger.warning(f"{provider_used} failed, trying next provider: {str(e)}")
+            errors.append((provider_used, e))
+            continue
+
+        streamed = "".join(chunks)
+        if cached is None:
+            response_cache.set(cache_key, streamed)
+        response = _record_assistant_message(user_id, streamed, provider_used)
+        if len(response) > len(streamed):
+            # Stream the disclaimer so the client's text matches the stored reply
+            yield {"event": "token", "data": {"content": response[len(streamed):]}}
+
+        result = {
+            "message": response,
             "provider": provider_used,
-            "confidence": 0.0,
-            "sources": [],
-            "error": "api_call_failed"
+            "confidence": PROVIDER_CONFIDENCE[provider_used],
+            "sources": sources,
+            "cached": cached is not None
         }
+        if errors:
+            result["failed_over_from"] = [p for p, _ in errors]
+        yield {"event": "done", "data": result}
+        return
+
+    yield {"event": "error", "data": _failure_response(errors)}
+
+def _batch_item(index: int, item: Any, user_id: str, provider: Optional[str],
+                api_keys: Dict[str, str]) -> Dict[str, Any]:
+    """Answer one batch item; failures are reported in its result rather than raised"""
+    if isinstance(item, str):
+        item = {"content": item}
+    result = {"index": index}
+    if isinstance(item, dict) and item.get("id") is not None:
+        result["id"] = item["id"]
+    content = item.get("content") if isinstance(item, dict) else None
+    if not content or not isinstance(content, str):
+        result["error"] = "Message content is required"
+        return result
+    try:
+        result.update(process_message(content, user_id, item.get("provider") or provider, api_keys,
+                                      hedge=False, limiter=provider_limiter, store=False))
+    except Exception as e:
+        logger.error(f"Batch item {index} failed: {str(e)}")
+        result["error"] = str(e)
+    return result
+
+def process_batch(items: List[Any], user_id: str = "user123", provider: Optional[str] = None,
+                  api_keys: Dict[str, str] = None) -> Iterator[Dict[str, Any]]:
+    """Answer many independent messages concurrently, yielding each result as it finishes.
+
+    Items are strings or ``{"content", "provider", "id"}`` objects and are
+    answered without conversation context. Every result carries its item's
+    ``index``; a failed item yields a result with an ``error`` instead of
+    ending the batch. Provider calls share the per-provider concurrency caps
+    with document analysis. Items not yet started when the generator is
+    closed are cancelled.
+    """
+    futures = [batch_executor.submit(_batch_item, index, item, user_id, provider, api_keys or {})
+               for index, item in enumerate(items)]
+    try:
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+def _document_text(document: Dict[str, Any]) -> str:
+    """Text of an uploaded document; metadata-only documents fall back to title and description"""
+    if document.get('file_path'):
+        return extract_text(os.path.join(UPLOAD_DIR, document['file_path']))
+    parts = (document.get('title'), document.get('description'))
+    return "\n\n".join(part for part in parts if part)
+
+def _index_document(document: Dict[str, Any]):
+    """Add a document to the retrieval and near-duplicate indexes (runs on the indexing thread)"""
+    try:
+        text = _document_text(document)
+        search_index.add_document(document['id'], document.get('title', ''), text)
+        if document.get('file_path'):
+            signature = min_hasher.signature(text)
+            if signature is not None:
+                near_duplicate_index.add(document['id'], signature)
+    except Exception as e:
+        logger.warning(f"Could not index document {document['id']}: {str(e)}")
+
+def _register_near_duplicates(document_id: str, text: str) -> List[Dict[str, Any]]:
+    """Add the document's signature to the LSH index; return earlier uploads it nearly duplicates"""
+    signature = min_hasher.signature(text)
+    if signature is None:
+        return []
+    matches = near_duplicate_index.query(signature, NEAR_DUPLICATE_THRESHOLD, exclude=document_id)
+    near_duplicate_index.add(document_id, signature)
+    near_duplicates = []
+    for match_id, score in matches[:10]:
+        match = documents_store.get(match_id)
+        if match is not None:
+            near_duplicates.append(
+                {'document_id': match_id, 'title': match.get('title'), 'similarity': score}
+            )
+    return near_duplicates
+
+def _store_upload(stored: Optional[StoredFile], document: Dict[str, Any]):
+    """Move an upload's file into place and record its document with no delete in between"""
+    if stored is None:
+        documents_store[document['id']] = document
+        return
+    with upload_lock:
+        stored.store()
+        try:
+            documents_store[document['id']] = document
+        except Exception:
+            # Nothing else can reference a file this request just created while the lock is held
+            stored.remove()
+            raise
+
+def _delete_document(document_id: str) -> Optional[Dict[str, Any]]:
+    """Remove a document, and its stored file once no other document references it"""
+    document = documents_store.pop(document_id, None)
+    file_path = document.get('file_path') if document else None
+    if file_path:
+        # Stored files are shared by identical uploads; an upload storing this one holds the lock
+        with upload_lock:
+            if not any(d.get('file_path') == file_path for d in documents_store.values()):
+                try:
+                    os.remove(os.path.join(UPLOAD_DIR, file_path))
+                except OSError as e:
+                    logger.warning(f"Could not remove stored file {file_path}: {str(e)}")
+    return document
+
+def _previous_version(document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Most similar earlier upload of this document that has already been analyzed"""
+    for match in document.get('near_duplicates', []):
+        previous = documents_store.get(match['document_id'])
+        if previous is not None and previous.get('analysis'):
+            return {**match, 'document': previous}
+    return None
+
+def _on_documents_reloaded(added: List[Dict[str, Any]], removed: List[Dict[str, Any]]):
+    """Index documents other worker processes uploaded, and drop the ones they deleted"""
+    for document in added:
+        indexing_executor.submit(_index_document, document)
+    for document in removed:
+        near_duplicate_index.remove(document['id'])
+        indexing_executor.submit(search_index.remove_document, document['id'])
+
+def _index_existing_documents():
+    started = time.monotonic()
+    for document in documents_store.values():
+        _index_document(document)
+    elapsed = time.monotonic() - started
+    logger.info(f"Indexed {len(documents_store)} stored document(s) in {elapsed:.2f}s")
+
+def analyze_document(document_id: str, api_keys: Dict[str, str] = None, progress=None,
+                     cache_key: Optional[str] = None) -> Dict[str, Any]:
+    """Run the map-reduce analysis pipeline over a stored document, recording progress on it"""
+    api_keys = api_keys or {}
+    document = documents_store[document_id]
+    text = _document_text(document)
+    providers = rank_providers(text[:2000], api_keys)
+    if not providers:
+        raise ProviderUnavailableError(
+            "No API keys are configured. "
+            "Please configure your API keys in the Settings page or in the .env file."
+        )
+
+    def on_progress(done: int, total: int):
+        document['analysis_progress'] = {'chunks_done': done, 'chunks_total': total}
+        documents_store.save(document_id)
+        if progress is not None:
+            progress(done, total)
+        logger.info(f"Analysis of document {document_id}: {done}/{total} chunks")
+
+    # Compare against an analyzed earlier version; if no clause changed, its analysis still applies
+    previous_version = None
+    previous = _previous_version(document)
+    if previous is not None:
+        try:
+            diff = clause_diff(_document_text(previous['document']), text)
+            previous_version = {
+                'document_id': previous['document_id'], 'similarity': previous['similarity'], **diff
+            }
+        except DocumentTextError as e:
+            logger.warning(
+                f"Could not compare with previous version {previous['document_id']}: {str(e)}"
+            )
+
+    if previous_version is not None and previous_version['identical']:
+        result = {
+            **_shareable_analysis(previous['document']['analysis']),
+            'reused_from': previous['document_id']
+        }
+        on_progress(1, 1)
+    else:
+        result = analysis_pipeline.analyze(
+            text, providers, document.get('title', 'Untitled'), api_keys, on_progress
+        )
+    analysis_result = {
+        **result,
+        'document_id': document_id,
+        'analysis_date': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    if previous_version is not None:
+        analysis_result['previous_version'] = previous_version
+    document['analysis'] = analysis_result
+    documents_store.save(document_id)
+    if cache_key is not None and not analysis_result.get('failed_chunks'):
+        # Only complete results are reused; a transient provider error must not be served as cached
+        analysis_cache.set(cache_key, _shareable_analysis(analysis_result))
+    return analysis_result
+
+# Fields describing one document's analysis rather than its content
+_DOCUMENT_ANALYSIS_FIELDS = ('document_id', 'previous_version', 'reused_from', 'cached')
+
+def _shareable_analysis(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+    """An analysis without the fields that only apply to the document it was made for"""
+    return {
+        key: value for key, value in analysis_result.items()
+        if key not in _DOCUMENT_ANALYSIS_FIELDS
+    }
+
+def _analysis_cache_key(document: Dict[str, Any], providers: List[str]) -> Optional[str]:
+    """Cache key for the document's content with these providers; None for metadata-only ones"""
+    if not document.get('sha256'):
+        return None
+    models = [f"{p}:{PROVIDER_MODELS.get(p, '')}" for p in providers]
+    return make_analysis_key(document['sha256'], analysis_pipeline.version, models)
+
+def cached_analysis(document_id: str, cache_key: str) -> Optional[Dict[str, Any]]:
+    """Apply a cached result for identical content to the document, if there is one"""
+    cached = analysis_cache.get(cache_key)
+    if cached is None:
+        return None
+    analysis_result = {**cached, 'document_id': document_id, 'cached': True}
+    document = documents_store[document_id]
+    document['analysis'] = analysis_result
+    document['status'] = 'analyzed'
+    document.pop('analysis_error', None)
+    documents_store.save(document_id)
+    return analysis_result
+
+def _sync_document_status(job: Job):
+    """Mirror an analysis job's state onto its document so listings reflect it"""
+    document = documents_store.get(job.target_id)
+    if document is None:
+        return
+    document['status'] = DOCUMENT_STATUS_FOR_JOB[job.status]
+    document['analysis_job_id'] = job.id
+    if SHARED_STATE:
+        # Lets other workers tell an analysis still running here from one a crash interrupted
+        if job.active:
+            document['analysis_worker'] = os.getpid()
+        else:
+            document.pop('analysis_worker', None)
+    if job.error is not None:
+        document['analysis_error'] = job.error
+    else:
+        document.pop('analysis_error', None)
+    documents_store.save(job.target_id)
+
+def submit_analysis(document_id: str, api_keys: Dict[str, str] = None,
+                    cache_key: Optional[str] = None) -> Job:
+    """Queue an analysis of the document, or return the one already queued or running"""
+    return analysis_jobs.submit(
+        'document_analysis',
+        document_id,
+        lambda job: analyze_document(document_id, api_keys, job.set_progress, cache_key),
+        on_status=_sync_document_status
+    )
+
+def _analysis_running_elsewhere(document: Dict[str, Any]) -> bool:
+    """Whether another live worker process is analyzing the document"""
+    pid = document.get('analysis_worker')
+    if not SHARED_STATE or pid is None or pid == os.getpid():
+        return False
+    if document.get('status') not in ('queued', 'processing'):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _remote_job_status(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Job-shaped status of an analysis running in another worker, from its document's record"""
+    progress = document.get('analysis_progress')
+    return {
+        'job_id': document.get('analysis_job_id'),
+        'kind': 'document_analysis',
+        'target_id': document['id'],
+        'status': 'queued' if document['status'] == 'queued' else 'running',
+        'progress': (
+            {'done': progress['chunks_done'], 'total': progress['chunks_total']} if progress else {}
+        ),
+        'document_id': document['id']
+    }
+
+def analysis_status(document_id: str) -> Optional[Dict[str, Any]]:
+    """Status of the document's latest analysis, or None if it was never analyzed"""
+    job = analysis_jobs.latest_for(document_id)
+    # With several workers, a newer analysis may have been started by another one
+    if job is not None and (
+        not SHARED_STATE or documents_store[document_id].get('analysis_job_id') in (None, job.id)
+    ):
+        return {**job.to_dict(), 'document_id': document_id}
+
+    # Jobs live in memory; after a restart fall back to what the document recorded
+    document = documents_store[document_id]
+    if _analysis_running_elsewhere(document):
+        return _remote_job_status(document)
+    status = document.get('status')
+    if status == 'analyzed' and document.get('analysis'):
+        return {'job_id': document.get('analysis_job_id'), 'document_id': document_id,
+                'status': 'done', 'result': document['analysis']}
+    if status in ('queued', 'processing'):
+        document['status'] = 'failed'
+        document['analysis_error'] = 'Analysis was interrupted by a server restart'
+        document.pop('analysis_worker', None)
+        documents_store.save(document_id)
+        status = 'failed'
+    if status == 'failed':
+        return {'job_id': document.get('analysis_job_id'), 'document_id': document_id,
+                'status': 'failed', 'error': document.get('analysis_error')}
+    return None
+
+def _collect_gauges():
+    """Point-in-time gauges from the server pool and queues, read when /api/metrics is scraped"""
+    server = http_server.stats() if http_server is not None else {}
+    yield ('http_worker_threads_busy', 'gauge', 'Worker threads handling a request',
+           [({}, server.get('active'))])
+    yield ('http_accept_queue_depth', 'gauge', 'Accepted connections waiting for a worker',
+           [({}, server.get('queued'))])
+    budgets = rate_limiter.stats().items()
+    yield ('provider_rate_limit_queue_depth', 'gauge', 'Calls waiting for a provider rate budget',
+           [({'provider': name}, budget['queueDepth']) for name, budget in budgets])
+    yield ('analysis_jobs_pending', 'gauge', 'Document analyses queued or running',
+           [({}, analysis_jobs.stats()['pending'])])
+    if persistence is not None:
+        yield ('persistence_failed_writes_total', 'counter',
+               'Database writes dropped after failing', [({}, persistence.failed_writes)])
+
+metrics.add_collector(_collect_gauges)
+
+def _instrumented(handler):
+    """Record count, latency, in-flight gauge and sizes of requests served by a method handler"""
+    @functools.wraps(handler)
+    def wrapper(self):
+        self._status = None
+        if not METRICS_ENABLED:
+            return handler(self)
+        route = metrics.route(self.path)
+        written = self._response_stream.bytes_written
+        metrics.add('http_requests_in_flight', (route,), 1)
+        started = time.perf_counter()
+        try:
+            return handler(self)
+        finally:
+            elapsed = time.perf_counter() - started
+            status = str(self._status or 500)
+            metrics.add('http_requests_in_flight', (route,), -1)
+            metrics.inc('http_requests_total', (self.command, route, status))
+            metrics.observe('http_request_duration_seconds', (self.command, route, status), elapsed)
+            length = self.headers.get('Content-Length', '0')
+            request_size = int(length) if length.isdigit() else 0
+            response_size = self._response_stream.bytes_written - written
+            metrics.observe('http_request_size_bytes', (route,), request_size)
+            metrics.observe('http_response_size_bytes', (route,), response_size)
+    return wrapper
+
+def _profiled(handler):
+    """Profile the handler when profiling is on or an admin asks for it with ``X-Profile: 1``"""
+    @functools.wraps(handler)
+    def wrapper(self):
+        forced = self.headers.get('X-Profile') == '1' and self._is_admin()
+        capture = request_profiler.begin(forced=forced)
+        if capture is None:
+            return handler(self)
+        try:
+            return handler(self)
+        finally:
+            profile_id = request_profiler.end(capture, self.command, self.path, self._status or 500)
+            if profile_id is not None:
+                logger.info(f"Captured profile {profile_id} for {self.command} {self.path}")
+    return wrapper
+
+def _buffered(handler):
+    """Send the response begun with ``_set_headers`` once the handler returns.
+
+    Buffering lets every response carry a Content-Length and be compressed,
+    which is what allows the connection to be kept alive for the next request.
+    """
+    @functools.wraps(handler)
+    def wrapper(self):
+        self._body_consumed = False
+        try:
+            return handler(self)
+        finally:
+            # Unread body bytes would be parsed as the next request
+            length = self.headers.get('Content-Length', '0')
+            if (length != '0' and not self._body_consumed) or 'Transfer-Encoding' in self.headers:
+                self.close_connection = True
+            self._finish_response()
+    return wrapper
 
 class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def _set_headers(self, status_code=200, content_type='application/json'):
+    protocol_version = 'HTTP/1.1'
+    # Drop idle or stalled clients so they cannot pin a worker thread
+    timeout = REQUEST_TIMEOUT
+    # Headers and body are written separately; without this, Nagle's algorithm can delay the body
+    disable_nagle_algorithm = True
+    _status = None
+    _pending = None
+    _idle = False
+
+    def setup(self):
+        super().setup()
+        # Count response bytes for the metrics
+        self.wfile = self._response_stream = CountingWriter(self.wfile)
+        self._requests_served = 0
+
+    def handle_one_request(self):
+        if self._requests_served:
+            # Waiting for the next request on a kept-alive connection
+            self._idle = True
+            self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        super().handle_one_request()
+        self._requests_served += 1
+
+    def parse_request(self):
+        if self._idle:
+            self._idle = False
+            self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def log_error(self, format, *args):
+        # An idle kept-alive connection timing out is routine, not an error
+        if not self._idle:
+            super().log_error(format, *args)
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def _keep_alive(self) -> bool:
+        """Whether the connection may stay open after this response"""
+        if self.close_connection or KEEPALIVE_TIMEOUT <= 0:
+            return False
+        if self._requests_served + 1 >= KEEPALIVE_MAX_REQUESTS:
+            return False
+        # Free the worker for waiting connections rather than hold it for an idle one
+        return http_server is None or http_server.keep_alive_allowed()
+
+    def _set_headers(self, status_code=200, content_type='application/json',
+                     extra_headers: Optional[Dict[str, str]] = None):
+        """Begin a response; the body written to ``self.wfile`` is buffered, sent on return"""
+        self._status = status_code
+        self._pending = (status_code, content_type, extra_headers)
+        self.wfile = io.BytesIO()
+
+    def _finish_response(self):
+        if self._pending is None:
+            return
+        status_code, content_type, extra_headers = self._pending
+        self._pending = None
+        body = self.wfile.getvalue()
+        self.wfile = self._response_stream
+
+        encoding = None
+        varies = is_compressible(content_type) and len(body) >= COMPRESSION_MIN_BYTES
+        if varies:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            if encoding is not None:
+                with request_profiler.phase('serialize'):
+                    body = compress(body, encoding, COMPRESSION_LEVEL)
+
         self.send_response(status_code)
         self.send_header('Content-type', content_type)
         # Allow requests from any origin
@@ -385,18 +1582,161 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         # Allow all headers
         self.send_header('Access-Control-Allow-Headers', '*')
+        # Let browser clients read the caching and pagination headers
+        self.send_header('Access-Control-Expose-Headers', 'ETag, X-Next-Cursor')
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        if varies:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if status_code not in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED):
+            self.send_header('Content-Length', str(len(body)))
+        if self._keep_alive():
+            self.send_header('Keep-Alive',
+                             f'timeout={KEEPALIVE_TIMEOUT:g}, max={KEEPALIVE_MAX_REQUESTS}')
+        else:
+            self.send_header('Connection', 'close')
         self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _pagination_params(self, query: Dict[str, List[str]]):
+        """Return ``(limit, cursor)`` from the query string; raises ValueError on a bad limit"""
+        limit = query.get('limit', [None])[0]
+        cursor = query.get('cursor', [None])[0] or None
+        if limit is not None:
+            limit = int(limit)
+            if limit < 1:
+                raise ValueError("limit must be a positive integer")
+            limit = min(limit, MAX_PAGE_SIZE)
+        return limit, cursor
+
+    def _send_cached_json(self, etag: str, build_page):
+        """Answer 304 if the client already has ``etag``, else send the page from ``build_page``.
+
+        ``build_page`` returns ``(body, next_cursor)`` and is only called when a body is needed;
+        it raises ValueError for a cursor that no longer points into the list, answered with 400.
+        """
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self._set_headers(status_code=304, extra_headers={'ETag': etag})
+            return
+        try:
+            body, next_cursor = build_page()
+        except ValueError as e:
+            self._set_headers(status_code=400)
+            self.wfile.write(encode_json({'error': f'Invalid pagination parameters: {str(e)}'}))
+            return
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        self._set_headers(extra_headers=headers)
+        self.wfile.write(encode_json(body))
 
     def _get_request_body(self):
-        content_length = int(self.headers.get('Content-Length', 0))
-        if content_length > 0:
-            body = self.rfile.read(content_length).decode('utf-8')
-            return json.loads(body)
-        return {}
+        with request_profiler.phase('parse'):
+            content_length = int(self.headers.get('Content-Length', 0))
+            self._body_consumed = True
+            if content_length > 0:
+                return decode_json(self.rfile.read(content_length))
+            return {}
+
+    def _is_admin(self) -> bool:
+        token = self.headers.get('X-Admin-Token', '')
+        return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'),
+                                                         ADMIN_TOKEN.encode('utf-8'))
+
+    def _stream_events(self, events: Iterator[Dict[str, Any]]):
+        """Write events to the client as Server-Sent Events, flushing each one"""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')  # Disable proxy buffering
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        # The stream ends when the connection closes
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        try:
+            for event in events:
+                with request_profiler.phase('serialize'):
+                    header = f"event: {event['event']}\ndata: ".encode('utf-8')
+                    payload = header + encode_json(event['data']) + b"\n\n"
+                self.wfile.write(payload)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("Client disconnected during streaming response")
+        finally:
+            # Stop the upstream generation if the client went away
+            events.close()
+
+    def _stream_ndjson(self, results: Iterator[Dict[str, Any]]):
+        """Write each result as one line of newline-delimited JSON as soon as it is ready"""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')  # Disable proxy buffering
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', '*')
+        # The stream ends when the connection closes
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        try:
+            for result in results:
+                self.wfile.write(encode_json(result) + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("Client disconnected during streaming response")
+        finally:
+            # Cancel the items that have not started yet
+            results.close()
 
+    @_instrumented
+    @_buffered
     def do_OPTIONS(self):
-        self._set_headers()
+        # Let browsers reuse the preflight instead of repeating it before every call
+        self._set_headers(extra_headers={'Access-Control-Max-Age': str(CORS_MAX_AGE)})
 
+    @_instrumented
+    @_profiled
+    @_buffered
+    def do_DELETE(self):
+        parsed_url = urlparse(self.path)
+        path = parsed_url.path
+
+        # Normalize path - handle both with and without /api prefix
+        if path.startswith('/api/'):
+            normalized_path = path
+        else:
+            normalized_path = f'/api{path}'
+
+        if normalized_path.startswith('/api/documents/') and normalized_path.count('/') == 3:
+            document_id = normalized_path.split('/')[-1]
+            document = _delete_document(document_id)
+            if document is None:
+                self._set_headers(status_code=404)
+                self.wfile.write(encode_json({'error': 'Document not found'}))
+                return
+
+            stats_aggregator.record_document_removed()
+            near_duplicate_index.remove(document_id)
+            indexing_executor.submit(search_index.remove_document, document_id)
+
+            self._set_headers()
+            self.wfile.write(encode_json({'message': 'Document deleted', 'id': document_id}))
+            return
+
+        self._set_headers(status_code=404)
+        response = {'error': 'Not found', 'path': self.path}
+        self.wfile.write(encode_json(response))
+
+    @_instrumented
+    @_profiled
+    @_buffered
     def do_GET(self):
         parsed_url = urlparse(self.path)
         path = parsed_url.path
@@ -414,10 +1754,11 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 'status': 'ok',
                 'message': 'Multi-LLM Lawyer Bot Backend API is running',
                 'version': '0.1.0',
-                'endpoints': ['/api/health', '/api/chat/send', '/api/chat/history'],
+                'endpoints': ['/api/health', '/api/chat/send', '/api/chat/stream',
+                              '/api/chat/batch', '/api/chat/history', '/api/metrics'],
                 'docs': 'Access the frontend at http://localhost:3003'
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.wfile.write(encode_json(response))
             return
 
         if path == '/api/health' or path == '/health':
@@ -427,15 +1768,15 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             api_status = {
                 'openai': {
                     'configured': bool(openai_key),
-                    'client_ready': openai_client is not None
+                    'client_ready': client_registry.load_time('openai') is not None
                 },
                 'gemini': {
                     'configured': bool(gemini_key),
-                    'client_ready': gemini_model is not None
+                    'client_ready': client_registry.load_time('gemini') is not None
                 },
                 'mistral': {
                     'configured': bool(mistral_key),
-                    'client_ready': mistral_client is not None
+                    'client_ready': client_registry.load_time('mistral') is not None
                 }
             }
             
@@ -446,82 +1787,176 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 'providers': available_providers,
                 'default_provider': default_provider if available_providers else 'none',
                 'api_status': api_status,
+                'server': http_server.stats() if http_server is not None else None,
+                'client_registry': client_registry.stats(),
+                'provider_health': provider_health.snapshot(),
+                'chat_history_memory': chat_history.memory_usage(),
+                'persistence': persistence.stats() if persistence is not None else None,
+                'analysis_jobs': analysis_jobs.stats(),
+                'search_index': search_index.stats(),
+                'context_window': context_window.stats(),
+                'rate_limits': rate_limiter.stats(),
+                'near_duplicate_index': near_duplicate_index.stats(),
+                'provider_concurrency': provider_limiter.stats(),
+                'startup': startup_profiler.report(),
+                'http': {
+                    'keep_alive_timeout': KEEPALIVE_TIMEOUT,
+                    'json_encoder': JSON_BACKEND,
+                    'compression': list(SUPPORTED_ENCODINGS),
+                    'compression_min_bytes': COMPRESSION_MIN_BYTES
+                },
+                'request_profiler': request_profiler.stats(),
+                'process': {
+                    'pid': os.getpid(),
+                    'worker_id': WORKER_ID,
+                    'workers': WORKER_COUNT,
+                    'shared_state': SHARED_STATE,
+                    'document_reloads': documents_store.reloads
+                },
                 'setup_instructions': {
                     'message': 'To use AI responses, configure API keys in .env file',
                     'example_file': '.env.example',
                     'required_packages': 'pip install -r requirements.txt'
                 } if not available_providers else None
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.wfile.write(encode_json(response))
+            return
+
+        # Prometheus scrape endpoint
+        elif normalized_path == '/api/metrics' and METRICS_ENABLED:
+            body = metrics.render().encode('utf-8')
+            self._set_headers(content_type='text/plain; version=0.0.4; charset=utf-8')
+            self.wfile.write(body)
+            return
+
+        # Slow-request profiles kept by the request profiler
+        elif normalized_path.startswith('/api/admin/profiles'):
+            if not self._is_admin():
+                self._set_headers(status_code=403)
+                self.wfile.write(encode_json({'error': 'A valid X-Admin-Token header is required'}))
+                return
+            profile_id = normalized_path[len('/api/admin/profiles'):].strip('/')
+            if not profile_id:
+                self._set_headers()
+                self.wfile.write(encode_json({
+                    'profiles': request_profiler.list(),
+                    'profiler': request_profiler.stats()
+                }))
+                return
+            profile = request_profiler.get(profile_id)
+            if profile is None:
+                self._set_headers(status_code=404)
+                self.wfile.write(encode_json({'error': 'Profile not found'}))
+                return
+            if parse_qs(parsed_url.query).get('format', [''])[0] == 'pstats':
+                if profile['pstats'] is None:
+                    self._set_headers(status_code=404)
+                    self.wfile.write(encode_json({'error': 'Profile has no cProfile data'}))
+                    return
+                # Loadable with pstats.Stats(path) or snakeviz
+                self._set_headers(content_type='application/octet-stream', extra_headers={
+                    'Content-Disposition': f'attachment; filename="profile-{profile_id}.prof"'
+                })
+                self.wfile.write(profile['pstats'])
+                return
+            self._set_headers()
+            self.wfile.write(encode_json({
+                key: value for key, value in profile.items() if key != 'pstats'
+            }))
             return
 
         # Handle documents list endpoint
         elif normalized_path == '/api/documents/list' or path == '/documents/list':
-            self._set_headers()
-            # Return list of documents from in-memory store
-            documents_list = list(documents_store.values())
-            self.wfile.write(json.dumps(documents_list).encode('utf-8'))
+            try:
+                limit, cursor = self._pagination_params(parse_qs(parsed_url.query))
+            except ValueError as e:
+                self._set_headers(status_code=400)
+                self.wfile.write(encode_json({'error': f'Invalid pagination parameters: {str(e)}'}))
+                return
+
+            # The ETag only depends on the store version, so unchanged polls skip serialization
+            etag = f'W/"docs-{ETAG_EPOCH}-{documents_store.version}-{_page_tag(cursor, limit)}"'
+
+            def build_page():
+                documents_list, has_more = documents_store.page(cursor, limit)
+                next_cursor = documents_list[-1]['id'] if has_more and documents_list else None
+                return documents_list, next_cursor
+
+            self._send_cached_json(etag, build_page)
             return
 
         # Handle get specific document endpoint
+        # Analysis status for a document, or for a job by ID
+        elif (normalized_path.startswith('/api/documents/')
+              and normalized_path.endswith('/analysis')):
+            document_id = normalized_path.split('/')[-2]
+            if document_id not in documents_store:
+                self._set_headers(status_code=404)
+                self.wfile.write(encode_json({'error': 'Document not found'}))
+                return
+            status = analysis_status(document_id)
+            if status is None:
+                self._set_headers(status_code=404)
+                self.wfile.write(encode_json({'error': 'Document has not been analyzed'}))
+                return
+            self._set_headers()
+            self.wfile.write(encode_json(status))
+            return
+
+        elif normalized_path.startswith('/api/jobs/'):
+            job_id = normalized_path.split('/')[-1]
+            job = analysis_jobs.get(job_id)
+            status = job.to_dict() if job is not None else None
+            if status is None and SHARED_STATE:
+                # Another worker ran it; the document it analyzed records the job
+                document = next((d for d in documents_store.values()
+                                 if d.get('analysis_job_id') == job_id), None)
+                status = analysis_status(document['id']) if document is not None else None
+            if status is None:
+                self._set_headers(status_code=404)
+                self.wfile.write(encode_json({'error': 'Job not found'}))
+                return
+            self._set_headers()
+            self.wfile.write(encode_json(status))
+            return
+
         elif normalized_path.startswith('/api/documents/') and not normalized_path.endswith('/analyze'):
             document_id = normalized_path.split('/')[-1]
             if document_id in documents_store:
                 self._set_headers()
-                self.wfile.write(json.dumps(documents_store[document_id]).encode('utf-8'))
+                self.wfile.write(encode_json(documents_store[document_id]))
                 return
             else:
                 self._set_headers(status_code=404)
                 response = {'error': 'Document not found'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(encode_json(response))
                 return
 
         # Handle dashboard stats endpoint
         elif normalized_path == '/api/dashboard/stats' or path == '/dashboard/stats':
             self._set_headers()
             
-            # Calculate real statistics from in-memory data
-            total_conversations = len(chat_history)
-            total_messages = sum(len(messages) for messages in chat_history.values())
-            user_messages = sum(len([msg for msg in messages if msg['role'] == 'user']) for messages in chat_history.values())
-            documents_analyzed = len(documents_store)
-            
-            # Calculate system uptime (mock for now, but could be real)
-            uptime_percentage = "99.9%"
-            
-            # Get provider usage statistics
-            provider_usage = {}
-            for user_messages in chat_history.values():
-                for msg in user_messages:
-                    if msg['role'] == 'assistant' and 'provider' in msg:
-                        provider = msg['provider']
-                        provider_usage[provider] = provider_usage.get(provider, 0) + 1
-            
-            # Recent activity (last 24 hours simulation)
-            recent_chats = min(total_conversations, 5)  # Mock recent activity
-            recent_documents = min(documents_analyzed, 3)
-            
-            stats = {
-                'totalConversations': total_conversations,
-                'documentsAnalyzed': documents_analyzed,
-                'questionsAnswered': user_messages,
-                'systemUptime': uptime_percentage,
-                'providerUsage': provider_usage,
-                'recentActivity': {
-                    'chats': recent_chats,
-                    'documents': recent_documents,
-                    'queries': min(user_messages, 15)
-                },
+            # Counters are maintained incrementally as messages and documents arrive
+            stats = stats_aggregator.snapshot()
+            uptime_seconds = stats_aggregator.uptime_seconds()
+            stats.update({
+                'systemUptime': format_duration(uptime_seconds),
+                'systemUptimeSeconds': round(uptime_seconds),
+                'startedAt': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                           time.localtime(stats_aggregator.started_at)),
                 'systemStatus': {
                     'apiOnline': True,
                     'aiModelsReady': len(available_providers) > 0,
                     'databaseConnected': True
                 },
                 'availableProviders': available_providers,
+                'responseCache': response_cache.stats(),
+                'hedging': hedge_stats.to_dict(),
+                'analysisCache': analysis_cache.stats(),
                 'lastUpdated': time.strftime('%Y-%m-%dT%H:%M:%S')
-            }
+            })
             
-            self.wfile.write(json.dumps(stats).encode('utf-8'))
+            self.wfile.write(encode_json(stats))
             return
 
         # Handle both /api/chat/history and /chat/history endpoints
@@ -529,25 +1964,36 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             # No authentication required for testing
             user_id = "user123"  # Default test user
 
-            # Format message history for response
-            messages = []
-            if user_id in chat_history:
-                for msg in chat_history[user_id]:
-                    message_id = str(uuid.uuid4())
-                    # Include provider in the response if available
+            try:
+                limit, cursor = self._pagination_params(parse_qs(parsed_url.query))
+            except ValueError as e:
+                self._set_headers(status_code=400)
+                self.wfile.write(encode_json({'error': f'Invalid pagination parameters: {str(e)}'}))
+                return
+
+            version = chat_history.version(user_id)
+            etag = f'W/"chat-{ETAG_EPOCH}-{version}-{_page_tag(cursor, limit)}"'
+
+            def build_page():
+                page, has_more = chat_history.page(user_id, cursor, limit)
+                # Format message history for response; IDs and timestamps are set at insert time
+                messages = []
+                for msg in page:
                     message_data = {
-                        "id": message_id,
+                        "id": msg.id,
                         "user_id": user_id,
-                        "content": msg["content"],
-                        "role": msg["role"],
-                        "timestamp": "2023-01-01T00:00:00"  # Mock timestamp
+                        "content": msg.content,
+                        "role": msg.role,
+                        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S',
+                                                   time.localtime(msg.timestamp))
                     }
-                    if "provider" in msg:
-                        message_data["provider"] = msg["provider"]
+                    # Include provider in the response if available
+                    if msg.provider:
+                        message_data["provider"] = msg.provider
                     messages.append(message_data)
+                return messages, page[-1].id if has_more and page else None
 
-            self._set_headers()
-            self.wfile.write(json.dumps(messages).encode('utf-8'))
+            self._send_cached_json(etag, build_page)
             return
 
         # Handle favicon.ico request
@@ -558,8 +2004,11 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         # Handle 404 for any other path
         self._set_headers(status_code=404)
         response = {'error': 'Not found', 'path': self.path}
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self.wfile.write(encode_json(response))
 
+    @_instrumented
+    @_profiled
+    @_buffered
     def do_POST(self):
         parsed_url = urlparse(self.path)
         path = parsed_url.path
@@ -572,41 +2021,105 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
 
         # Handle document upload endpoint
         if normalized_path == '/api/documents/upload' or path == '/documents/upload':
+            files = []
             try:
                 global document_counter
-                document_counter += 1
+                with state_lock:
+                    document_counter += 1
+                    document_number = document_counter
                 
-                # For simplicity, we'll handle JSON uploads instead of multipart
-                body = self._get_request_body()
-                title = body.get('title', f'Document {document_counter}')
+                content_length = self.headers.get('Content-Length')
+                if content_length is None:
+                    self._set_headers(status_code=411)
+                    response = {'error': 'Content-Length is required for uploads'}
+                    self.wfile.write(encode_json(response))
+                    return
+                content_length = int(content_length)
+                if content_length > UPLOAD_MAX_SIZE + UPLOAD_FORM_OVERHEAD:
+                    # Reject before reading any of the body
+                    raise UploadTooLargeError(
+                        f"Upload exceeds the maximum size of {UPLOAD_MAX_SIZE} bytes"
+                    )
+
+                boundary = multipart_boundary(self.headers.get('Content-Type', ''))
+                stored = None
+                if boundary is not None:
+                    # Stream the form to disk; only the small text fields are kept in memory
+                    body, files = upload_parser.parse(self.rfile, boundary, content_length)
+                    self._body_consumed = True
+                    stored = next((f for f in files if f.field_name == 'file'),
+                                  files[0] if files else None)
+                    if stored is None:
+                        raise UploadError("Multipart upload did not include a file")
+                else:
+                    # JSON uploads carry metadata only
+                    body = self._get_request_body()
+
+                default_title = (os.path.splitext(stored.filename)[0] if stored
+                                 else f'Document {document_number}')
+                title = body.get('title') or default_title
                 description = body.get('description', '')
-                
-                # Create mock document
+
                 document_id = str(uuid.uuid4())
                 document = {
                     'id': document_id,
                     'title': title,
                     'description': description,
-                    'filename': f'{title}.pdf',
-                    'file_size': 1024,  # Mock file size
+                    'filename': stored.filename if stored else f'{title}.pdf',
+                    'file_size': stored.size if stored else 0,
                     'upload_date': time.strftime('%Y-%m-%dT%H:%M:%S'),
                     'status': 'uploaded',
                     'user_id': 'user123'
                 }
-                
-                documents_store[document_id] = document
+                if stored is not None:
+                    document.update({
+                        'content_type': stored.content_type,
+                        'sha256': stored.sha256,
+                        # Relative to UPLOAD_DIR; identical files share one path
+                        'file_path': os.path.basename(stored.path)
+                    })
+
+                _store_upload(stored, document)
+                stats_aggregator.record_document_upload()
+
+                text = None
+                try:
+                    text = _document_text(document)
+                except DocumentTextError as e:
+                    logger.warning(f"Could not extract text from {document['filename']}: {str(e)}")
+                if text and stored is not None:
+                    # Signatures sample at most NEAR_DUPLICATE_MAX_SHINGLES shingles; this is fast
+                    # to report in the response
+                    document['near_duplicates'] = _register_near_duplicates(document_id, text)
+                    documents_store.save(document_id)
+                if text:
+                    indexing_executor.submit(search_index.add_document, document_id, title, text)
                 
                 self._set_headers(status_code=201)
-                self.wfile.write(json.dumps(document).encode('utf-8'))
+                self.wfile.write(encode_json(document))
                 return
-                
+
+            except UploadError as e:
+                logger.warning(f"Rejected document upload: {str(e)}")
+                # The rest of the body may be unread, so the connection cannot be reused
+                self.close_connection = True
+                self._set_headers(status_code=e.status)
+                self.wfile.write(encode_json({'error': str(e)}))
+                return
+
             except Exception as e:
                 logger.error(f"Error uploading document: {str(e)}")
                 self._set_headers(status_code=500)
                 response = {'error': f'Internal server error: {str(e)}'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(encode_json(response))
                 return
 
+            finally:
+                # Extra file parts, and the file of an upload that failed before storing it,
+                # belong to no document
+                for spooled in files:
+                    spooled.discard()
+
         # Handle document analysis endpoint
         elif normalized_path.endswith('/analyze'):
             try:
@@ -615,40 +2128,62 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 if document_id not in documents_store:
                     self._set_headers(status_code=404)
                     response = {'error': 'Document not found'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
+                    self.wfile.write(encode_json(response))
                     return
                 
-                # Mock analysis result
-                analysis_result = {
-                    'document_id': document_id,
-                    'analysis_date': time.strftime('%Y-%m-%dT%H:%M:%S'),
-                    'summary': 'This is a mock analysis of the document. In a real implementation, this would contain AI-generated insights about the legal document.',
-                    'key_points': [
-                        'Contract terms and conditions',
-                        'Legal obligations and responsibilities',
-                        'Important dates and deadlines'
-                    ],
-                    'risk_assessment': 'Medium',
-                    'recommendations': [
-                        'Review clause 3.2 for potential issues',
-                        'Consider adding additional protection clauses',
-                        'Verify compliance with local regulations'
-                    ]
-                }
-                
-                self._set_headers()
-                self.wfile.write(json.dumps(analysis_result).encode('utf-8'))
+                body = self._get_request_body()
+                api_keys = body.get('api_keys', {})
+                force = body.get('force') is True or \
+                    parse_qs(parsed_url.query).get('force', [''])[0].lower() in ('1', 'true', 'yes')
+                providers = rank_providers(documents_store[document_id].get('title', ''), api_keys)
+                if not providers:
+                    self._set_headers(status_code=503)
+                    response = {'error': "No API keys are configured. "
+                                         "Please configure your API keys in the Settings page "
+                                         "or in the .env file."}
+                    self.wfile.write(encode_json(response))
+                    return
+
+                # Identical content analyzed before with the same providers comes from the cache
+                cache_key = _analysis_cache_key(documents_store[document_id], providers)
+                if cache_key is not None and force:
+                    analysis_cache.record_bypass()
+                elif cache_key is not None:
+                    analysis_result = cached_analysis(document_id, cache_key)
+                    if analysis_result is not None:
+                        self._set_headers()
+                        response = {'job_id': None, 'document_id': document_id, 'status': 'done',
+                                    'cached': True, 'result': analysis_result}
+                        self.wfile.write(encode_json(response))
+                        return
+
+                # The analysis runs in the background; clients poll the status URL
+                document = documents_store[document_id]
+                if _analysis_running_elsewhere(document):
+                    job_status = _remote_job_status(document)
+                else:
+                    job_status = submit_analysis(document_id, api_keys, cache_key).to_dict()
+                status_url = f'/api/documents/{document_id}/analysis'
+                self._set_headers(status_code=202, extra_headers={'Location': status_url})
+                response = {**job_status, 'document_id': document_id, 'status_url': status_url}
+                self.wfile.write(encode_json(response))
                 return
-                
+
+            except JobQueueFullError as e:
+                self._set_headers(status_code=503, extra_headers={'Retry-After': '5'})
+                response = {'error': str(e)}
+                self.wfile.write(encode_json(response))
+                return
+
             except Exception as e:
                 logger.error(f"Error analyzing document: {str(e)}")
                 self._set_headers(status_code=500)
                 response = {'error': f'Internal server error: {str(e)}'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(encode_json(response))
                 return
 
-        # Handle both /api/chat/send and /chat/send endpoints
-        elif normalized_path == '/api/chat/send' or path == '/chat/send':
+        # Handle /api/chat/send (optionally streamed) and /api/chat/stream
+        elif normalized_path in ('/api/chat/send', '/api/chat/stream'):
             try:
                 # No authentication required for testing
                 user_id = "user123"  # Default test user
@@ -658,41 +2193,182 @@ class HTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 content = body.get('content', '')
                 provider = body.get('provider')
                 api_keys = body.get('api_keys', {})
+                hedge = body.get('hedge')
 
                 if not content:
                     self._set_headers(status_code=400)
                     response = {'error': 'Message content is required'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
+                    self.wfile.write(encode_json(response))
+                    return
+
+                # Stream tokens as Server-Sent Events when requested
+                if normalized_path == '/api/chat/stream' or body.get('stream'):
+                    self._stream_events(stream_message(content, user_id, provider, api_keys))
                     return
 
                 # Process the message
-                response_data = process_message(content, user_id, provider, api_keys)
+                response_data = process_message(content, user_id, provider, api_keys, hedge)
 
-                self._set_headers()
-                self.wfile.write(json.dumps(response_data).encode('utf-8'))
+                if response_data.get('error') == 'rate_limited':
+                    retry_after = str(response_data['retry_after'])
+                    self._set_headers(status_code=429, extra_headers={'Retry-After': retry_after})
+                else:
+                    self._set_headers()
+                with request_profiler.phase('serialize'):
+                    payload = encode_json(response_data)
+                self.wfile.write(payload)
                 return
 
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
                 self._set_headers(status_code=500)
                 response = {'error': f'Internal server error: {str(e)}'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self.wfile.write(encode_json(response))
+                return
+
+        # Handle /api/chat/batch: many independent messages, answered concurrently
+        elif normalized_path == '/api/chat/batch':
+            try:
+                user_id = "user123"  # Default test user
+                body = self._get_request_body()
+                items = body.get('messages')
+
+                if not isinstance(items, list) or not items:
+                    self._set_headers(status_code=400)
+                    self.wfile.write(encode_json({'error': 'messages must be a non-empty list'}))
+                    return
+                if len(items) > BATCH_MAX_MESSAGES:
+                    self._set_headers(status_code=413)
+                    response = {'error': f'A batch may hold at most {BATCH_MAX_MESSAGES} messages'}
+                    self.wfile.write(encode_json(response))
+                    return
+
+                started = time.monotonic()
+                results = process_batch(items, user_id, body.get('provider'),
+                                        body.get('api_keys', {}))
+
+                # Stream results in completion order as NDJSON when requested
+                if body.get('stream') or 'application/x-ndjson' in self.headers.get('Accept', ''):
+                    self._stream_ndjson(results)
+                    return
+
+                ordered = sorted(results, key=lambda result: result['index'])
+                self._set_headers()
+                self.wfile.write(encode_json({
+                    'results': ordered,
+                    'count': len(ordered),
+                    'failed': sum(1 for result in ordered if 'error' in result),
+                    'elapsed_ms': round((time.monotonic() - started) * 1000)
+                }))
+                return
+
+            except Exception as e:
+                logger.error(f"Error processing batch: {str(e)}")
+                self._set_headers(status_code=500)
+                response = {'error': f'Internal server error: {str(e)}'}
+                self.wfile.write(encode_json(response))
                 return
 
         # Handle 404 for any other path
         self._set_headers(status_code=404)
         response = {'error': 'Not found', 'path': self.path}
-        self.wfile.write(json.dumps(response).encode('utf-8'))
+        self.wfile.write(encode_json(response))
 
-if __name__ == '__main__':
-    print(f"Starting Multi-LLM Lawyer Bot server on port {PORT}...")
-    try:
-        with socketserver.TCPServer(("", PORT), HTTPRequestHandler) as httpd:
-            print(f"Server running at http://localhost:{PORT}")
-            print(f"Health check endpoint: http://localhost:{PORT}/api/health")
-            print(f"Available LLM providers: {available_providers}")
-            print(f"Default provider: {default_provider if available_providers else 'None (rule-based)'}")
+startup_profiler.mark('module_loaded')
+
+def _warm_up_providers():
+    """Import provider SDKs and build the default clients off the request path"""
+    for name, key in (("openai", openai_key), ("gemini", gemini_key), ("mistral", mistral_key)):
+        if name not in available_providers:
+            continue
+        try:
+            with startup_profiler.phase(f'warmup_{name}'):
+                client_registry.get(name, key)
+        except Exception as e:
+            logger.warning(f"Warming up {name} failed: {str(e)}")
+    startup_profiler.mark('warm')
+    startup_profiler.uninstall()
 
-            httpd.serve_forever()
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options, falling back to environment settings"""
+    parser = argparse.ArgumentParser(description="Multi-LLM Lawyer Bot backend server")
+    parser.add_argument('--port', type=int, default=PORT, help="Port to listen on (env: PORT)")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', 1)),
+                        help="Server processes sharing the port via SO_REUSEPORT; "
+                             "needs SQLITE_PATH (env: WORKERS)")
+    parser.add_argument('--threads', type=int, default=MAX_WORKERS,
+                        help="Worker threads handling requests concurrently (env: MAX_WORKERS)")
+    parser.add_argument('--queue-size', type=int, default=ACCEPT_QUEUE_SIZE,
+                        help="Accepted connections allowed to wait for a worker "
+                             "before returning 503 (env: ACCEPT_QUEUE_SIZE)")
+    parser.add_argument('--drain-timeout', type=float, default=SHUTDOWN_DRAIN_TIMEOUT,
+                        help="Seconds to wait for in-flight requests on shutdown "
+                             "(env: SHUTDOWN_DRAIN_TIMEOUT)")
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false',
+                        default=os.getenv('PROVIDER_WARMUP', 'true').lower()
+                        in ('1', 'true', 'yes'),
+                        help="Load provider SDKs on first use instead of right after startup "
+                             "(env: PROVIDER_WARMUP)")
+    return parser.parse_args(argv)
+
+def run_server(args: argparse.Namespace):
+    """Run the threaded HTTP server until interrupted, then drain in-flight requests"""
+    global http_server
+    from serving import BoundedThreadPoolServer
+
+    httpd = BoundedThreadPoolServer(
+        ("", args.port),
+        HTTPRequestHandler,
+        max_workers=args.threads,
+        max_queue=args.queue_size,
+        drain_timeout=args.drain_timeout,
+        reuse_port=SHARED_STATE
+    )
+    http_server = httpd
+    startup_profiler.mark('listening')
+
+    def handle_sigterm(signum, frame):
+        # shutdown() blocks until serve_forever exits, so it must run off the main thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    if SHARED_STATE:
+        # Do not keep serving the port as an orphan if the supervisor is killed
+        watch_supervisor(lambda: handle_sigterm(signal.SIGTERM, None))
+
+    if SHARED_STATE:
+        print(f"Worker {WORKER_ID}/{WORKER_COUNT} (pid {os.getpid()}) "
+              f"serving http://localhost:{args.port}")
+    print(f"Server running at http://localhost:{args.port}")
+    print(f"Health check endpoint: http://localhost:{args.port}/api/health")
+    print(f"Worker threads: {args.threads}, accept queue: {args.queue_size}")
+    print(f"Available LLM providers: {available_providers}")
+    print(f"Default provider: {default_provider if available_providers else 'None (rule-based)'}")
+
+    # Build the retrieval index for stored documents in the background
+    indexing_executor.submit(_index_existing_documents)
+
+    # The socket is bound, so /api/health already answers while the SDKs load
+    if args.warmup:
+        threading.Thread(target=_warm_up_providers, name='provider-warmup', daemon=True).start()
+    else:
+        startup_profiler.uninstall()
+
+    try:
+        httpd.serve_forever()
     except KeyboardInterrupt:
+        pass
+    finally:
+        print("Draining in-flight requests...")
+        httpd.server_close()
+        # Let running analyses finish; queued ones are dropped and reported as interrupted
+        analysis_jobs.shutdown(wait=True)
+        if persistence is not None:
+            # Commit everything queued by the drained requests before exiting
+            persistence.close()
         print("Server stopped.")
+
+if __name__ == '__main__':
+    cli_args = parse_args()
+    print(f"Starting Multi-LLM Lawyer Bot server on port {cli_args.port}...")
+    run_server(cli_args)
@@ -0,0 +1,94 @@
+"""Hedged requests: race a backup call against a slow primary.
+
+The primary call starts immediately. If it has not finished after ``delay``
+seconds (or fails before then), the backup call is started as well and the
+first successful result wins. The losing call cannot be interrupted once it is
+running; its result is simply ignored.
+"""
+
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class HedgedCallError(Exception):
+    """Raised when every call in a hedged race failed"""
+
+    def __init__(self, errors: List[Tuple[str, Exception]]):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors))
+
+
+class HedgeStats:
+    """Counters describing how hedged races played out"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.races = 0
+        self.backups_fired = 0
+        self.wins: Dict[str, int] = {'primary': 0, 'backup': 0}
+        self.winners_by_provider: Dict[str, int] = {}
+        self.failed = 0
+
+    def record(self, winner_role: str, winner_name: str, backup_fired: bool):
+        with self._lock:
+            self.races += 1
+            if backup_fired:
+                self.backups_fired += 1
+            self.wins[winner_role] += 1
+            self.winners_by_provider[winner_name] = self.winners_by_provider.get(winner_name, 0) + 1
+
+    def record_failure(self):
+        with self._lock:
+            self.races += 1
+            self.backups_fired += 1
+            self.failed += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'races': self.races,
+                'backupsFired': self.backups_fired,
+                'primaryWins': self.wins['primary'],
+                'backupWins': self.wins['backup'],
+                'failed': self.failed,
+                'winnersByProvider': dict(self.winners_by_provider)
+            }
+
+
+def hedged_call(executor: Executor, primary: Tuple[str, Callable[[], Any]],
+                backup: Tuple[str, Callable[[], Any]], delay: float,
+                stats: HedgeStats = None) -> Tuple[str, str, Any, bool]:
+    """Race ``backup`` against ``primary`` once ``delay`` seconds have passed.
+
+    ``primary`` and ``backup`` are ``(name, fn)`` pairs. Returns
+    ``(role, name, result, backup_fired)`` for the winning call, where role is
+    ``'primary'`` or ``'backup'``. Raises HedgedCallError if both calls fail.
+    """
+    futures: Dict[Future, Tuple[str, str]] = {}
+    futures[executor.submit(primary[1])] = ('primary', primary[0])
+
+    done, _ = wait(list(futures), timeout=delay)
+    backup_fired = False
+    errors: List[Tuple[str, Exception]] = []
+
+    while True:
+        for future in done:
+            role, name = futures.pop(future)
+            error = future.exception()
+            if error is None:
+                if stats is not None:
+                    stats.record(role, name, backup_fired)
+                return role, name, future.result(), backup_fired
+            errors.append((name, error))
+
+        if not backup_fired:
+            # Primary is slow or has already failed: start the backup
+            backup_fired = True
+            futures[executor.submit(backup[1])] = ('backup', backup[0])
+        elif not futures:
+            if stats is not None:
+                stats.record_failure()
+            raise HedgedCallError(errors)
+
+        done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
@@ -0,0 +1,185 @@
+"""Bounded background job queue for long-running work such as document analysis.
+
+Handlers submit a job and answer ``202 Accepted`` straight away; clients poll
+the job for its status (``queued``, ``running``, ``done`` or ``failed``),
+progress and result. Jobs run on a fixed-size worker pool, and once
+``max_pending`` jobs are queued or running, ``submit`` refuses new work instead
+of letting the backlog grow without bound. Finished jobs are kept for polling
+until ``max_finished`` newer ones have completed.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('multi_llm_server')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFullError(Exception):
+    """The queue already holds its maximum number of pending jobs"""
+
+
+class Job:
+    """A unit of background work and its observable state"""
+
+    __slots__ = ('id', 'kind', 'target_id', 'status', 'progress', 'result', 'error',
+                 'created_at', 'started_at', 'finished_at', 'on_status')
+
+    def __init__(self, kind: str, target_id: Optional[str],
+                 on_status: Optional[Callable[['Job'], None]] = None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.target_id = target_id
+        self.status = QUEUED
+        self.progress: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.on_status = on_status
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def set_progress(self, done: int, total: int):
+        self.progress = {'done': done, 'total': total}
+
+    def _set_status(self, status: str):
+        self.status = status
+        if self.on_status is not None:
+            try:
+                self.on_status(self)
+            except Exception as e:
+                logger.error(f"Status callback for job {self.id} failed: {str(e)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(timestamp: Optional[float]) -> Optional[str]:
+            if not timestamp:
+                return None
+            return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp))
+
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'target_id': self.target_id,
+            'status': self.status,
+            'progress': self.progress,
+            'created_at': iso(self.created_at),
+            'started_at': iso(self.started_at),
+            'finished_at': iso(self.finished_at)
+        }
+        if self.status == DONE:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """Runs submitted jobs on a bounded worker pool and keeps them available for polling"""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, max_finished: int = 256):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._active_by_target: Dict[str, Job] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, kind: str, target_id: Optional[str], fn: Callable[[Job], Any],
+               on_status: Optional[Callable[[Job], None]] = None) -> Job:
+        """Queue ``fn(job)`` and return the job.
+
+        If a job for the same ``target_id`` is still queued or running, that
+        job is returned instead of starting a duplicate. Raises
+        JobQueueFullError when ``max_pending`` jobs are already outstanding.
+        """
+        with self._lock:
+            existing = self._active_by_target.get(target_id) if target_id is not None else None
+            if existing is not None and existing.active:
+                return existing
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise JobQueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+            job = Job(kind, target_id, on_status)
+            self._pending += 1
+            self._jobs[job.id] = job
+            if target_id is not None:
+                self._active_by_target[target_id] = job
+        job._set_status(QUEUED)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        job.started_at = time.time()
+        job._set_status(RUNNING)
+        try:
+            job.result = fn(job)
+            status = DONE
+        except Exception as e:
+            logger.error(f"{job.kind} job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            status = FAILED
+        job.finished_at = time.time()
+        # Publish the final state before a follow-up job for the same target can be accepted
+        job._set_status(status)
+        with self._lock:
+            self._pending -= 1
+            if status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if self._active_by_target.get(job.target_id) is job:
+                del self._active_by_target[job.target_id]
+        self._prune()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond ``max_finished``"""
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest_for(self, target_id: str) -> Optional[Job]:
+        """Most recently submitted job still known for ``target_id``"""
+        with self._lock:
+            active = self._active_by_target.get(target_id)
+            if active is not None:
+                return active
+            for job in reversed(self._jobs.values()):
+                if job.target_id == target_id:
+                    return job
+        return None
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work, drop jobs that have not started, optionally wait for running ones"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pending': self._pending,
+                'maxPending': self.max_pending,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,185 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms are plain dicts keyed by label tuples behind
+one lock. Recording a sample is a dict lookup plus a bisect into the bucket
+bounds, which costs a few microseconds. Series are only formatted when
+``/api/metrics`` is scraped. Collectors registered with ``add_collector``
+add point-in-time gauges, such as queue depths, at scrape time.
+
+Request paths are reduced to route templates (IDs become ``{id}``), and the
+number of distinct routes is capped, so stray URLs cannot grow the series
+without bound.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; spans fast local endpoints through slow LLM completions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+_ID_SEGMENT = re.compile(r'^(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27}|[0-9a-fA-F]{16,})$')
+
+# One metric family from a collector: (name, type, help, [(labels, value)])
+Family = Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]
+
+
+def route_template(path: str) -> str:
+    """``/documents/<uuid>/analyze?x=1`` -> ``/api/documents/{id}/analyze``"""
+    path = path.split('?', 1)[0]
+    if not path.startswith('/api/') and path not in ('/', '/api'):
+        path = '/api' + path
+    return '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment
+                    for segment in path.split('/'))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and not value.is_integer():
+        return repr(float(value))
+    return str(int(value))
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, size: int):
+        self.counts = [0] * (size + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """Thread-safe store of counters, gauges and histograms with Prometheus text output"""
+
+    def __init__(self, max_routes: int = 200):
+        self.max_routes = max_routes
+        self._families: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._gauges: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, _Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._routes = set()
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self._families[name] = ('counter', help_text, tuple(labels))
+        self._counters[name] = {}
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self._families[name] = ('gauge', help_text, tuple(labels))
+        self._gauges[name] = {}
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS):
+        self._families[name] = ('histogram', help_text, tuple(labels))
+        self._histograms[name] = {}
+        self._buckets[name] = tuple(buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Register a callable producing extra gauge families at scrape time"""
+        self._collectors.append(collector)
+
+    def route(self, path: str) -> str:
+        """Route label for ``path``; new routes beyond ``max_routes`` are reported as ``other``"""
+        template = route_template(path)
+        if template in self._routes:
+            return template
+        with self._lock:
+            if len(self._routes) >= self.max_routes:
+                return 'other'
+            self._routes.add(template)
+        return template
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1):
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def add(self, name: str, labels: tuple = (), amount: float = 1):
+        """Move a gauge by ``amount`` (negative to decrease)"""
+        with self._lock:
+            series = self._gauges[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float):
+        index = bisect_left(self._buckets[name], value)
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = _Histogram(len(self._buckets[name]))
+            histogram.counts[index] += 1
+            histogram.total += value
+            histogram.count += 1
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text, label_names) in self._families.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'histogram':
+                    bounds = self._buckets[name]
+                    for labels, histogram in self._histograms[name].items():
+                        cumulative = 0
+                        for bound, count in zip(bounds + (float('inf'),), histogram.counts):
+                            cumulative += count
+                            le = f'le="{_format_value(bound)}"'
+                            bucket_labels = _format_labels(label_names, labels, le)
+                            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                        label_text = _format_labels(label_names, labels)
+                        total = _format_value(histogram.total)
+                        lines.append(f'{name}_sum{label_text} {total}')
+                        lines.append(f'{name}_count{label_text} {histogram.count}')
+                else:
+                    series = self._counters[name] if kind == 'counter' else self._gauges[name]
+                    for labels, value in series.items():
+                        label_text = _format_labels(label_names, labels)
+                        lines.append(f'{name}{label_text} {_format_value(value)}')
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    label_text = _format_labels(list(labels), list(labels.values()))
+                    lines.append(f'{name}{label_text} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class CountingWriter:
+    """Wraps a response stream and counts the bytes written through it"""
+
+    __slots__ = ('_stream', 'bytes_written')
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_written = 0
+
+    def write(self, data) -> int:
+        self.bytes_written += len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
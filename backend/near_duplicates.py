@@ -0,0 +1,191 @@
+"""Near-duplicate detection for uploaded documents using MinHash and LSH.
+
+Each document's text is broken into word shingles, and a MinHash signature
+is computed over the shingle hashes. The signature's agreement rate with
+another document's signature estimates their Jaccard similarity. Signatures
+are split into bands and each band is hashed into a bucket, so a lookup only
+compares documents that share at least one bucket instead of scanning every
+upload.
+
+NumPy is optional. When it is installed, a signature is computed block-wise
+as one vectorized min over all permutations; otherwise a pure-Python loop
+produces the identical signature.
+
+Large documents are sampled before hashing: only the ``max_shingles``
+smallest shingle hashes are kept. The rule is the same for every document,
+so two versions of a long contract keep nearly the same sample, and the cost
+of a signature stays bounded however large the upload.
+"""
+
+import difflib
+import heapq
+import re
+import random
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_TOKEN = re.compile(r"\w+")
+
+# Prime just above 2**32; with a < 2**31 and hashes < 2**32, a * x + b fits in an unsigned
+# 64-bit integer
+_PRIME = 4294967311
+_MAX_HASH = (1 << 32) - 1
+
+# Shingle hashes processed per vectorized block, bounding the temporary (block x num_perm) matrix
+_BLOCK_SIZE = 4096
+
+
+def shingle_hashes(text: str, size: int = 5) -> List[int]:
+    """Distinct 32-bit hashes of the text's word ``size``-grams"""
+    tokens = _TOKEN.findall(text.lower())
+    if not tokens:
+        return []
+    if len(tokens) <= size:
+        return [zlib.crc32(' '.join(tokens).encode('utf-8'))]
+    return list({zlib.crc32(' '.join(tokens[i:i + size]).encode('utf-8'))
+                 for i in range(len(tokens) - size + 1)})
+
+
+class MinHasher:
+    """Computes fixed-length MinHash signatures from universal hash permutations"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1,
+                 max_shingles: int = 8192):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_shingles = max_shingles
+        rng = random.Random(seed)
+        self._a = [rng.randrange(1, 1 << 31) for _ in range(num_perm)]
+        self._b = [rng.randrange(0, 1 << 32) for _ in range(num_perm)]
+        if np is not None:
+            self._a_vector = np.array(self._a, dtype=np.uint64)
+            self._b_vector = np.array(self._b, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of ``text``, or None if it contains no words"""
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not hashes:
+            return None
+        if self.max_shingles and len(hashes) > self.max_shingles:
+            hashes = heapq.nsmallest(self.max_shingles, hashes)
+        if np is not None:
+            return self._signature_numpy(hashes)
+        return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in zip(self._a, self._b))
+
+    def _signature_numpy(self, hashes: List[int]) -> Tuple[int, ...]:
+        values = np.array(hashes, dtype=np.uint64)
+        prime = np.uint64(_PRIME)
+        signature = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        for start in range(0, len(values), _BLOCK_SIZE):
+            block = values[start:start + _BLOCK_SIZE, None]
+            permuted = (block * self._a_vector + self._b_vector) % prime
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return tuple(int(v) for v in signature)
+
+
+def similarity(first: Sequence[int], second: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    if np is not None:
+        return float(np.mean(np.asarray(first) == np.asarray(second)))
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+class LSHIndex:
+    """Banded locality-sensitive hash index over MinHash signatures"""
+
+    def __init__(self, num_perm: int = 128, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: Sequence[int]) -> List[int]:
+        rows = self.rows
+        return [hash(tuple(signature[i * rows:(i + 1) * rows])) for i in range(self.bands)]
+
+    def add(self, document_id: str, signature: Sequence[int]):
+        signature = tuple(signature)
+        with self._lock:
+            self._remove(document_id)
+            self._signatures[document_id] = signature
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                band.setdefault(key, set()).add(document_id)
+
+    def remove(self, document_id: str):
+        with self._lock:
+            self._remove(document_id)
+
+    def _remove(self, document_id: str):
+        signature = self._signatures.pop(document_id, None)
+        if signature is None:
+            return
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            members = band.get(key)
+            if members is not None:
+                members.discard(document_id)
+                if not members:
+                    del band[key]
+
+    def query(self, signature: Sequence[int], threshold: float = 0.8,
+              exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Documents sharing a bucket with ``signature``, estimated similarity >= ``threshold``"""
+        with self._lock:
+            candidates = set()
+            for band, key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(band.get(key, ()))
+            candidates.discard(exclude)
+            matches = [(doc_id, similarity(signature, self._signatures[doc_id]))
+                       for doc_id in candidates]
+        matches = [(doc_id, round(score, 3)) for doc_id, score in matches if score >= threshold]
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'documents': len(self._signatures),
+                'bands': self.bands,
+                'rows': self.rows,
+                'vectorized': np is not None
+            }
+
+
+def clause_diff(old_text: str, new_text: str, max_changes: int = 10) -> Dict[str, Any]:
+    """Paragraph-level differences between two versions of a document"""
+    def paragraphs(text: str) -> List[str]:
+        return [' '.join(p.split()) for p in re.split(r'\n\s*\n', text) if p.strip()]
+
+    old, new = paragraphs(old_text), paragraphs(new_text)
+    added = removed = modified = 0
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if tag == 'insert':
+            added += j2 - j1
+        elif tag == 'delete':
+            removed += i2 - i1
+        else:
+            modified += max(i2 - i1, j2 - j1)
+        if len(changes) < max_changes:
+            changes.append({
+                'type': {'insert': 'added', 'delete': 'removed', 'replace': 'modified'}[tag],
+                'before': ' '.join(old[i1:i2])[:300],
+                'after': ' '.join(new[j1:j2])[:300]
+            })
+    return {
+        'identical': not (added or removed or modified),
+        'added_clauses': added,
+        'removed_clauses': removed,
+        'modified_clauses': modified,
+        'changes': changes
+    }
@@ -0,0 +1,440 @@
+"""SQLite persistence for conversations and documents.
+
+The database runs in WAL mode so readers never block the single writer.
+Writes are not executed on the request thread: they are queued and a
+background writer commits them in batches, so request latency does not
+include an fsync. ``flush()`` waits until everything queued so far is
+committed, and ``close()`` flushes before shutting the writer down. If a
+batch fails, its statements are retried one at a time, retrying busy or
+locked errors a few times. Only a statement that still fails is dropped, and
+it is counted in ``failed_writes``.
+
+When several worker processes share the database (``write_behind=False``),
+each write is committed before the call returns, so another worker reading
+right after sees it. Revision numbers (the newest message sequence per user,
+and a counter bumped by triggers on every document change) let the
+in-memory stores tell cheaply whether another process changed their data.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('multi_llm_server')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id TEXT,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    provider TEXT,
+    meta TEXT,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, seq);
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    user_id TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    cache_key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO revisions (name, value) VALUES ('documents', 0);
+CREATE TRIGGER IF NOT EXISTS documents_inserted AFTER INSERT ON documents
+    BEGIN UPDATE revisions SET value = value + 1 WHERE name = 'documents'; END;
+CREATE TRIGGER IF NOT EXISTS documents_updated AFTER UPDATE ON documents
+    BEGIN UPDATE revisions SET value = value + 1 WHERE name = 'documents'; END;
+CREATE TRIGGER IF NOT EXISTS documents_deleted AFTER DELETE ON documents
+    BEGIN UPDATE revisions SET value = value + 1 WHERE name = 'documents'; END;
+"""
+
+
+class _Flush:
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class SQLitePersistence:
+    """Write-behind SQLite backend shared by the conversation and document stores"""
+
+    def __init__(self, path: str, batch_size: int = 256, batch_interval: float = 0.05,
+                 write_behind: bool = True):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.write_behind = write_behind
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        # Workers starting together must not both apply the same migration
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._migrate(connection)
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        # Busy/locked retries per statement before it is dropped
+        self.max_retries = 3
+        self.split_batches = 0
+        self.failed_writes = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        mode = 'write-behind' if write_behind else 'synchronous writes'
+        logger.info(f"SQLite persistence enabled at {path} (WAL mode, {mode})")
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection):
+        """Bring databases created by older versions up to the current schema"""
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+        if 'message_id' not in columns:
+            connection.execute("ALTER TABLE messages ADD COLUMN message_id TEXT")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (timestamp)")
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(documents)")}
+        if 'created_at' not in columns:
+            connection.execute("ALTER TABLE documents ADD COLUMN created_at REAL")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection; WAL lets readers run alongside the writer"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+            self._local.connection = connection
+        return connection
+
+    # Writes
+
+    def _enqueue(self, statement: str, params: Tuple) -> Optional[int]:
+        """Queue a write; with synchronous writes, commit it and return its row ID"""
+        if self._closed:
+            raise RuntimeError("Persistence backend is closed")
+        with self._pending_lock:
+            self._pending += 1
+        if not self.write_behind:
+            # Other processes read the database directly, so commit before returning
+            return self._commit(self._connection(), [(statement, params)])
+        self._queue.put((statement, params))
+        return None
+
+    def save_message(self, user_id: str, message_id: str, role: str, content: str,
+                     provider: Optional[str], meta: Optional[Dict[str, Any]],
+                     timestamp: float) -> Optional[int]:
+        """Store a message; with synchronous writes, returns its sequence number"""
+        return self._enqueue(
+            "INSERT INTO messages (message_id, user_id, role, content, provider, meta, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (message_id, user_id, role, content, provider, json.dumps(meta) if meta else None,
+             timestamp)
+        )
+
+    def delete_messages(self, user_id: str):
+        self._enqueue("DELETE FROM messages WHERE user_id = ?", (user_id,))
+
+    def save_document(self, document: Dict[str, Any]):
+        now = time.time()
+        self._enqueue(
+            "INSERT INTO documents (id, user_id, data, updated_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data, "
+            "updated_at = excluded.updated_at",
+            (document['id'], document.get('user_id'), json.dumps(document), now, now)
+        )
+
+    def delete_document(self, document_id: str):
+        self._enqueue("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def save_analysis(self, cache_key: str, result: Dict[str, Any], last_used: float):
+        self._enqueue(
+            "INSERT OR REPLACE INTO analysis_cache (cache_key, result, last_used) VALUES (?, ?, ?)",
+            (cache_key, json.dumps(result), last_used)
+        )
+
+    def touch_analysis(self, cache_key: str, last_used: float):
+        self._enqueue(
+            "UPDATE analysis_cache SET last_used = ? WHERE cache_key = ?", (last_used, cache_key)
+        )
+
+    def delete_analysis(self, cache_key: str):
+        self._enqueue("DELETE FROM analysis_cache WHERE cache_key = ?", (cache_key,))
+
+    def prune_analyses(self, keep: int):
+        """Delete all but the ``keep`` most recently used cached analyses"""
+        self._enqueue(
+            "DELETE FROM analysis_cache WHERE cache_key NOT IN "
+            "(SELECT cache_key FROM analysis_cache ORDER BY last_used DESC LIMIT ?)",
+            (keep,)
+        )
+
+    def _writer_loop(self):
+        connection = self._connection()
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.batch_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, _Flush):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._commit(connection, batch)
+            for waiter in waiters:
+                waiter.done.set()
+            if stop:
+                return
+
+    def _commit(self, connection: sqlite3.Connection,
+                batch: List[Tuple[str, Tuple]]) -> Optional[int]:
+        """Commit the batch in one transaction; returns the row ID of the last statement.
+
+        If the transaction fails, each statement is retried in a transaction of
+        its own, so a single bad write does not take the rest of the batch with it.
+        """
+        try:
+            try:
+                return self._execute(connection, batch)
+            except sqlite3.Error as e:
+                if len(batch) == 1:
+                    return self._retry(connection, batch[0], e)
+                self.split_batches += 1
+                logger.warning(
+                    f"Batch of {len(batch)} write(s) failed ({str(e)}); retrying them one at a time"
+                )
+            row_id = None
+            for statement in batch:
+                try:
+                    row_id = self._execute(connection, [statement])
+                except sqlite3.Error as e:
+                    row_id = self._retry(connection, statement, e)
+            return row_id
+        finally:
+            with self._pending_lock:
+                self._pending -= len(batch)
+
+    def _execute(self, connection: sqlite3.Connection,
+                 batch: List[Tuple[str, Tuple]]) -> Optional[int]:
+        try:
+            connection.execute("BEGIN")
+            for statement, params in batch:
+                cursor = connection.execute(statement, params)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            try:
+                connection.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            raise
+        self.batches += 1
+        self.writes += len(batch)
+        return cursor.lastrowid
+
+    def _retry(self, connection: sqlite3.Connection, statement: Tuple[str, Tuple],
+               error: sqlite3.Error) -> Optional[int]:
+        """Retry a failed write while the database is busy or locked; drop it if that cannot help"""
+        for attempt in range(self.max_retries):
+            if not isinstance(error, sqlite3.OperationalError):
+                # Constraint and data errors fail the same way every time
+                break
+            time.sleep(0.05 * 2 ** attempt)
+            try:
+                return self._execute(connection, [statement])
+            except sqlite3.Error as e:
+                error = e
+        self.failed_writes += 1
+        logger.error(f"Dropped write after it failed: {str(error)} ({statement[0][:60]}...)")
+        return None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every write queued before this call has been committed"""
+        if self._closed or not self.write_behind:
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = 30.0):
+        """Flush pending writes and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+        if self._writer.is_alive():
+            logger.warning(
+                f"SQLite writer did not finish within {timeout}s; {self._pending} write(s) pending"
+            )
+        else:
+            logger.info(
+                f"SQLite persistence flushed and closed "
+                f"({self.writes} write(s) in {self.batches} batch(es))"
+            )
+
+    # Reads
+
+    def _read(self, statement: str, params: Tuple = ()) -> List[Tuple]:
+        if self._pending:
+            # Make our own queued writes visible before reading them back
+            self.flush()
+        return self._connection().execute(statement, params).fetchall()
+
+    def load_messages(self, user_id: str, limit: int
+                      ) -> List[Tuple[str, str, str, Optional[str], Optional[Dict], float]]:
+        """Return the user's most recent messages, oldest first.
+
+        Rows are ``(message_id, role, content, provider, meta, timestamp)``;
+        rows written before message IDs existed get a stable ID derived from
+        their sequence number.
+        """
+        rows = self._read(
+            "SELECT seq, message_id, role, content, provider, meta, timestamp FROM messages "
+            "WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+            (user_id, limit)
+        )
+        return [
+            (message_id or f"seq-{seq}", role, content, provider,
+             json.loads(meta) if meta else None, timestamp)
+            for seq, message_id, role, content, provider, meta, timestamp in reversed(rows)
+        ]
+
+    def has_messages(self, user_id: str) -> bool:
+        return bool(self._read("SELECT 1 FROM messages WHERE user_id = ? LIMIT 1", (user_id,)))
+
+    def message_revision(self, user_id: str, before: Optional[int] = None) -> int:
+        """Sequence number of the user's newest message (0 if none), or newest below ``before``"""
+        if before is None:
+            (revision,), = self._read(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE user_id = ?", (user_id,)
+            )
+        else:
+            (revision,), = self._read(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE user_id = ? AND seq < ?",
+                (user_id, before)
+            )
+        return revision
+
+    def documents_revision(self) -> int:
+        """Counter bumped by every document insert, update and delete"""
+        (revision,), = self._read("SELECT value FROM revisions WHERE name = 'documents'")
+        return revision
+
+    def load_documents(self) -> List[Dict[str, Any]]:
+        rows = self._read("SELECT data FROM documents ORDER BY rowid")
+        return [json.loads(data) for (data,) in rows]
+
+    def load_analyses(self, limit: int) -> List[Tuple[str, Dict[str, Any], float]]:
+        """Return the ``limit`` most recently used cached analyses, least recent first"""
+        rows = self._read(
+            "SELECT cache_key, result, last_used FROM analysis_cache "
+            "ORDER BY last_used DESC LIMIT ?", (limit,)
+        )
+        return [
+            (cache_key, json.loads(result), last_used)
+            for cache_key, result, last_used in reversed(rows)
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate counts used to seed dashboard statistics after a restart"""
+        user_ids = [user_id for (user_id,) in self._read("SELECT DISTINCT user_id FROM messages")]
+        (documents,), = self._read("SELECT COUNT(*) FROM documents")
+        role_counts = dict(self._read("SELECT role, COUNT(*) FROM messages GROUP BY role"))
+        provider_usage = dict(self._read(
+            "SELECT provider, COUNT(*) FROM messages "
+            "WHERE role = 'assistant' AND provider IS NOT NULL GROUP BY provider"
+        ))
+        return {
+            'user_ids': user_ids,
+            'documents': documents,
+            'user_messages': role_counts.get('user', 0),
+            'total_messages': sum(role_counts.values()),
+            'provider_usage': provider_usage
+        }
+
+    def activity(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Dashboard counts computed from the database, for when several processes record them"""
+        now = now if now is not None else time.time()
+        (conversations,), = self._read("SELECT COUNT(DISTINCT user_id) FROM messages")
+        (documents,), = self._read("SELECT COUNT(*) FROM documents")
+        role_counts = dict(self._read("SELECT role, COUNT(*) FROM messages GROUP BY role"))
+        provider_usage = dict(self._read(
+            "SELECT provider, COUNT(*) FROM messages "
+            "WHERE role = 'assistant' AND provider IS NOT NULL GROUP BY provider"
+        ))
+        recent = {}
+        for name, seconds in (('day', 86400), ('hour', 3600)):
+            since = now - seconds
+            roles = dict(self._read(
+                "SELECT role, COUNT(*) FROM messages WHERE timestamp > ? GROUP BY role", (since,)
+            ))
+            (uploads,), = self._read(
+                "SELECT COUNT(*) FROM documents WHERE COALESCE(created_at, updated_at) > ?",
+                (since,)
+            )
+            recent[name] = {
+                'chats': roles.get('assistant', 0),
+                'queries': roles.get('user', 0),
+                'documents': uploads
+            }
+        return {
+            'conversations': conversations,
+            'documents': documents,
+            'user_messages': role_counts.get('user', 0),
+            'total_messages': sum(role_counts.values()),
+            'provider_usage': provider_usage,
+            'recent': recent
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'write_behind': self.write_behind,
+            'pending_writes': self._pending,
+            'committed_writes': self.writes,
+            'batches': self.batches,
+            'split_batches': self.split_batches,
+            'failed_writes': self.failed_writes
+        }
@@ -0,0 +1,176 @@
+"""Pre-fork mode: one supervisor process running several server workers.
+
+``python fixed_server.py --workers N`` starts a supervisor that launches N
+copies of the server script with ``SERVER_WORKER_ID`` set. Each worker binds
+the port with ``SO_REUSEPORT`` and the kernel spreads new connections across
+them, so CPU-bound request work (JSON, compression, multipart parsing,
+retrieval) runs on every core instead of queueing behind one GIL. Workers keep
+chat history, documents and job state in the shared SQLite database.
+
+Workers are fresh interpreters rather than ``fork()`` copies, so no threads,
+SQLite connections or held locks are inherited half-way. The supervisor
+restarts a worker that exits unexpectedly, backing off when one keeps
+crashing. On SIGTERM or SIGINT it asks every worker to drain and waits for
+them; workers still running after the drain timeout are killed. A worker that
+exits with ``EXIT_CONFIG`` reports a configuration error no restart can fix,
+so the supervisor stops. Workers exit on their own if the supervisor dies.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger('multi_llm_server')
+
+# sysexits.h EX_CONFIG: the worker cannot start with this configuration
+EXIT_CONFIG = 78
+
+# Restart delay doubles per consecutive crash, up to this many seconds
+RESTART_BACKOFF_MAX = 30.0
+# A worker that stays up this long is considered healthy again
+STABLE_SECONDS = 30.0
+
+
+def requested_workers(argv: List[str]) -> int:
+    """Worker processes asked for with ``--workers`` (env: WORKERS); 1 means no supervisor"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WORKERS', 1)))
+    known, _ = parser.parse_known_args(argv)
+    return known.workers
+
+
+class _Worker:
+    __slots__ = ('worker_id', 'process', 'started', 'failures', 'restart_at')
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.process: Optional[subprocess.Popen] = None
+        self.started = 0.0
+        self.failures = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """Keeps ``workers`` copies of ``command`` running until told to stop"""
+
+    def __init__(self, command: List[str], workers: int, drain_timeout: float = 30.0,
+                 env: Optional[Dict[str, str]] = None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.command = command
+        self.drain_timeout = drain_timeout
+        self.env = dict(env if env is not None else os.environ)
+        # ETags must validate on whichever worker serves the next request
+        self.env.setdefault('ETAG_EPOCH', uuid.uuid4().hex[:8])
+        self._workers = [_Worker(index) for index in range(workers)]
+        self._stop_signal: Optional[int] = None
+        self.restarts = 0
+
+    def _spawn(self, worker: _Worker):
+        env = dict(self.env, SERVER_WORKER_ID=str(worker.worker_id),
+                   SERVER_WORKERS=str(len(self._workers)))
+        worker.process = subprocess.Popen(self.command, env=env)
+        worker.started = time.monotonic()
+        logger.info(f"Started worker {worker.worker_id} (pid {worker.process.pid})")
+
+    def _request_stop(self, signum, frame):
+        self._stop_signal = signum
+
+    def run(self) -> int:
+        """Supervise until SIGTERM/SIGINT or a configuration error; returns the exit status"""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        for worker in self._workers:
+            self._spawn(worker)
+
+        status = 0
+        while self._stop_signal is None:
+            now = time.monotonic()
+            for worker in self._workers:
+                if worker.process is None:
+                    if now >= worker.restart_at:
+                        self._spawn(worker)
+                    continue
+                code = worker.process.poll()
+                if code is None:
+                    if worker.failures and now - worker.started >= STABLE_SECONDS:
+                        worker.failures = 0
+                    continue
+                pid, worker.process = worker.process.pid, None
+                if code == EXIT_CONFIG:
+                    logger.error(f"Worker {worker.worker_id} (pid {pid}) cannot start "
+                                 "with this configuration; stopping")
+                    status = EXIT_CONFIG
+                    break
+                worker.failures += 1
+                delay = min(RESTART_BACKOFF_MAX, 0.5 * 2 ** (worker.failures - 1))
+                worker.restart_at = now + delay
+                self.restarts += 1
+                logger.warning(f"Worker {worker.worker_id} (pid {pid}) exited with status {code}; "
+                               f"restarting in {delay:.1f}s")
+            if status:
+                break
+            time.sleep(0.2)
+
+        self._stop_workers()
+        return status
+
+    def _stop_workers(self):
+        running = [worker.process for worker in self._workers if worker.process is not None]
+        if not running:
+            return
+        logger.info(f"Stopping {len(running)} worker(s)...")
+        for process in running:
+            try:
+                process.send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+        # Workers drain in-flight requests first, then flush their database writes
+        deadline = time.monotonic() + self.drain_timeout + 5.0
+        for process in running:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker pid {process.pid} did not stop within "
+                               f"{self.drain_timeout}s; killing it")
+                process.kill()
+                process.wait()
+
+
+def run_supervisor(script: str, argv: List[str]) -> int:
+    """Run ``script`` as ``--workers`` server processes sharing one port"""
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        logger.error("--workers needs SO_REUSEPORT, which this platform does not provide")
+        return EXIT_CONFIG
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--drain-timeout', type=float,
+                        default=float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 30)))
+    known, _ = parser.parse_known_args(argv)
+    workers = requested_workers(argv)
+
+    supervisor = Supervisor([sys.executable, script] + argv, workers, known.drain_timeout)
+    logger.info(f"Supervisor pid {os.getpid()} starting {workers} worker processes")
+    status = supervisor.run()
+    logger.info(f"Supervisor stopped ({supervisor.restarts} worker restart(s))")
+    return status
+
+
+def watch_supervisor(on_exit: Callable[[], None], interval: float = 1.0):
+    """Call ``on_exit`` once if this worker's supervisor goes away (the worker is reparented)"""
+    parent = os.getppid()
+
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(interval)
+        logger.warning("Supervisor exited; shutting this worker down")
+        on_exit()
+
+    threading.Thread(target=watch, name='supervisor-watch', daemon=True).start()
@@ -0,0 +1,159 @@
+"""Opt-in profiling of slow requests.
+
+A request is captured when profiling is switched on for every request, or
+when an admin asks for it with a request header. A capture runs cProfile on
+the handler thread and times named phases (parse, route, history, provider,
+serialize). Phase times are exclusive: time spent in a nested phase is not
+counted again in the outer one, and whatever no phase claimed is reported as
+``other``. Only captures slower than the threshold (or explicitly requested)
+are kept, in a ring buffer of the most recent ones.
+
+When nothing is being captured, ``phase`` costs one thread-local lookup.
+Upstream calls made on other threads (hedged requests) do not show up in the
+cProfile output, but the time the handler waits for them is still counted in
+its ``provider`` phase.
+"""
+
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class _Capture:
+    __slots__ = ('started', 'forced', 'profile', 'phases', 'stack')
+
+    def __init__(self, forced: bool, profile: Optional[cProfile.Profile]):
+        self.started = time.perf_counter()
+        self.forced = forced
+        self.profile = profile
+        self.phases: Dict[str, float] = {}
+        # [name, resumed_at] of the phases currently open, innermost last
+        self.stack: List[list] = []
+
+
+class RequestProfiler:
+    """Captures cProfile output and phase timings of requests, keeping the slow ones"""
+
+    def __init__(self, enabled: bool = False, threshold_ms: float = 1000.0, capacity: int = 20,
+                 top_functions: int = 40):
+        self.enabled = enabled
+        self.threshold = threshold_ms / 1000.0
+        self.top_functions = top_functions
+        self._profiles: deque = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.captured = 0
+        self.kept = 0
+        self.unprofiled = 0
+
+    def begin(self, forced: bool = False) -> Optional[_Capture]:
+        """Start a capture on this thread if profiling is on or ``forced``; otherwise return None"""
+        if not (self.enabled or forced) or getattr(self._local, 'capture', None) is not None:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (Python 3.12+ allows only one at a time); keep the phases
+            profile = None
+            with self._lock:
+                self.unprofiled += 1
+        capture = self._local.capture = _Capture(forced, profile)
+        return capture
+
+    def end(self, capture: _Capture, method: str, path: str, status: int) -> Optional[str]:
+        """Finish the capture; returns the profile ID if it was kept"""
+        elapsed = time.perf_counter() - capture.started
+        if capture.profile is not None:
+            capture.profile.disable()
+        self._local.capture = None
+        with self._lock:
+            self.captured += 1
+        if not capture.forced and elapsed < self.threshold:
+            return None
+
+        phases = {name: round(seconds * 1000, 2) for name, seconds in capture.phases.items()}
+        phases['other'] = round(max(0.0, elapsed - sum(capture.phases.values())) * 1000, 2)
+        report, raw = '', None
+        if capture.profile is not None:
+            capture.profile.create_stats()
+            raw = marshal.dumps(capture.profile.stats)
+            output = io.StringIO()
+            stats = pstats.Stats(capture.profile, stream=output)
+            stats.sort_stats('cumulative').print_stats(self.top_functions)
+            report = output.getvalue()
+
+        profile_id = str(next(self._ids))
+        with self._lock:
+            self._profiles.append({
+                'id': profile_id,
+                'method': method,
+                'path': path,
+                'status': status,
+                'durationMs': round(elapsed * 1000, 2),
+                'phasesMs': phases,
+                'forced': capture.forced,
+                'capturedAt': datetime.now().isoformat(),
+                'report': report,
+                'pstats': raw
+            })
+            self.kept += 1
+        return profile_id
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Attribute the time spent in the block to phase ``name`` of the current capture, if any"""
+        capture = getattr(self._local, 'capture', None)
+        if capture is None:
+            yield
+            return
+        now = time.perf_counter()
+        stack = capture.stack
+        if stack:
+            outer = stack[-1]
+            capture.phases[outer[0]] = capture.phases.get(outer[0], 0.0) + now - outer[1]
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            capture.phases[name] = capture.phases.get(name, 0.0) + now - stack.pop()[1]
+            if stack:
+                stack[-1][1] = now
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Kept profiles, newest first, without their reports"""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [
+            {key: value for key, value in profile.items() if key not in ('report', 'pstats')}
+            for profile in reversed(profiles)
+        ]
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'thresholdMs': round(self.threshold * 1000, 1),
+                'captured': self.captured,
+                'kept': self.kept,
+                'stored': len(self._profiles),
+                'capacity': self._profiles.maxlen,
+                'withoutCProfile': self.unprofiled
+            }
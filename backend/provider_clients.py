@@ -0,0 +1,154 @@
+"""Reusable LLM provider clients keyed by API key.
+
+Building an ``openai.OpenAI`` or ``MistralClient`` per message throws away its
+HTTP connection pool, so every call pays for a new TLS handshake. The registry
+below keeps one client per (provider, API key) in a bounded LRU cache with an
+idle timeout. Keys are stored as SHA-256 digests rather than in plain text.
+
+Provider SDKs are imported by the factories, so an SDK is only loaded when
+its first client is built, not when the server starts.
+
+OPENAI_BASE_URL, GEMINI_API_ENDPOINT and MISTRAL_ENDPOINT point the clients
+at another server speaking the provider's API, such as a proxy or the mock
+provider in ``benchmarks/mock_llm.py``.
+"""
+
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from caching import LRUTTLCache
+
+logger = logging.getLogger('multi_llm_server')
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+MISTRAL_ENDPOINT = os.getenv('MISTRAL_ENDPOINT') or None
+
+
+def _build_openai_client(api_key: str):
+    import openai
+    return openai.OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL)
+
+
+def _build_gemini_model(api_key: str):
+    """Build a Gemini model bound to its own API client.
+
+    ``genai.configure`` mutates process-wide state, so two requests with
+    different keys running concurrently could end up using each other's key.
+    Giving each model a dedicated ``GenerativeServiceClient`` keeps keys isolated.
+    The SDK has no public per-model client option, so this sets the private
+    ``GenerativeModel._client``; requirements.txt pins the SDK versions known to
+    have it, and an SDK without it is reported instead of silently sharing a key.
+    """
+    import google.generativeai as genai
+    from google.ai import generativelanguage as glm
+
+    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    if not hasattr(model, '_client'):
+        raise ImportError(
+            f"google-generativeai {getattr(genai, '__version__', '?')} "
+            f"does not support per-key clients; "
+            f"install a version allowed by requirements.txt"
+        )
+    if GEMINI_API_ENDPOINT:
+        # A custom endpoint is spoken to over REST, which plain HTTP servers can serve
+        model._client = glm.GenerativeServiceClient(
+            transport='rest',
+            client_options={'api_key': api_key, 'api_endpoint': GEMINI_API_ENDPOINT}
+        )
+    else:
+        model._client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+    return model
+
+
+def _build_mistral_client(api_key: str):
+    from mistralai.client import MistralClient
+    if MISTRAL_ENDPOINT:
+        return MistralClient(api_key=api_key, endpoint=MISTRAL_ENDPOINT)
+    return MistralClient(api_key=api_key)
+
+
+CLIENT_FACTORIES: Dict[str, Callable[[str], Any]] = {
+    'openai': _build_openai_client,
+    'gemini': _build_gemini_model,
+    'mistral': _build_mistral_client,
+}
+
+SDK_MODULES = {
+    'openai': 'openai',
+    'gemini': 'google.generativeai',
+    'mistral': 'mistralai',
+}
+
+
+def sdk_installed(provider: str) -> bool:
+    """Whether the provider's SDK can be imported, checked without importing it"""
+    try:
+        return importlib.util.find_spec(SDK_MODULES[provider]) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _registry_key(provider: str, api_key: str) -> str:
+    return hashlib.sha256(f"{provider}:{api_key}".encode('utf-8')).hexdigest()
+
+
+class ProviderClientRegistry:
+    """Bounded LRU/TTL registry of provider clients"""
+
+    def __init__(self, max_clients: int = 64, idle_ttl: float = 900.0):
+        # Evicted clients are not closed explicitly: an in-flight call may still
+        # hold a reference, and the connection pool is released with the last one.
+        self._cache = LRUTTLCache(max_entries=max_clients, ttl=idle_ttl, on_evict=self._on_evict)
+        # Seconds the first client of each provider took to build, SDK import included
+        self._load_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _on_evict(key: str, client: Any):
+        logger.info(f"Evicted idle provider client {key[:12]}")
+
+    def get(self, provider: str, api_key: str) -> Any:
+        """Return a cached client for ``provider`` and ``api_key``, creating it if needed"""
+        factory = CLIENT_FACTORIES.get(provider)
+        if factory is None:
+            raise ValueError(f"Unknown provider: {provider}")
+        if not api_key:
+            raise ValueError(f"An API key is required for {provider}")
+        return self._cache.get_or_create(_registry_key(provider, api_key),
+                                         lambda: self._build(provider, factory, api_key))
+
+    def _build(self, provider: str, factory: Callable[[str], Any], api_key: str) -> Any:
+        started = time.perf_counter()
+        client = factory(api_key)
+        with self._lock:
+            if provider not in self._load_times:
+                self._load_times[provider] = time.perf_counter() - started
+                load_ms = self._load_times[provider] * 1000
+                logger.info(f"Loaded {provider} SDK and client in {load_ms:.0f}ms")
+        return client
+
+    def load_time(self, provider: str) -> Optional[float]:
+        """Seconds the provider's first client took to build, or None if none has been built yet"""
+        with self._lock:
+            return self._load_times.get(provider)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        with self._lock:
+            stats['sdk_load_ms'] = {name: round(seconds * 1000, 1)
+                                    for name, seconds in self._load_times.items()}
+        return stats
+
+
+client_registry = ProviderClientRegistry(
+    max_clients=int(os.getenv('PROVIDER_CLIENT_CACHE_SIZE', 64)),
+    idle_ttl=float(os.getenv('PROVIDER_CLIENT_IDLE_TTL', 900))
+)
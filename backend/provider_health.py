@@ -0,0 +1,277 @@
+"""Live health tracking for LLM providers.
+
+Each provider keeps an exponentially weighted moving average (EWMA) of its
+call latency and error rate, plus a circuit breaker. After repeated failures
+the breaker opens and the provider is skipped for a cooldown period. It then
+moves to half-open and lets a single probe request through: success closes
+the breaker again, failure re-opens it. Rate-limit responses are counted but
+do not open the breaker; the client-side rate limiter backs off instead.
+Configuration errors (a missing or rejected API key, a malformed request,
+an SDK that is not installed) say nothing about the provider's health, and
+since callers may bring their own keys, counting them would let one user's
+bad key open the breaker for everyone; they are counted separately only.
+
+``rank_providers`` turns these numbers into a score penalty so traffic
+drifts away from slow or failing backends. The penalty halves every
+``penalty_half_life`` seconds without a new observation: a provider that
+stopped getting traffic because of a few errors would otherwise never get
+the calls that could clear its record.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('multi_llm_server')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Best-effort detection of HTTP 429 responses across provider SDKs"""
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if status == 429:
+        return True
+    name = type(error).__name__.lower()
+    text = str(error).lower()
+    return ('ratelimit' in name or 'resourceexhausted' in name
+            or '429' in text or 'rate limit' in text)
+
+
+class ProviderConfigurationError(Exception):
+    """The call could not be made with the caller's configuration (e.g. no API key)"""
+
+
+# HTTP statuses that reflect the request or its credentials rather than the provider
+_CLIENT_ERROR_STATUSES = {400, 401, 403, 404, 413, 422}
+_CLIENT_ERROR_NAMES = ('authentication', 'permissiondenied', 'unauthenticated', 'unauthorized',
+                       'badrequest', 'invalidargument', 'notfound')
+
+
+def is_client_error(error: Exception) -> bool:
+    """Best-effort detection of auth and other 4xx errors caused by the caller, not the provider"""
+    if isinstance(error, (ProviderConfigurationError, ImportError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if isinstance(status, int) and status in _CLIENT_ERROR_STATUSES:
+        return True
+    name = type(error).__name__.lower()
+    if any(marker in name for marker in _CLIENT_ERROR_NAMES):
+        return True
+    text = str(error).lower()
+    return 'api key not valid' in text or 'invalid api key' in text or 'incorrect api key' in text
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract a Retry-After delay from a provider error if it carries one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when a provider's circuit breaker is open and the call was not attempted"""
+
+
+class ProviderHealth:
+    """Rolling latency/error statistics and circuit breaker state for one provider"""
+
+    def __init__(self, name: str, alpha: float, failure_threshold: int, cooldown: float,
+                 penalty_half_life: float = 0.0):
+        self.name = name
+        self.alpha = alpha
+        self.penalty_half_life = penalty_half_life
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+
+        self.ewma_latency: Optional[float] = None
+        self.latency_samples: deque = deque(maxlen=200)
+        self.error_rate = 0.0
+        self.last_observed = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.client_errors = 0
+        self.consecutive_failures = 0
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = cooldown
+        self.probe_in_flight = False
+
+    def _decay(self, now: float) -> float:
+        """Share of the recorded penalty still in force after the time since the last observation"""
+        if self.penalty_half_life <= 0 or not self.last_observed:
+            return 1.0
+        return 0.5 ** ((now - self.last_observed) / self.penalty_half_life)
+
+    def _observe(self, latency: float, failed: bool):
+        now = time.monotonic()
+        # Old errors fade while idle, so one success after a quiet spell is not outweighed by them
+        self.error_rate *= self._decay(now)
+        self.last_observed = now
+        self.calls += 1
+        if not failed:
+            self.latency_samples.append(latency)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += self.alpha * (latency - self.ewma_latency)
+        self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+
+    def _open(self, now: float, cooldown: float):
+        self.state = OPEN
+        self.opened_at = now
+        self.cooldown = cooldown
+        logger.warning(f"Circuit opened for {self.name} for {cooldown:.0f}s "
+                       f"({self.consecutive_failures} consecutive failure(s))")
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'ewma_latency_ms': (
+                round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None
+            ),
+            'error_rate': round(self.error_rate, 4),
+            'calls': self.calls,
+            'failures': self.failures,
+            'rate_limited': self.rate_limited,
+            'client_errors': self.client_errors,
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in_seconds': (
+                round(max(0.0, self.opened_at + self.cooldown - now), 1)
+                if self.state == OPEN else 0
+            )
+        }
+
+
+class ProviderHealthTracker:
+    """Thread-safe registry of ProviderHealth records"""
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 30.0,
+                 penalty_half_life: float = 60.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.penalty_half_life = penalty_half_life
+        self._providers: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider: str) -> ProviderHealth:
+        health = self._providers.get(provider)
+        if health is None:
+            health = ProviderHealth(provider, self.alpha, self.failure_threshold, self.cooldown,
+                                    self.penalty_half_life)
+            self._providers[provider] = health
+        return health
+
+    def acquire(self, provider: str) -> bool:
+        """Return True if a request may be sent to ``provider`` now.
+
+        When the cooldown of an open breaker has elapsed this admits exactly one
+        probe request and moves the breaker to half-open.
+        """
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider)
+            if health.state == CLOSED:
+                return True
+            if health.state == OPEN:
+                if now - health.opened_at < health.cooldown:
+                    return False
+                health.state = HALF_OPEN
+                health.probe_in_flight = False
+            if health.probe_in_flight:
+                return False
+            health.probe_in_flight = True
+            return True
+
+    def is_available(self, provider: str) -> bool:
+        """Return True unless the provider's breaker is open and still cooling down"""
+        now = time.monotonic()
+        with self._lock:
+            health = self._get(provider)
+            if health.state == OPEN:
+                return now - health.opened_at >= health.cooldown
+            if health.state == HALF_OPEN:
+                return not health.probe_in_flight
+            return True
+
+    def release(self, provider: str):
+        """Give back a probe slot acquired for a call whose outcome is unknown"""
+        with self._lock:
+            self._get(provider).probe_in_flight = False
+
+    def record_success(self, provider: str, latency: float):
+        with self._lock:
+            health = self._get(provider)
+            health._observe(latency, failed=False)
+            health.consecutive_failures = 0
+            if health.state != CLOSED:
+                logger.info(f"Circuit closed for {provider} after successful probe")
+            health.state = CLOSED
+            health.probe_in_flight = False
+
+    def record_failure(self, provider: str, latency: float, error: Optional[Exception] = None):
+        now = time.monotonic()
+        rate_limited = error is not None and is_rate_limit_error(error)
+        with self._lock:
+            health = self._get(provider)
+            if error is not None and not rate_limited and is_client_error(error):
+                # The caller's key or request was at fault; leave the provider's record alone
+                health.client_errors += 1
+                health.probe_in_flight = False
+                return
+            health._observe(latency, failed=True)
+            health.failures += 1
+            health.probe_in_flight = False
+
+            if rate_limited:
+                # The provider is healthy but busy; admission control honours its Retry-After
+                health.rate_limited += 1
+                return
+            health.consecutive_failures += 1
+            if health.state == HALF_OPEN:
+                # Failed probe: back off twice as long, capped at ten base cooldowns
+                health._open(now, min(health.cooldown * 2, health.base_cooldown * 10))
+            elif health.consecutive_failures >= health.failure_threshold:
+                health._open(now, health.base_cooldown)
+
+    def score_penalty(self, provider: str) -> float:
+        """Score deduction for ``select_best_provider`` based on live latency and errors"""
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is None or health.ewma_latency is None:
+                return 0.0
+            # Up to 30 points for latency (3 per second) and 60 for a fully failing provider
+            penalty = min(30.0, health.ewma_latency * 3.0) + health.error_rate * 60.0
+            return penalty * health._decay(time.monotonic())
+
+    def latency_percentile(self, provider: str, percentile: float,
+                           min_samples: int = 20) -> Optional[float]:
+        """Return the given percentile of recent successful call latencies, in seconds.
+
+        Returns None until at least ``min_samples`` calls have been observed.
+        """
+        with self._lock:
+            health = self._providers.get(provider)
+            if health is None or len(health.latency_samples) < min_samples:
+                return None
+            samples = sorted(health.latency_samples)
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return {name: health.to_dict(now) for name, health in self._providers.items()}
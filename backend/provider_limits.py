@@ -0,0 +1,62 @@
+"""Per-provider concurrency caps.
+
+Fan-out work such as document analysis can issue many provider calls at
+once. ``ProviderConcurrencyLimiter`` bounds how many of those are in flight
+per provider, so one large job cannot exhaust a provider's rate limit.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class ProviderConcurrencyLimiter:
+    """Semaphore per provider, created on first use"""
+
+    def __init__(self, default_limit: int = 4, limits: Optional[Dict[str, int]] = None):
+        self.default_limit = max(1, default_limit)
+        self.limits = dict(limits or {})
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def limit_for(self, provider: str) -> int:
+        return max(1, self.limits.get(provider, self.default_limit))
+
+    def _semaphore(self, provider: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(provider)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.limit_for(provider))
+                self._semaphores[provider] = semaphore
+            return semaphore
+
+    def _adjust(self, counts: Dict[str, int], provider: str, delta: int):
+        with self._lock:
+            counts[provider] = counts.get(provider, 0) + delta
+
+    @contextmanager
+    def slot(self, provider: str) -> Iterator[None]:
+        """Hold one of the provider's concurrency slots for the duration of the block"""
+        semaphore = self._semaphore(provider)
+        self._adjust(self._waiting, provider, 1)
+        semaphore.acquire()
+        self._adjust(self._waiting, provider, -1)
+        self._adjust(self._in_flight, provider, 1)
+        try:
+            yield
+        finally:
+            self._adjust(self._in_flight, provider, -1)
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                provider: {
+                    'limit': self.limit_for(provider),
+                    'inFlight': self._in_flight.get(provider, 0),
+                    'waiting': self._waiting.get(provider, 0)
+                }
+                for provider in self._semaphores
+            }
@@ -0,0 +1,236 @@
+"""Client-side rate limiting and admission control per provider.
+
+Each provider has two token buckets, one for requests per minute and one
+for (estimated) tokens per minute. A call takes one request and its token
+estimate from the buckets before it goes upstream. When the buckets are
+empty, the caller waits in a bounded first-come-first-served queue until
+its turn and budget come up, or until its deadline passes. In that case it
+is rejected without ever reaching the provider. A burst therefore turns
+into a short queue instead of a storm of 429s.
+
+A 429 from the provider feeds back into the buckets. Admission is paused
+for the response's Retry-After delay, the buckets are drained, and the
+configured rates are halved. The rates then recover linearly to their
+configured values over ``recovery_seconds``.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+
+class RateLimitExceededError(Exception):
+    """The call could not be admitted within its deadline, or the wait queue is full"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    """Token bucket refilled continuously at ``per_minute / 60`` per second; unlimited at 0"""
+
+    __slots__ = ('per_minute', 'level')
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+
+    def refill(self, elapsed: float, factor: float):
+        if self.per_minute:
+            self.add(elapsed * self.per_minute * factor / 60.0)
+
+    def add(self, amount: float):
+        self.level = min(float(self.per_minute), self.level + amount)
+
+    def wait_for(self, amount: float, factor: float) -> float:
+        """Seconds until ``amount`` is available (0 if it already is)"""
+        if not self.per_minute or self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / (self.per_minute * factor)
+
+
+class _ProviderBudget:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.condition = threading.Condition()
+        self.queue: deque = deque()
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # Share of the configured rates currently allowed; lowered by 429s
+        self.factor = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class ProviderRateLimiter:
+    """Per-provider request and token budgets with a fair, bounded wait queue"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None, default_rpm: int = 0,
+                 default_tpm: int = 0, max_queue: int = 64, max_wait: float = 10.0,
+                 default_retry_after: float = 5.0, recovery_seconds: float = 60.0):
+        self.limits = dict(limits or {})
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_retry_after = default_retry_after
+        self.recovery_seconds = recovery_seconds
+        self._budgets: Dict[str, _ProviderBudget] = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, provider: str) -> _ProviderBudget:
+        with self._lock:
+            budget = self._budgets.get(provider)
+            if budget is None:
+                rpm, tpm = self.limits.get(provider, (self.default_rpm, self.default_tpm))
+                budget = self._budgets[provider] = _ProviderBudget(rpm, tpm)
+            return budget
+
+    def _refill(self, budget: _ProviderBudget, now: float):
+        """Top up the buckets and let the rate factor recover; caller holds the condition"""
+        elapsed = now - budget.updated
+        budget.updated = now
+        if elapsed <= 0:
+            return
+        budget.factor = min(1.0, budget.factor + elapsed / self.recovery_seconds)
+        budget.requests.refill(elapsed, budget.factor)
+        budget.tokens.refill(elapsed, budget.factor)
+
+    def acquire(self, provider: str, tokens: int = 0, timeout: Optional[float] = None) -> int:
+        """Wait for budget to send one request of about ``tokens`` tokens; return tokens reserved.
+
+        The reservation is capped at the provider's tokens per minute, so it can
+        be less than ``tokens``. Raises RateLimitExceededError if the queue is
+        full or the budget will not be available within ``timeout`` (default
+        ``max_wait``).
+        """
+        budget = self._budget(provider)
+        started = time.monotonic()
+        deadline = started + (self.max_wait if timeout is None else timeout)
+        if budget.tokens.per_minute:
+            # A single call larger than the whole bucket could never be admitted
+            tokens = min(tokens, budget.tokens.per_minute)
+        ticket = object()
+
+        with budget.condition:
+            if len(budget.queue) >= self.max_queue:
+                budget.rejected += 1
+                raise RateLimitExceededError(
+                    f"{provider} rate limit queue is full ({self.max_queue} waiting)",
+                    self._retry_estimate(budget, started)
+                )
+            budget.queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(budget, now)
+                    if budget.queue[0] is ticket:
+                        wait = max(
+                            budget.blocked_until - now,
+                            budget.requests.wait_for(1, budget.factor),
+                            budget.tokens.wait_for(tokens, budget.factor)
+                        )
+                        if wait <= 0:
+                            break
+                    else:
+                        # Not our turn yet; the head notifies when it leaves the queue
+                        wait = deadline - now
+                    if now + wait > deadline and budget.queue[0] is ticket:
+                        budget.rejected += 1
+                        raise RateLimitExceededError(
+                            f"{provider} rate limit budget not available "
+                            f"within {deadline - started:.1f}s",
+                            max(wait, 0.0)
+                        )
+                    if now >= deadline:
+                        budget.rejected += 1
+                        raise RateLimitExceededError(
+                            f"{provider} rate limit queue did not clear "
+                            f"within {deadline - started:.1f}s",
+                            self._retry_estimate(budget, now)
+                        )
+                    budget.condition.wait(min(wait, deadline - now))
+
+                if budget.requests.per_minute:
+                    budget.requests.level -= 1
+                if budget.tokens.per_minute:
+                    budget.tokens.level -= tokens
+                waited = time.monotonic() - started
+                budget.admitted += 1
+                budget.total_wait += waited
+                budget.max_wait = max(budget.max_wait, waited)
+                return tokens
+            finally:
+                budget.queue.remove(ticket)
+                budget.condition.notify_all()
+
+    def _retry_estimate(self, budget: _ProviderBudget, now: float) -> float:
+        """Rough seconds until a new caller could be admitted; caller holds the condition"""
+        per_request = 0.0
+        if budget.requests.per_minute:
+            per_request = 60.0 / (budget.requests.per_minute * budget.factor)
+        return max(budget.blocked_until - now, per_request * (len(budget.queue) + 1), 1.0)
+
+    def refund(self, provider: str, tokens: int = 0, requests: int = 0):
+        """Return budget that was reserved but not used; ``requests`` for a call never sent"""
+        tokens, requests = max(tokens, 0), max(requests, 0)
+        if not tokens and not requests:
+            return
+        budget = self._budget(provider)
+        with budget.condition:
+            if tokens and budget.tokens.per_minute:
+                budget.tokens.add(tokens)
+            if requests and budget.requests.per_minute:
+                budget.requests.add(requests)
+            budget.condition.notify_all()
+
+    def throttle(self, provider: str, retry_after: Optional[float] = None):
+        """React to a 429: pause admission for ``retry_after`` seconds, drain buckets, halve rate"""
+        budget = self._budget(provider)
+        with budget.condition:
+            now = time.monotonic()
+            self._refill(budget, now)
+            delay = retry_after if retry_after is not None else self.default_retry_after
+            budget.blocked_until = max(budget.blocked_until, now + delay)
+            budget.requests.level = min(budget.requests.level, 0.0)
+            budget.tokens.level = min(budget.tokens.level, 0.0)
+            budget.factor = max(0.1, budget.factor / 2)
+            budget.throttled += 1
+            budget.condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            budgets = dict(self._budgets)
+        now = time.monotonic()
+        result = {}
+        for provider, budget in budgets.items():
+            with budget.condition:
+                self._refill(budget, now)
+                result[provider] = {
+                    'requestsPerMinute': budget.requests.per_minute or None,
+                    'tokensPerMinute': budget.tokens.per_minute or None,
+                    'rateFactor': round(budget.factor, 2),
+                    'availableRequests': (
+                        round(budget.requests.level, 1) if budget.requests.per_minute else None
+                    ),
+                    'availableTokens': (
+                        round(budget.tokens.level) if budget.tokens.per_minute else None
+                    ),
+                    'queueDepth': len(budget.queue),
+                    'admitted': budget.admitted,
+                    'rejected': budget.rejected,
+                    'throttled': budget.throttled,
+                    'blockedForSeconds': round(max(0.0, budget.blocked_until - now), 1),
+                    'averageWaitMs': (
+                        round(budget.total_wait / budget.admitted * 1000, 1)
+                        if budget.admitted else 0.0
+                    ),
+                    'maxWaitMs': round(budget.max_wait * 1000, 1)
+                }
+        return result
@@ -0,0 +1,125 @@
+"""Cache of LLM chat completions for repeated questions.
+
+Entries are keyed by provider, model, the normalized user message and a hash of
+the conversation window sent alongside it, so a cached answer is only reused
+when the provider would have seen the same prompt. The cache is bounded by
+entry count and by the approximate size of the stored text, and entries expire
+a fixed time after they were written.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from caching import SingleFlight
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.]+$')
+
+# Rough per-entry bookkeeping cost on top of the stored text
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_message(message: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    normalized = _WHITESPACE.sub(' ', message.strip().lower())
+    return _TRAILING_PUNCTUATION.sub('', normalized)
+
+
+def make_cache_key(provider: str, model: str, message: str, history_window: List[Dict]) -> str:
+    """Build a cache key from the request and the prior conversation turns sent with it"""
+    window = [(msg['role'], msg['content']) for msg in history_window]
+    window_hash = hashlib.sha256(json.dumps(window).encode('utf-8')).hexdigest()
+    raw = f"{provider}\x00{model}\x00{normalize_message(message)}\x00{window_hash}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of completion text with a TTL and a memory budget"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0,
+                 max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = ttl > 0 and max_entries > 0
+
+        self._data: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key: str):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        size = len(key) + len(value.encode('utf-8')) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def get_or_compute(self, key: str, compute) -> Tuple[str, str]:
+        """Return ``(value, source)`` where source is ``hit``, ``coalesced`` or ``miss``.
+
+        On a miss, concurrent callers for the same key share one ``compute()``
+        call and the result is stored for later requests.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached, 'hit'
+
+        def run():
+            value = compute()
+            self.set(key, value)
+            return value
+
+        value, shared = self._flight.do(key, run)
+        return value, 'coalesced' if shared else 'miss'
+
+    def stats(self) -> Dict[str, Any]:
+        flight = self._flight.stats()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'coalesced': flight['coalesced'],
+                'inFlight': flight['in_flight']
+            }
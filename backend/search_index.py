@@ -0,0 +1,225 @@
+"""In-process BM25 index over uploaded documents.
+
+Documents are split into passages, and each passage is indexed under its
+terms. Postings are kept as parallel ``array`` columns (passage ids and term
+frequencies) rather than per-entry objects, so thousands of documents stay
+compact and fast to scan. Adding and removing a document only touches that
+document's postings. Removed passages are tombstoned, and the postings are
+compacted once tombstones outnumber live passages.
+
+Retrieval uses champion lists: for each term, only the passages where the
+term weighs most are taken as candidates. The candidates are then scored
+exactly with BM25. A query containing words like "agreement", which appear
+in most passages, therefore does not walk every posting in the corpus.
+Champion lists are built on first use and dropped when the term's postings
+change.
+"""
+
+import heapq
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from document_analysis import split_into_chunks
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her his how i if in
+into is it its me my no not of on or our she should so such than that the their them then there
+these they this those to too us was we were what when where which while who whom why will with would
+you your
+""".split())
+
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with a light plural strip"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) < 2 or token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Incrementally maintained BM25 index of document passages"""
+
+    def __init__(self, passage_chars: int = 800, k1: float = 1.2, b: float = 0.75,
+                 champion_size: int = 64):
+        self.passage_chars = passage_chars
+        self.k1 = k1
+        self.b = b
+        self.champion_size = champion_size
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # term -> (passage ids, term frequencies); ids are appended in increasing order
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._df: Dict[str, int] = {}
+        # term -> sorted ids of the passages where the term weighs most
+        self._champions: Dict[str, array] = {}
+        self._lengths = array('I')
+        # passage id -> (document id, passage text), or None once removed
+        self._passages: List[Optional[Tuple[str, str]]] = []
+        self._document_passages: Dict[str, List[int]] = {}
+        self._titles: Dict[str, str] = {}
+        self._live = 0
+        self._deleted = 0
+        self._total_length = 0
+
+    def add_document(self, document_id: str, title: str, text: str):
+        """Index ``text`` under ``document_id``, replacing any earlier version"""
+        passages = split_into_chunks(text, self.passage_chars, 0)
+        with self._lock:
+            self._remove(document_id)
+            self._titles[document_id] = title
+            ids = self._document_passages[document_id] = []
+            for passage in passages:
+                # Title words count towards every passage of the document
+                self._add_passage(document_id, passage, tokenize(f"{title}\n{passage}"), ids)
+
+    def _add_passage(self, document_id: str, passage: str, tokens: List[str], ids: List[int]):
+        passage_id = len(self._passages)
+        self._passages.append((document_id, passage))
+        self._lengths.append(len(tokens))
+        ids.append(passage_id)
+        self._live += 1
+        self._total_length += len(tokens)
+        postings_map, df, champions = self._postings, self._df, self._champions
+        for term, frequency in Counter(tokens).items():
+            postings = postings_map.get(term)
+            if postings is None:
+                postings = postings_map[term] = (array('I'), array('H'))
+            postings[0].append(passage_id)
+            postings[1].append(frequency if frequency < 65535 else 65535)
+            df[term] = df.get(term, 0) + 1
+            champions.pop(term, None)
+
+    def remove_document(self, document_id: str):
+        with self._lock:
+            self._remove(document_id)
+            if self._deleted > max(1000, self._live):
+                self._compact()
+
+    def _remove(self, document_id: str):
+        ids = self._document_passages.pop(document_id, None)
+        title = self._titles.pop(document_id, '')
+        for passage_id in ids or []:
+            _, passage = self._passages[passage_id]
+            for term in set(tokenize(f"{title}\n{passage}")):
+                self._df[term] -= 1
+                self._champions.pop(term, None)
+            self._passages[passage_id] = None
+            self._live -= 1
+            self._deleted += 1
+            self._total_length -= self._lengths[passage_id]
+
+    def _compact(self):
+        """Rebuild postings without tombstoned passages"""
+        documents: Dict[str, List[str]] = {}
+        for entry in self._passages:
+            if entry is not None:
+                documents.setdefault(entry[0], []).append(entry[1])
+        titles = self._titles
+        self._reset()
+        for document_id, passages in documents.items():
+            title = titles.get(document_id, '')
+            self._titles[document_id] = title
+            ids = self._document_passages[document_id] = []
+            for passage in passages:
+                self._add_passage(document_id, passage, tokenize(f"{title}\n{passage}"), ids)
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0,
+               min_terms: int = 1) -> List[Dict[str, Any]]:
+        """Return the ``k`` best-scoring passages for ``query``, best first.
+
+        Passages scoring below ``min_score``, or matching fewer than
+        ``min_terms`` distinct query terms (capped at the number of query terms
+        in the index), are left out.
+        """
+        with self._lock:
+            if not self._live:
+                return []
+            terms = [t for t in set(tokenize(query)) if self._df.get(t)]
+            if not terms:
+                return []
+            total = self._live
+            average_length = self._total_length / total or 1.0
+            k1, b = self.k1, self.b
+            lengths = self._lengths
+
+            candidates = set()
+            for term in terms:
+                candidates.update(self._champion_list(term, average_length))
+
+            # Exact BM25 over the candidates only
+            scores = dict.fromkeys(candidates, 0.0)
+            matched = dict.fromkeys(candidates, 0)
+            for term in terms:
+                df = self._df[term]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                ids, frequencies = self._postings[term]
+                for passage_id in candidates:
+                    index = bisect_left(ids, passage_id)
+                    if index < len(ids) and ids[index] == passage_id:
+                        tf = frequencies[index]
+                        norm = k1 * (1 - b + b * lengths[passage_id] / average_length)
+                        scores[passage_id] += idf * tf * (k1 + 1) / (tf + norm)
+                        matched[passage_id] += 1
+            passages = self._passages
+
+            required_terms = min(min_terms, len(terms))
+            scores = {passage_id: score for passage_id, score in scores.items()
+                      if score >= min_score and matched[passage_id] >= required_terms}
+
+            results = []
+            for passage_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+                document_id, passage = passages[passage_id]
+                results.append({
+                    'document_id': document_id,
+                    'title': self._titles.get(document_id, ''),
+                    'passage': passage,
+                    'score': round(score, 3)
+                })
+            return results
+
+    def _champion_list(self, term: str, average_length: float) -> array:
+        """Live passages with the highest length-normalised frequency of ``term``"""
+        champions = self._champions.get(term)
+        if champions is not None:
+            return champions
+        ids, frequencies = self._postings[term]
+        passages, lengths, k1, b = self._passages, self._lengths, self.k1, self.b
+        if len(ids) <= self.champion_size:
+            champions = array('I', (pid for pid in ids if passages[pid] is not None))
+        else:
+            weights = (
+                (tf / (tf + k1 * (1 - b + b * lengths[pid] / average_length)), pid)
+                for pid, tf in zip(ids, frequencies) if passages[pid] is not None
+            )
+            best = heapq.nlargest(self.champion_size, weights)
+            champions = array('I', sorted(pid for _, pid in best))
+        self._champions[term] = champions
+        return champions
+
+    def __contains__(self, document_id: str) -> bool:
+        with self._lock:
+            return document_id in self._document_passages
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'documents': len(self._document_passages),
+                'passages': self._live,
+                'terms': sum(1 for df in self._df.values() if df > 0),
+                'tombstones': self._deleted
+            }
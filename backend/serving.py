@@ -0,0 +1,174 @@
+"""Concurrent serving support for the Multi-LLM Lawyer Bot backend.
+
+The stock ``socketserver.TCPServer`` handles one connection at a time, so a
+single slow provider call blocks every other client. ``BoundedThreadPoolServer``
+hands accepted connections to a fixed pool of worker threads through a bounded
+queue, sheds load with a ``503`` when that queue is full and drains in-flight
+work on shutdown.
+
+With ``reuse_port=True`` the listening socket sets ``SO_REUSEPORT``, so several
+worker processes can bind the same port and the kernel spreads incoming
+connections across them (see ``prefork``).
+"""
+
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('multi_llm_server')
+
+_SHUTDOWN = object()
+
+
+class BoundedThreadPoolServer(socketserver.TCPServer):
+    """TCP server that processes requests on a bounded pool of worker threads"""
+
+    allow_reuse_address = True
+    request_queue_size = 128  # listen() backlog
+
+    def __init__(self, server_address: Tuple[str, int], handler_class, max_workers: int = 32,
+                 max_queue: int = 64, drain_timeout: float = 30.0, reuse_port: bool = False,
+                 bind_and_activate: bool = True):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if max_queue < 1:
+            raise ValueError("max_queue must be at least 1")
+
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.drain_timeout = drain_timeout
+        self.reuse_port = reuse_port
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._workers: List[threading.Thread] = []
+        self._accepting = True
+        self._stats_lock = threading.Lock()
+        self._active = 0
+        self._handled = 0
+        self._rejected = 0
+
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self._start_workers()
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def _start_workers(self):
+        for index in range(self.max_workers):
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"http-worker-{index}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _SHUTDOWN:
+                    return
+                request, client_address = item
+                with self._stats_lock:
+                    self._active += 1
+                try:
+                    self.finish_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                finally:
+                    self.shutdown_request(request)
+                    with self._stats_lock:
+                        self._active -= 1
+                        self._handled += 1
+            finally:
+                self._queue.task_done()
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker, or reject it if the queue is full"""
+        if not self._accepting:
+            self._reject(request, "Server is shutting down")
+            return
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self._reject(request, "Server is at capacity, please retry shortly")
+
+    def _reject(self, request, reason: str):
+        with self._stats_lock:
+            self._rejected += 1
+        logger.warning(f"Rejecting connection with 503: {reason}")
+        body = json.dumps({'error': reason}).encode('utf-8')
+        head = (
+            "HTTP/1.0 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode('latin-1')
+        try:
+            request.settimeout(1.0)
+            request.sendall(head + body)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def keep_alive_allowed(self) -> bool:
+        """Whether a worker may hold a connection open for its next request.
+
+        Not while shutting down, nor when accepted connections are waiting for a
+        worker, so idle keep-alive connections cannot starve new clients.
+        """
+        return self._accepting and self._queue.empty()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting work and wait for queued and in-flight requests to finish.
+
+        Returns True if every worker exited within the timeout.
+        """
+        if timeout is None:
+            timeout = self.drain_timeout
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+
+        for _ in self._workers:
+            # Sentinels queue behind pending requests, so those are still served
+            try:
+                self._queue.put(_SHUTDOWN, timeout=max(0.01, deadline - time.monotonic()))
+            except queue.Full:
+                break
+
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+
+        drained = not any(worker.is_alive() for worker in self._workers)
+        if not drained:
+            logger.warning(f"Shutdown drain timed out after {timeout}s "
+                           f"with {self._active} request(s) in flight")
+        return drained
+
+    def server_close(self):
+        if self._accepting:
+            self.drain()
+        super().server_close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of pool utilisation"""
+        with self._stats_lock:
+            return {
+                'workers': self.max_workers,
+                'active': self._active,
+                'queued': self._queue.qsize(),
+                'queue_capacity': self.max_queue,
+                'handled': self._handled,
+                'rejected': self._rejected
+            }
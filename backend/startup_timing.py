@@ -0,0 +1,141 @@
+"""Startup timing: named phases plus a per-module import breakdown.
+
+``StartupProfiler.install`` puts a finder at the front of ``sys.meta_path``
+that times every module executed while it is installed, the same way
+``python -X importtime`` does. It records self time (the module body alone)
+and cumulative time (including the modules it imported). The finder does not
+load anything itself; it wraps the loader chosen by the regular finders and
+restores the original loader once the module has run. It is meant to be
+installed only during startup and warm-up.
+"""
+
+import importlib.abc
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Delegating loader that times ``exec_module`` of the wrapped loader"""
+
+    def __init__(self, loader, profiler: 'StartupProfiler'):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        profiler = self._profiler
+        stack = profiler._stack()
+        # Children add their cumulative time to this slot so self time can be derived
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            profiler._record(module.__name__, cumulative - children, cumulative,
+                             top_level=not stack)
+            # Leave the module with its real loader
+            if getattr(module, '__loader__', None) is self:
+                module.__loader__ = self._loader
+            spec = getattr(module, '__spec__', None)
+            if spec is not None and spec.loader is self:
+                spec.loader = self._loader
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._loader, name)
+
+
+class StartupProfiler(importlib.abc.MetaPathFinder):
+    """Collects startup phase durations and, while installed, module import times"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._phases: Dict[str, float] = {}
+        self._imports: Dict[str, List[float]] = {}
+        self._top_level_seconds = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        try:
+            sys.meta_path.remove(self)
+        except ValueError:
+            pass
+
+    @property
+    def installed(self) -> bool:
+        return self in sys.meta_path
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, 'finding', False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, 'find_spec'):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _record(self, name: str, self_seconds: float, cumulative: float, top_level: bool):
+        with self._lock:
+            self._imports[name] = [self_seconds, cumulative]
+            if top_level:
+                self._top_level_seconds += cumulative
+
+    def mark(self, name: str):
+        """Record that phase ``name`` was reached, measured from profiler creation"""
+        with self._lock:
+            self._phases[name] = time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Record how long the block takes as phase ``name``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._phases[name] = time.perf_counter() - started
+
+    def report(self, top: int = 15) -> Dict[str, Any]:
+        with self._lock:
+            slowest = sorted(self._imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                'phasesMs': {name: round(seconds * 1000, 1)
+                             for name, seconds in self._phases.items()},
+                'modulesImported': len(self._imports),
+                'importMs': round(self._top_level_seconds * 1000, 1),
+                'slowestImports': [
+                    {'module': name, 'selfMs': round(times[0] * 1000, 2),
+                     'cumulativeMs': round(times[1] * 1000, 2)}
+                    for name, times in slowest
+                ],
+                'profilingImports': self.installed
+            }
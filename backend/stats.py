@@ -0,0 +1,160 @@
+"""Incrementally maintained statistics for the dashboard.
+
+Counters are updated as messages and documents are recorded, so serving
+``/api/dashboard/stats`` no longer walks every stored message. Recent activity
+is tracked in per-minute buckets covering the last 24 hours.
+
+When several worker processes serve the same data, each process only sees
+its own events, so ``use_shared_source`` switches the snapshot to counts
+queried from the shared database, cached for a couple of seconds.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class RollingCounter:
+    """Event counts over a sliding time window, kept in fixed-width ring buckets"""
+
+    def __init__(self, window_seconds: int = 86400, bucket_seconds: int = 60):
+        self.bucket_seconds = bucket_seconds
+        self.size = window_seconds // bucket_seconds
+        self._counts: List[int] = [0] * self.size
+        self._epochs: List[int] = [-1] * self.size
+
+    def add(self, amount: int = 1, now: Optional[float] = None):
+        epoch = int((now if now is not None else time.time()) // self.bucket_seconds)
+        index = epoch % self.size
+        if self._epochs[index] != epoch:
+            # Bucket last held an older period; recycle it
+            self._epochs[index] = epoch
+            self._counts[index] = 0
+        self._counts[index] += amount
+
+    def total(self, seconds: int, now: Optional[float] = None) -> int:
+        """Sum of events in the last ``seconds`` (rounded up to whole buckets)"""
+        current = int((now if now is not None else time.time()) // self.bucket_seconds)
+        buckets = min(self.size, max(1, -(-seconds // self.bucket_seconds)))
+        oldest = current - buckets + 1
+        return sum(count for count, epoch in zip(self._counts, self._epochs)
+                   if oldest <= epoch <= current)
+
+
+def format_duration(seconds: float) -> str:
+    """Render an uptime such as ``2d 3h 14m``"""
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f"{days}d {hours}h {minutes}m"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+
+class StatsAggregator:
+    """O(1)-per-event counters behind the dashboard statistics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._started_monotonic = time.monotonic()
+
+        self.conversations = set()
+        self.total_messages = 0
+        self.user_messages = 0
+        self.documents = 0
+        self.provider_usage: Dict[str, int] = {}
+
+        self._recent_queries = RollingCounter()
+        self._recent_chats = RollingCounter()
+        self._recent_documents = RollingCounter()
+
+        self._activity: Optional[Callable[[float], Dict[str, Any]]] = None
+        self._activity_ttl = 0.0
+        self._activity_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+
+    def use_shared_source(self, activity: Callable[[float], Dict[str, Any]], ttl: float = 2.0):
+        """Build snapshots from ``activity(now)`` instead of local counters.
+
+        See ``SQLitePersistence.activity`` for its shape.
+        """
+        self._activity = activity
+        self._activity_ttl = ttl
+
+    def seed(self, summary: Dict[str, Any]):
+        """Initialise the cumulative counters from persisted data after a restart"""
+        with self._lock:
+            self.conversations.update(summary.get('user_ids', []))
+            self.total_messages += summary.get('total_messages', 0)
+            self.user_messages += summary.get('user_messages', 0)
+            self.documents += summary.get('documents', 0)
+            for provider, count in summary.get('provider_usage', {}).items():
+                self.provider_usage[provider] = self.provider_usage.get(provider, 0) + count
+
+    def record_user_message(self, user_id: str):
+        with self._lock:
+            self.conversations.add(user_id)
+            self.total_messages += 1
+            self.user_messages += 1
+            self._recent_queries.add()
+
+    def record_assistant_message(self, user_id: str, provider: Optional[str]):
+        with self._lock:
+            self.conversations.add(user_id)
+            self.total_messages += 1
+            if provider:
+                self.provider_usage[provider] = self.provider_usage.get(provider, 0) + 1
+            self._recent_chats.add()
+
+    def record_document_upload(self):
+        with self._lock:
+            self.documents += 1
+            self._recent_documents.add()
+
+    def record_document_removed(self):
+        with self._lock:
+            self.documents = max(0, self.documents - 1)
+
+    def uptime_seconds(self) -> float:
+        return time.monotonic() - self._started_monotonic
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        if self._activity is not None:
+            return self._shared_snapshot(now)
+        with self._lock:
+            def window(seconds: int) -> Dict[str, int]:
+                return {
+                    'chats': self._recent_chats.total(seconds, now),
+                    'documents': self._recent_documents.total(seconds, now),
+                    'queries': self._recent_queries.total(seconds, now)
+                }
+
+            recent = window(86400)
+            recent['lastHour'] = window(3600)
+            return {
+                'totalConversations': len(self.conversations),
+                'totalMessages': self.total_messages,
+                'questionsAnswered': self.user_messages,
+                'documentsAnalyzed': self.documents,
+                'providerUsage': dict(self.provider_usage),
+                'recentActivity': recent
+            }
+
+    def _shared_snapshot(self, now: float) -> Dict[str, Any]:
+        cached = self._activity_cache
+        if cached is None or now - cached[0] >= self._activity_ttl:
+            activity = self._activity(now)
+            recent = dict(activity['recent']['day'])
+            recent['lastHour'] = dict(activity['recent']['hour'])
+            cached = self._activity_cache = (now, {
+                'totalConversations': activity['conversations'],
+                'totalMessages': activity['total_messages'],
+                'questionsAnswered': activity['user_messages'],
+                'documentsAnalyzed': activity['documents'],
+                'providerUsage': activity['provider_usage'],
+                'recentActivity': recent
+            })
+        return dict(cached[1])
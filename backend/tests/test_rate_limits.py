@@ -0,0 +1,102 @@
+"""Token buckets, the fair wait queue, deadlines and 429 throttling of ProviderRateLimiter"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limits import ProviderRateLimiter, RateLimitExceededError  # noqa: E402
+
+
+class TokenBucketTests(unittest.TestCase):
+
+    def test_tokens_are_reserved_and_refunded(self):
+        limiter = ProviderRateLimiter(limits={'openai': (0, 1000)})
+        self.assertEqual(limiter.acquire('openai', 600), 600)
+        with self.assertRaises(RateLimitExceededError):
+            limiter.acquire('openai', 600, timeout=0.05)
+        limiter.refund('openai', 600)
+        self.assertEqual(limiter.acquire('openai', 600, timeout=0), 600)
+
+    def test_reservation_is_capped_at_tokens_per_minute(self):
+        limiter = ProviderRateLimiter(limits={'openai': (0, 1000)})
+        self.assertEqual(limiter.acquire('openai', 5000), 1000)
+        limiter.refund('openai', 5000)
+        self.assertEqual(limiter.stats()['openai']['availableTokens'], 1000)
+
+    def test_refunded_request_can_be_used_again(self):
+        limiter = ProviderRateLimiter(limits={'openai': (1, 0)})
+        limiter.acquire('openai')
+        with self.assertRaises(RateLimitExceededError):
+            limiter.acquire('openai', timeout=0.05)
+        limiter.refund('openai', requests=1)
+        limiter.acquire('openai', timeout=0)
+        self.assertEqual(limiter.stats()['openai']['admitted'], 2)
+
+
+class QueueTests(unittest.TestCase):
+
+    def test_waiting_callers_are_admitted_in_arrival_order(self):
+        # 600 requests per minute, halved by the throttle: one admission every 0.2s
+        limiter = ProviderRateLimiter(limits={'openai': (600, 0)}, recovery_seconds=3600)
+        limiter.throttle('openai', retry_after=0)
+        admitted = []
+
+        def call(index):
+            limiter.acquire('openai', timeout=5)
+            admitted.append(index)
+
+        threads = []
+        for index in range(3):
+            thread = threading.Thread(target=call, args=(index,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(admitted, [0, 1, 2])
+
+    def test_full_queue_rejects_immediately(self):
+        limiter = ProviderRateLimiter(limits={'openai': (1, 0)}, max_queue=1)
+        limiter.acquire('openai')
+        # This caller takes the only queue slot until its deadline passes
+        waiting = threading.Thread(target=lambda: self.assertRaises(
+            RateLimitExceededError, limiter.acquire, 'openai', 0, 0.3
+        ))
+        waiting.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        with self.assertRaises(RateLimitExceededError):
+            limiter.acquire('openai', timeout=5)
+        self.assertLess(time.monotonic() - started, 0.1)
+        waiting.join(5)
+
+    def test_caller_is_rejected_at_its_deadline(self):
+        limiter = ProviderRateLimiter(limits={'openai': (0, 100)})
+        limiter.acquire('openai', 100)
+        started = time.monotonic()
+        with self.assertRaises(RateLimitExceededError) as raised:
+            limiter.acquire('openai', 100, timeout=0.1)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(limiter.stats()['openai']['rejected'], 1)
+
+
+class ThrottleTests(unittest.TestCase):
+
+    def test_throttle_pauses_admission_and_halves_the_rate(self):
+        limiter = ProviderRateLimiter(limits={'openai': (6000, 0)}, recovery_seconds=3600)
+        limiter.throttle('openai', retry_after=0.2)
+        stats = limiter.stats()['openai']
+        self.assertEqual(stats['throttled'], 1)
+        self.assertEqual(stats['rateFactor'], 0.5)
+        started = time.monotonic()
+        limiter.acquire('openai', timeout=5)
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""Stored upload files shared by identical uploads must survive concurrent deletes"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({
+    'SQLITE_PATH': '',
+    'UPLOAD_DIR': tempfile.mkdtemp(prefix='uploads-test-'),
+    'CACHE_TTL': '0'
+})
+
+import fixed_server  # noqa: E402
+from uploads import StoredFile, UploadError  # noqa: E402
+
+BOUNDARY = b'test-boundary'
+
+
+def _multipart(content: bytes, closed: bool = True) -> bytes:
+    body = (b'--' + BOUNDARY + b'\r\n'
+            b'Content-Disposition: form-data; name="file"; filename="doc.txt"\r\n'
+            b'Content-Type: text/plain\r\n\r\n' + content + b'\r\n')
+    return body + b'--' + BOUNDARY + b'--\r\n' if closed else body
+
+
+def _upload(content: bytes):
+    """Parse an upload and return its file part with the document that would reference it"""
+    body = _multipart(content)
+    _, files = fixed_server.upload_parser.parse(io.BytesIO(body), BOUNDARY, len(body))
+    stored = files[0]
+    document = {'id': str(uuid.uuid4()), 'file_path': os.path.basename(stored.path)}
+    return stored, document
+
+
+class SharedUploadFileTests(unittest.TestCase):
+
+    def tearDown(self):
+        for document_id in list(fixed_server.documents_store):
+            fixed_server._delete_document(document_id)
+
+    def _stored_files(self):
+        return [name for name in os.listdir(fixed_server.UPLOAD_DIR) if not name.startswith('.')]
+
+    def test_delete_does_not_remove_file_an_upload_is_reusing(self):
+        first, first_document = _upload(b'identical content')
+        fixed_server._store_upload(first, first_document)
+        second, second_document = _upload(b'identical content')
+
+        reused = threading.Event()
+        original_store = StoredFile.store
+
+        def slow_store(stored):
+            # Widen the gap between reusing the file and recording the document that references it
+            original_store(stored)
+            reused.set()
+            time.sleep(0.2)
+
+        with mock.patch.object(StoredFile, 'store', slow_store):
+            upload = threading.Thread(target=fixed_server._store_upload,
+                                      args=(second, second_document))
+            upload.start()
+            self.assertTrue(reused.wait(5))
+            delete = threading.Thread(target=fixed_server._delete_document,
+                                      args=(first_document['id'],))
+            delete.start()
+            upload.join(5)
+            delete.join(5)
+
+        self.assertNotIn(first_document['id'], fixed_server.documents_store)
+        self.assertIn(second_document['id'], fixed_server.documents_store)
+        path = os.path.join(fixed_server.UPLOAD_DIR, second_document['file_path'])
+        self.assertTrue(os.path.exists(path))
+
+    def test_deleting_last_reference_removes_file(self):
+        first, first_document = _upload(b'shared twice')
+        fixed_server._store_upload(first, first_document)
+        second, second_document = _upload(b'shared twice')
+        fixed_server._store_upload(second, second_document)
+        path = os.path.join(fixed_server.UPLOAD_DIR, first_document['file_path'])
+
+        fixed_server._delete_document(first_document['id'])
+        self.assertTrue(os.path.exists(path))
+        fixed_server._delete_document(second_document['id'])
+        self.assertFalse(os.path.exists(path))
+
+    def test_rejected_upload_leaves_no_files(self):
+        body = _multipart(b'never finished', closed=False)
+        with self.assertRaises(UploadError):
+            fixed_server.upload_parser.parse(io.BytesIO(body), BOUNDARY, len(body))
+        self.assertEqual(self._stored_files(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
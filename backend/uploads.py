@@ -0,0 +1,329 @@
+"""Streaming ``multipart/form-data`` parser that spools uploaded files to disk.
+
+The request body is read in fixed-size chunks and never held in memory as a
+whole. File parts are written to a temporary file while their SHA-256 is
+computed. ``StoredFile.store()`` then moves a file to a content-addressed
+path (``<sha256><ext>``) inside the upload directory, so identical uploads
+share one file on disk; parts that are never stored are discarded. Size
+limits are enforced while streaming and the parse aborts as soon as one is
+exceeded, removing whatever it had spooled.
+
+Because a stored file can be shared, reusing or creating it and recording the
+document that references it must not interleave with another request checking
+that no document references it and deleting it. ``UploadLock`` serializes
+both, across worker processes as well when given a lock file.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from email.message import Message
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows; only single-process servers run there
+    fcntl = None
+
+# Largest header block accepted for a single part
+_MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class UploadError(Exception):
+    """Malformed or rejected upload; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadTooLargeError(UploadError):
+    def __init__(self, message: str):
+        super().__init__(message, status=413)
+
+
+class StoredFile:
+    """A file part spooled to the upload directory.
+
+    ``path`` is where ``store()`` puts the content; until then it lives in a
+    temporary file that ``discard()`` removes.
+    """
+
+    __slots__ = ('field_name', 'filename', 'content_type', 'path', 'size', 'sha256',
+                 'spool_path', 'created')
+
+    def __init__(self, field_name: str, filename: str, content_type: str, path: str, size: int,
+                 sha256: str, spool_path: Optional[str] = None):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.spool_path = spool_path
+        # Whether store() created the file rather than reusing identical content already on disk
+        self.created = False
+
+    def store(self):
+        """Move the content to ``path``, or drop it if identical content is already there.
+
+        Hold the ``UploadLock`` until the document referencing the file is recorded.
+        """
+        if self.spool_path is None:
+            return
+        self.created = not os.path.exists(self.path)
+        if self.created:
+            os.replace(self.spool_path, self.path)
+        else:
+            os.unlink(self.spool_path)
+        self.spool_path = None
+
+    def discard(self):
+        """Remove the spooled content if it was never stored"""
+        if self.spool_path is not None:
+            try:
+                os.unlink(self.spool_path)
+            except FileNotFoundError:
+                pass
+            self.spool_path = None
+
+    def remove(self):
+        """Delete the file if ``store()`` created it; reused files belong to earlier uploads"""
+        if self.created:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.created = False
+
+
+class UploadLock:
+    """Serializes storing upload files and deleting them once unreferenced.
+
+    A thread lock covers one process. With ``path`` set, an exclusive
+    ``flock`` on that file also covers the other workers of a ``--workers``
+    server sharing the upload directory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is not None and fcntl is None:
+            raise RuntimeError(
+                "Cross-process upload locking needs fcntl, which this platform does not provide"
+            )
+        self.path = path
+        self._lock = threading.Lock()
+        self._handle = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self.path is not None:
+            try:
+                self._handle = open(self.path, 'a+b')
+                fcntl.flock(self._handle, fcntl.LOCK_EX)
+            except BaseException:
+                if self._handle is not None:
+                    self._handle.close()
+                    self._handle = None
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._handle is not None:
+                fcntl.flock(self._handle, fcntl.LOCK_UN)
+                self._handle.close()
+                self._handle = None
+        finally:
+            self._lock.release()
+
+
+def _header_params(value: str, header: str = 'content-type') -> Message:
+    message = Message()
+    message[header] = value
+    return message
+
+
+def multipart_boundary(content_type: str) -> Optional[bytes]:
+    """Return the boundary of a ``multipart/form-data`` content type, or None for other types"""
+    message = _header_params(content_type or '')
+    if message.get_content_type() != 'multipart/form-data':
+        return None
+    boundary = message.get_param('boundary')
+    if not boundary or len(boundary) > 200:
+        raise UploadError("Missing or invalid multipart boundary")
+    return boundary.encode('latin-1')
+
+
+class _FilePart:
+    """Destination for a file part: a temp file plus a running hash"""
+
+    def __init__(self, upload_dir: str, field_name: str, filename: str, content_type: str,
+                 max_size: int):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.max_size = max_size
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.handle = tempfile.NamedTemporaryFile(dir=upload_dir, prefix='.upload-', delete=False)
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(
+                f"File exceeds the maximum upload size of {self.max_size} bytes"
+            )
+        self.hash.update(data)
+        self.handle.write(data)
+
+    def finish(self, upload_dir: str) -> StoredFile:
+        self.handle.close()
+        digest = self.hash.hexdigest()
+        extension = os.path.splitext(self.filename)[1].lower()
+        path = os.path.join(upload_dir, digest + extension)
+        return StoredFile(self.field_name, self.filename, self.content_type, path, self.size,
+                          digest, spool_path=self.handle.name)
+
+    def discard(self):
+        self.handle.close()
+        try:
+            os.unlink(self.handle.name)
+        except FileNotFoundError:
+            pass
+
+
+class _FieldPart:
+    """Destination for a plain form field, kept in memory up to a small cap"""
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLargeError(f"Form field '{self.name}' exceeds {self.max_size} bytes")
+        self.chunks.append(data)
+
+    def value(self) -> str:
+        return b''.join(self.chunks).decode('utf-8', errors='replace')
+
+
+class MultipartUploadParser:
+    """Incremental ``multipart/form-data`` parser with on-disk spooling for file parts"""
+
+    def __init__(self, upload_dir: str, max_file_size: int, max_field_size: int = 64 * 1024,
+                 chunk_size: int = 64 * 1024, allowed_extensions: Optional[Iterable[str]] = None):
+        self.upload_dir = upload_dir
+        self.max_file_size = max_file_size
+        self.max_field_size = max_field_size
+        self.chunk_size = chunk_size
+        self.allowed_extensions = None
+        if allowed_extensions:
+            self.allowed_extensions = {ext.lower().lstrip('.') for ext in allowed_extensions}
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def _chunks(self, stream: BinaryIO, content_length: int) -> Iterable[bytes]:
+        remaining = content_length
+        while remaining > 0:
+            chunk = stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                raise UploadError("Request body ended before Content-Length bytes were received")
+            remaining -= len(chunk)
+            yield chunk
+
+    def _open_part(self, raw_headers: bytes):
+        headers = {}
+        for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        disposition = _header_params(headers.get('content-disposition', ''), 'content-disposition')
+        name = disposition.get_param('name', header='content-disposition')
+        if not name:
+            raise UploadError("Multipart part is missing a Content-Disposition name")
+        filename = disposition.get_filename()
+        if filename is None:
+            return _FieldPart(name, self.max_field_size)
+
+        filename = os.path.basename(filename.replace('\\', '/'))
+        extension = os.path.splitext(filename)[1].lower().lstrip('.')
+        if self.allowed_extensions is not None and extension not in self.allowed_extensions:
+            raise UploadError(f"File type '.{extension}' is not allowed", status=415)
+        content_type = headers.get('content-type', 'application/octet-stream')
+        return _FilePart(self.upload_dir, name, filename, content_type, self.max_file_size)
+
+    def parse(self, stream: BinaryIO, boundary: bytes,
+              content_length: int) -> Tuple[Dict[str, str], List[StoredFile]]:
+        """Consume exactly ``content_length`` bytes of ``stream`` and return ``(fields, files)``.
+
+        The caller must ``store()`` or ``discard()`` every returned file.
+        """
+        delimiter = b'\r\n--' + boundary
+        # The first delimiter has no leading CRLF; prepending one lets every delimiter match alike
+        buffer = b'\r\n'
+        state = 'preamble'
+        part = None
+        fields: Dict[str, str] = {}
+        files: List[StoredFile] = []
+
+        try:
+            for chunk in self._chunks(stream, content_length):
+                buffer += chunk
+                while True:
+                    if state == 'preamble' or state == 'body':
+                        index = buffer.find(delimiter)
+                        if index < 0:
+                            # Keep enough of the tail to match a delimiter split across chunks
+                            keep = len(delimiter) - 1
+                            if part is not None and len(buffer) > keep:
+                                part.write(buffer[:-keep])
+                            buffer = buffer[-keep:] if len(buffer) > keep else buffer
+                            break
+                        if part is not None:
+                            part.write(buffer[:index])
+                            if isinstance(part, _FilePart):
+                                files.append(part.finish(self.upload_dir))
+                            else:
+                                fields[part.name] = part.value()
+                            part = None
+                        buffer = buffer[index + len(delimiter):]
+                        state = 'delimiter'
+                    if state == 'delimiter':
+                        if len(buffer) < 2:
+                            break
+                        if buffer.startswith(b'--'):
+                            state = 'epilogue'
+                        elif buffer.startswith(b'\r\n'):
+                            buffer = buffer[2:]
+                            state = 'headers'
+                        else:
+                            raise UploadError("Malformed multipart delimiter")
+                    if state == 'headers':
+                        index = buffer.find(b'\r\n\r\n')
+                        if index < 0:
+                            if len(buffer) > _MAX_PART_HEADER_BYTES:
+                                raise UploadError("Multipart part headers are too large")
+                            break
+                        part = self._open_part(buffer[:index])
+                        buffer = buffer[index + 4:]
+                        state = 'body'
+                    if state == 'epilogue':
+                        # Anything after the closing delimiter is ignored
+                        buffer = b''
+                        break
+            if state != 'epilogue':
+                raise UploadError("Multipart body is missing its closing boundary")
+        except BaseException:
+            if part is not None and isinstance(part, _FilePart):
+                part.discard()
+            # Earlier parts of a rejected upload would otherwise stay on disk with no document
+            for stored in files:
+                stored.discard()
+            raise
+
+        return fields, files